@@ -0,0 +1,171 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, update_wrapper
+from itertools import islice
+from types import MethodType
+import asyncio
+import sys
+import time
+
+from main import session, Base, BaseEntity, MarkEntity, TargetEntity
+
+# Реестр classmethod'ов сущностей, доступных асинхронно. Чтения выполняются параллельно в пуле чтения,
+# записи (включая очистку сессий и операции очереди РЛИ) - по очереди в единственном потоке записи.
+# Методы, которых нет в реестре (query_* и служебные), асинхронно не доступны
+READ_METHODS = frozenset([
+    'get_by_id', 'get_cached', 'get_all_cached', 'get_all_sessions', 'get_all_marks', 'get_all_regions',
+    'get_file_signatures', 'get_rli_by_session_id', 'get_queue_stats', 'get_linked_rli_by_session_id',
+    'get_linked_rli_containing_point', 'get_linked_rli_intersecting_box', 'get_raster_rli_containing_point',
+    'get_raster_rli_intersecting_box', 'get_marks_by_session_id', 'get_marks_in_box', 'get_objects_by_meta',
+    'get_targets_by_session_id', 'get_targets_by_object_meta',
+])
+WRITE_METHODS = frozenset([
+    'create_type_session', 'create_type_source_rli', 'create_type_binding_method', 'create_relating_object',
+    'create_session', 'create_coordinates', 'create_extent', 'create_file', 'create_raw_rli', 'create_rli',
+    'create_raster_rli', 'create_linked_rli', 'create_mark', 'create_object', 'create_target', 'create_region',
+    'create_type_session_many', 'create_type_source_rli_many', 'create_type_binding_method_many',
+    'create_relating_object_many', 'create_session_many', 'create_coordinates_many', 'create_extent_many',
+    'create_file_many', 'create_raw_rli_many', 'create_rli_many', 'create_raster_rli_many', 'create_linked_rli_many',
+    'create_mark_many', 'create_object_many', 'create_target_many', 'create_region_many',
+    'update_type_session', 'update_type_source_rli', 'update_type_binding_method', 'update_relating_object',
+    'update_session', 'update_coordinates', 'update_extent', 'update_file', 'update_raw_rli', 'update_rli',
+    'update_raster_rli', 'update_linked_rli', 'update_mark', 'update_object', 'update_target', 'update_region',
+    'update_where', 'update_file_signatures',
+    'delete_type_session', 'delete_type_source_rli', 'delete_type_binding_method', 'delete_relating_object',
+    'delete_session', 'delete_coordinates', 'delete_extent', 'delete_file', 'delete_raw_rli', 'delete_rli',
+    'delete_raster_rli', 'delete_linked_rli', 'delete_mark', 'delete_object', 'delete_target', 'delete_region',
+    'purge_sessions', 'purge_sessions_before', 'register_files',
+    'claim_rli', 'complete_rli', 'release_rli', 'extend_rli_lease',
+])
+# Постраничные итераторы: возвращают асинхронный итератор, страницы читаются в отдельном потоке
+STREAM_METHODS = frozenset(['iter_all_sessions', 'iter_all_marks', 'iter_all_regions'])
+
+
+# Функция выполнения classmethod'а в потоке исполнителя. Сессия потока закрывается после каждого вызова:
+# возвращаемые объекты отсоединяются от нее и безопасно передаются в поток цикла событий
+def _run(method, args, kwargs):
+    try:
+        return method(*args, **kwargs)
+    finally:
+        session.remove()
+
+
+# Функция обхода итератора iter_all_* из цикла событий. Весь обход выполняет один поток со своей сессией
+# (объекты страницы отсоединяются от нее итератором), строки передаются в цикл событий пачками по page_size
+async def _stream(entity, method, args, kwargs):
+    executor = ThreadPoolExecutor(1, thread_name_prefix='rlsdb-stream')
+    loop = asyncio.get_running_loop()
+    rows = method(*args, **kwargs)
+    try:
+        while True:
+            chunk = await loop.run_in_executor(executor, partial(list, islice(rows, entity.page_size)))
+            if not chunk:
+                return
+            for row in chunk:
+                yield row
+    finally:
+        executor.submit(rows.close)
+        executor.submit(session.remove)
+        executor.shutdown(wait=False)
+
+
+# Асинхронное зеркало сущности: те же classmethod'ы с теми же аргументами, но возвращающие корутины
+# (iter_all_* - асинхронные итераторы)
+class AsyncEntity:
+    def __init__(self, entity, database):
+        self._entity = entity
+        for name in self.method_names(entity):
+            method = getattr(entity, name)
+            if name in STREAM_METHODS:
+                setattr(self, name, self._wrap_stream(entity, method))
+            else:
+                executor = database.write_executor if name in WRITE_METHODS else database.read_executor
+                setattr(self, name, self._wrap(method, executor))
+
+    @staticmethod
+    def method_names(entity):
+        return sorted(name for name in READ_METHODS | WRITE_METHODS | STREAM_METHODS
+                      if isinstance(getattr(entity, name, None), MethodType))
+
+    @staticmethod
+    def _wrap(method, executor):
+        async def call(*args, **kwargs):
+            return await asyncio.get_running_loop().run_in_executor(executor, partial(_run, method, args, kwargs))
+        return update_wrapper(call, method)
+
+    @staticmethod
+    def _wrap_stream(entity, method):
+        def call(*args, **kwargs):
+            return _stream(entity, method, args, kwargs)
+        return update_wrapper(call, method)
+
+    def __repr__(self):
+        return '<Async{}>'.format(self._entity.__name__)
+
+
+# Асинхронный фасад RLSDB: db.MarkEntity.create_mark(...), db.TargetEntity.get_targets_by_session_id(...) и т.д.
+# Чтения идут в пул из readers потоков с собственными подключениями, поэтому сотни корутин читают одновременно,
+# не блокируя цикл событий. Записи выполняет один поток, то есть они ставятся в очередь в порядке вызова
+class AsyncRLSDB:
+    def __init__(self, readers=16):
+        self.read_executor = ThreadPoolExecutor(readers, thread_name_prefix='rlsdb-read')
+        self.write_executor = ThreadPoolExecutor(1, thread_name_prefix='rlsdb-write')
+        for mapper in Base.registry.mappers:
+            entity = mapper.class_
+            if issubclass(entity, BaseEntity):
+                setattr(self, entity.__name__, AsyncEntity(entity, self))
+
+    def close(self):
+        self.read_executor.shutdown()
+        self.write_executor.shutdown()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+# Функция измерения максимальной задержки цикла событий: корутина-пульс просыпается каждые interval секунд
+async def _heartbeat(lags, interval=0.005):
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+# Сравнение clients конкурентных корутин, каждая выполняет requests чтений целей и отметок сессии:
+# через асинхронный фасад и прямыми синхронными вызовами из корутин. Для каждого пути возвращаются
+# вызовы в секунду и максимальная задержка цикла событий
+async def benchmark(session_id=1, clients=100, requests=10):
+    async def run(read_targets, read_marks):
+        async def client():
+            for _ in range(requests):
+                await read_targets(session_id, columns=['id'])
+                await read_marks(session_id)
+
+        lags = []
+        heartbeat = asyncio.ensure_future(_heartbeat(lags))
+        await asyncio.sleep(0)
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(clients)))
+        seconds = time.perf_counter() - start
+        heartbeat.cancel()
+        return {'calls_per_second': clients * requests * 2 / seconds, 'max_loop_lag': max(lags, default=seconds)}
+
+    def blocking(method):
+        async def call(*args, **kwargs):
+            return _run(method, args, kwargs)
+        return call
+
+    async with AsyncRLSDB() as db:
+        async_result = await run(db.TargetEntity.get_targets_by_session_id, db.MarkEntity.get_marks_by_session_id)
+    sync_result = await run(blocking(TargetEntity.get_targets_by_session_id),
+                            blocking(MarkEntity.get_marks_by_session_id))
+    return {'async': async_result, 'sync': sync_result}
+
+
+if __name__ == '__main__':
+    # python async_api.py [session_id] [clients] - сравнение асинхронного и синхронного доступа
+    arguments = [int(argument) for argument in sys.argv[1:3]]
+    for path, result in asyncio.run(benchmark(*arguments)).items():
+        print('{}: {calls_per_second:.1f} calls/s, max event loop lag {max_loop_lag:.3f} s'.format(path, **result))
@@ -0,0 +1,300 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import sqlalchemy
+
+from main import configure_database, init_db, session, unit_of_work, CoordinatesEntity, RLIEntity, RasterRLIEntity, \
+    LinkedRLIEntity, MarkEntity, ObjectEntity, TargetEntity, XLSReportGeneratorBySessionId, \
+    ColumnarReportExporterBySessionId
+import geodesy
+import synthetic
+
+# Объемы синтетической базы для бенчмарка (параметры synthetic.generate)
+SCALES = {
+    'small': {'sessions': 2, 'files': 500, 'marks': 5000},
+    'medium': {'sessions': 2, 'files': 5000, 'marks': 50000},
+    'large': {'sessions': 2, 'files': 50000, 'marks': 500000},
+}
+
+# Регрессия - минимальное время операции больше, чем в базовом прогоне, на эту долю и не меньше чем
+# на REGRESSION_MIN_SECONDS (разница в доли миллисекунды - шум измерения). Минимум из нескольких запусков
+# устойчивее медианы к фоновой нагрузке
+REGRESSION_THRESHOLD = 0.2
+REGRESSION_MIN_SECONDS = 0.001
+
+
+# Функция измерения времени вызова function: repeat запусков, сессия потока закрывается после каждого,
+# чтобы следующий запуск не использовал уже загруженные объекты
+def measure(function, repeat=7):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+        session.remove()
+    times.sort()
+    return {'median': times[len(times) // 2], 'min': times[0], 'repeat': repeat}
+
+
+# CRUD на координатах: создание, изменение, чтение и удаление rows строк по одной и пакетная вставка
+def benchmark_crud(rows=200):
+    results = {}
+    ids = []
+
+    def create():
+        ids.extend(CoordinatesEntity.create_coordinates(55.0 + i * 1e-4, 37.0, 0.0) for i in range(rows))
+
+    def create_many():
+        CoordinatesEntity.create_coordinates_many((55.0 + i * 1e-4, 37.0, 0.0) for i in range(rows))
+
+    def update():
+        for coordinates_id in ids[-rows:]:
+            CoordinatesEntity.update_coordinates(coordinates_id, 56.0, 38.0, 1.0)
+
+    # Каждая строка читается дважды: промах кэша и попадание
+    def get_by_id():
+        for coordinates_id in ids[-rows:] * 2:
+            CoordinatesEntity.get_by_id(coordinates_id)
+
+    def delete():
+        for coordinates_id in ids[-rows:]:
+            CoordinatesEntity.delete_coordinates(coordinates_id)
+        del ids[-rows:]
+
+    results['crud.create_coordinates'] = measure(create, 3)
+    results['crud.create_coordinates_many'] = measure(create_many, 3)
+    results['crud.update_coordinates'] = measure(update, 3)
+    results['crud.get_by_id'] = measure(get_by_id, 3)
+    results['crud.delete_coordinates'] = measure(delete, 3)
+    return results
+
+
+# Выборки по сессии и пространственные выборки вокруг первой отметки сессии
+def benchmark_getters(session_id):
+    mark = MarkEntity.query_marks_by_session_id(session_id).first()
+    point = CoordinatesEntity.get_by_id(mark.coordinates_id)
+    session.remove()
+    box = (point.latitude - 0.1, point.latitude + 0.1, point.longitude - 0.1, point.longitude + 0.1)
+    return {
+        'getters.get_rli_by_session_id': measure(lambda: RLIEntity.get_rli_by_session_id(session_id)),
+        'getters.get_linked_rli_by_session_id':
+            measure(lambda: LinkedRLIEntity.get_linked_rli_by_session_id(session_id)),
+        'getters.get_targets_by_session_id': measure(lambda: TargetEntity.get_targets_by_session_id(session_id)),
+        'getters.get_marks_by_session_id': measure(lambda: MarkEntity.get_marks_by_session_id(session_id)),
+        'getters.get_marks_in_box': measure(lambda: MarkEntity.get_marks_in_box(*box)),
+        'getters.get_raster_rli_containing_point':
+            measure(lambda: RasterRLIEntity.get_raster_rli_containing_point(point.latitude, point.longitude)),
+    }
+
+
+# Отчеты по сессии: XLS и CSV во временный каталог
+def benchmark_reports(session_id, output_dir):
+    return {
+        'reports.xls': measure(lambda: XLSReportGeneratorBySessionId(session_id, output_dir=output_dir), 3),
+        'reports.csv': measure(lambda: ColumnarReportExporterBySessionId(session_id, output_dir=output_dir), 3),
+    }
+
+
+# Выборки объектов по meta (только id): по индексу генерируемых колонок и теми же условиями через json_extract
+META_QUERIES = {
+    'class': {'class': 'c3'},
+    'speed_range': {'speed': ('between', (100, 101))},
+    'class_and_speed': {'class': 'c3', 'speed': ('>=', 299)},
+}
+
+
+# Функция измерения выборок META_QUERIES на временной базе из objects объектов с синтетическим meta
+def benchmark_meta(objects=1000000, seed=0, repeat=5):
+    rnd = random.Random(seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        configure_database('sqlite:///' + os.path.join(directory, 'benchmark.db'))
+        try:
+            init_db()
+            for start in range(0, objects, synthetic.CHUNK_SIZE * 10):
+                ObjectEntity.create_object_many((None, 'Object {}'.format(start + i), None, None,
+                                                 synthetic.object_meta(rnd))
+                                                for i in range(min(synthetic.CHUNK_SIZE * 10, objects - start)))
+            for name, filters in META_QUERIES.items():
+                for indexed in (True, False):
+                    query = ObjectEntity.query_objects_by_meta(filters, ['id'], indexed)
+                    result = measure(lambda: query.with_session(session()).all(), repeat)
+                    result['rows'] = query.with_session(session()).count()
+                    results['meta.{}.{}'.format(name, 'indexed' if indexed else 'json_extract')] = result
+        finally:
+            session.remove()
+            configure_database()
+    return results
+
+
+# Функция измерения масштабирования параллельного чтения: на временной базе масштаба scale reads чтений отметок
+# сессии выполняются пулами из threads потоков. Возвращает {число потоков: {'reads_per_second', 'seconds'}}
+def benchmark_readers(threads=(1, 2, 4, 8), reads=200, scale='small', seed=0):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        configure_database('sqlite:///' + os.path.join(directory, 'benchmark.db'))
+        try:
+            session_id = synthetic.generate(seed=seed, **SCALES[scale])['session_ids'][0]
+
+            def read_marks(_):
+                with unit_of_work():
+                    return len(MarkEntity.get_marks_by_session_id(session_id))
+
+            for count in threads:
+                start = time.perf_counter()
+                with ThreadPoolExecutor(count, thread_name_prefix='rlsdb-reader') as executor:
+                    list(executor.map(read_marks, range(reads)))
+                seconds = time.perf_counter() - start
+                results[count] = {'reads_per_second': reads / seconds, 'seconds': seconds}
+        finally:
+            session.remove()
+            configure_database()
+    return results
+
+
+# Функция расчета расстояния по большому кругу между двумя точками на чистом Python, м
+def _python_haversine(latitude1, longitude1, latitude2, longitude2):
+    latitude1, longitude1, latitude2, longitude2 = map(math.radians, (latitude1, longitude1, latitude2, longitude2))
+    a = math.sin((latitude2 - latitude1) / 2) ** 2 + \
+        math.cos(latitude1) * math.cos(latitude2) * math.sin((longitude2 - longitude1) / 2) ** 2
+    return 2 * geodesy.EARTH_RADIUS * math.asin(math.sqrt(min(max(a, 0), 1)))
+
+
+# Функция сравнения geodesy с расчетом по объектам ORM на временной базе из marks синтетических отметок:
+# расстояния от точки до всех отметок сессии (с загрузкой) и ближайшая из первых targets отметок для каждой
+# отметки (по загруженным координатам). Расчет по объектам медленный, поэтому выполняется slow_repeat раз
+def benchmark_geodesy(marks=100000, targets=100, seed=0, repeat=5, slow_repeat=1):
+    rnd = random.Random(seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        configure_database('sqlite:///' + os.path.join(directory, 'benchmark.db'))
+        try:
+            session_id = synthetic.generate(files=10, marks=marks, regions=0, seed=seed)['session_ids'][0]
+            latitude, longitude = rnd.uniform(-60, 60), rnd.uniform(-170, 170)
+
+            def per_object_distances():
+                return [_python_haversine(latitude, longitude, mark.coordinates.latitude, mark.coordinates.longitude)
+                        for mark in MarkEntity.get_marks_by_session_id(session_id)]
+
+            def numpy_distances():
+                points = geodesy.load_marks(session_id)
+                return geodesy.haversine(latitude, longitude, points.latitude, points.longitude)
+
+            points = geodesy.load_marks(session_id)
+            target_points = geodesy.Points(*(values[:targets] for values in points))
+            rows = list(zip(points.latitude.tolist(), points.longitude.tolist()))
+            target_rows = rows[:targets]
+
+            def per_row_nearest():
+                return [min(range(len(target_rows)), key=lambda index: _python_haversine(
+                    row[0], row[1], target_rows[index][0], target_rows[index][1])) for row in rows]
+
+            results['geodesy.distances.per_object'] = measure(per_object_distances, slow_repeat)
+            results['geodesy.distances.numpy'] = measure(numpy_distances, repeat)
+            results['geodesy.nearest.per_row'] = measure(per_row_nearest, slow_repeat)
+            results['geodesy.nearest.numpy'] = measure(lambda: geodesy.nearest_neighbours(points, target_points),
+                                                       repeat)
+        finally:
+            session.remove()
+            configure_database()
+    return results
+
+
+# Функция сравнения прогона с базовым: каждой операции из обоих прогонов добавляется отношение минимальных
+# времен ratio и флаг regression. Возвращает имена операций с регрессией
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None or not base['min']:
+            continue
+        result['ratio'] = result['min'] / base['min']
+        result['regression'] = result['ratio'] > 1 + threshold and \
+            result['min'] - base['min'] > REGRESSION_MIN_SECONDS
+        if result['regression']:
+            regressions.append(name)
+    return regressions
+
+
+# Функция запуска бенчмарка на новой синтетической базе масштаба scale во временном каталоге.
+# baseline - результат предыдущего run (словарь из JSON-файла) для поиска регрессий
+def run(scale='small', seed=0, baseline=None, threshold=REGRESSION_THRESHOLD):
+    with tempfile.TemporaryDirectory() as directory:
+        configure_database('sqlite:///' + os.path.join(directory, 'benchmark.db'))
+        try:
+            generated = synthetic.generate(seed=seed, **SCALES[scale])
+            session_id = generated['session_ids'][0]
+            results = {'generate': {'median': generated['seconds'], 'min': generated['seconds'], 'repeat': 1}}
+            results.update(benchmark_crud())
+            results.update(benchmark_getters(session_id))
+            results.update(benchmark_reports(session_id, directory))
+        finally:
+            configure_database()
+
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'scale': scale,
+        'parameters': dict(SCALES[scale], seed=seed),
+        'counts': generated['counts'],
+        'environment': {'python': platform.python_version(), 'sqlalchemy': sqlalchemy.__version__,
+                        'sqlite': sqlite3.sqlite_version, 'machine': platform.machine(), 'cpus': os.cpu_count()},
+        'results': results,
+        'regressions': [],
+    }
+    if baseline is not None:
+        if baseline.get('scale') != scale:
+            raise ValueError('Baseline scale {!r} does not match {!r}'.format(baseline.get('scale'), scale))
+        report['regressions'] = compare(results, baseline['results'], threshold)
+    return report
+
+
+if __name__ == '__main__':
+    # python benchmark.py meta [objects] - выборки по meta с индексом и без на временной базе
+    if sys.argv[1:2] == ['meta']:
+        for operation, measurement in benchmark_meta(*[int(argument) for argument in sys.argv[2:3]]).items():
+            print('{:40} {:8} rows, min {:9.4f} s'.format(operation, measurement['rows'], measurement['min']))
+        sys.exit(0)
+
+    # python benchmark.py readers [reads] [scale] - чтения отметок сессии пулами из 1, 2, 4 и 8 потоков
+    if sys.argv[1:2] == ['readers']:
+        reader_reads = int(sys.argv[2]) if sys.argv[2:] else 200
+        reader_scale = sys.argv[3] if sys.argv[3:] else 'small'
+        for thread_count, measurement in benchmark_readers(reads=reader_reads, scale=reader_scale).items():
+            print('{} threads: {reads_per_second:.1f} reads/s ({seconds:.2f} s)'.format(thread_count, **measurement))
+        sys.exit(0)
+
+    # python benchmark.py geodesy [marks] [targets] - geodesy против расчета по объектам и строкам на Python
+    if sys.argv[1:2] == ['geodesy']:
+        for operation, measurement in benchmark_geodesy(*[int(argument) for argument in sys.argv[2:4]]).items():
+            print('{:35} min {:9.4f} s'.format(operation, measurement['min']))
+        sys.exit(0)
+
+    # python benchmark.py [scale] [output.json] [baseline.json] - прогон на синтетической базе, результат в JSON.
+    # С базовым прогоном выводит отношения минимальных времен и завершается с кодом 1 при регрессиях
+    scale_name = sys.argv[1] if sys.argv[1:] else 'small'
+    output_path = sys.argv[2] if sys.argv[2:] else 'benchmark_{}.json'.format(scale_name)
+    baseline_report = None
+    if sys.argv[3:]:
+        with open(sys.argv[3], encoding='utf-8') as baseline_file:
+            baseline_report = json.load(baseline_file)
+
+    benchmark_report = run(scale_name, baseline=baseline_report)
+    with open(output_path, 'w', encoding='utf-8') as output_file:
+        json.dump(benchmark_report, output_file, indent=2)
+
+    for operation, measurement in benchmark_report['results'].items():
+        line = '{:45} median {:9.4f} s, min {:9.4f} s'.format(operation, measurement['median'], measurement['min'])
+        if 'ratio' in measurement:
+            line += '  x{:.2f}{}'.format(measurement['ratio'], '  REGRESSION' if measurement['regression'] else '')
+        print(line)
+    print('Results saved to {}'.format(output_path))
+    sys.exit(1 if benchmark_report['regressions'] else 0)
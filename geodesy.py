@@ -0,0 +1,112 @@
+from collections import namedtuple
+from itertools import chain
+import json
+
+import numpy as np
+from sqlalchemy import func, select
+
+from main import session, BaseEntity, CoordinatesEntity, MarkEntity
+
+# Средний радиус Земли и параметры эллипсоида WGS-84, м
+EARTH_RADIUS = 6371008.8
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_E2 = WGS84_F * (2 - WGS84_F)
+
+# Набор точек в виде массивов: ids - идентификаторы (отметок или координат), широта/долгота в градусах, высота в м
+Points = namedtuple('Points', ['ids', 'latitude', 'longitude', 'altitude'])
+
+
+# Функция преобразования строк запроса (id, latitude, longitude, altitude) в массивы.
+# np.fromiter по плоской последовательности на порядки быстрее np.array по списку строк
+def _points_from_rows(rows):
+    data = np.fromiter(chain.from_iterable(rows), dtype=float, count=len(rows) * 4).reshape(-1, 4)
+    return Points(data[:, 0].astype(np.int64), data[:, 1], data[:, 2], data[:, 3])
+
+
+# Функция загрузки координат по набору id одним запросом. Идентификаторы передаются одним JSON-параметром,
+# поэтому размер набора не ограничен числом параметров SQLite
+def load_coordinates(coordinates_ids):
+    ids = func.json_each(json.dumps([int(coordinates_id) for coordinates_id in coordinates_ids])).\
+        table_valued('value')
+    statement = select(CoordinatesEntity.id, CoordinatesEntity.latitude, CoordinatesEntity.longitude,
+                       func.coalesce(CoordinatesEntity.altitude, 0)).\
+        where(CoordinatesEntity.id.in_(select(ids.c.value))).\
+        order_by(CoordinatesEntity.id)
+    with BaseEntity.mutex.read_lock():
+        return _points_from_rows(session.execute(statement).all())
+
+
+# Функция загрузки координат отметок сессии (или всех отметок) одним запросом, ids - идентификаторы отметок
+def load_marks(session_id=None):
+    statement = select(MarkEntity.id, CoordinatesEntity.latitude, CoordinatesEntity.longitude,
+                       func.coalesce(CoordinatesEntity.altitude, 0)).\
+        join(CoordinatesEntity, CoordinatesEntity.id == MarkEntity.coordinates_id).\
+        order_by(MarkEntity.id)
+    if session_id is not None:
+        statement = statement.where(MarkEntity.session_id == session_id)
+    with BaseEntity.mutex.read_lock():
+        return _points_from_rows(session.execute(statement).all())
+
+
+# Функция расчета расстояний по большому кругу (гаверсинус), м. Аргументы - массивы градусов,
+# приводятся по правилам broadcasting NumPy: пары точек или точка против набора
+def haversine(latitude1, longitude1, latitude2, longitude2):
+    latitude1, longitude1, latitude2, longitude2 = map(np.radians, (latitude1, longitude1, latitude2, longitude2))
+    a = np.sin((latitude2 - latitude1) / 2) ** 2 + \
+        np.cos(latitude1) * np.cos(latitude2) * np.sin((longitude2 - longitude1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+# Функция перевода геодезических координат WGS-84 в геоцентрические (ECEF), массив (N, 3) в м
+def to_ecef(latitude, longitude, altitude=0.0):
+    latitude, longitude = np.radians(latitude), np.radians(longitude)
+    altitude = np.asarray(altitude, dtype=float)
+    sin_latitude = np.sin(latitude)
+    n = WGS84_A / np.sqrt(1 - WGS84_E2 * sin_latitude ** 2)
+    x = (n + altitude) * np.cos(latitude) * np.cos(longitude)
+    y = (n + altitude) * np.cos(latitude) * np.sin(longitude)
+    z = (n * (1 - WGS84_E2) + altitude) * sin_latitude
+    return np.stack(np.broadcast_arrays(x, y, z), axis=-1)
+
+
+# Функция расчета прямых (хордовых) расстояний в ECEF с учетом высоты, м
+def ecef_distance(latitude1, longitude1, altitude1, latitude2, longitude2, altitude2):
+    return np.linalg.norm(to_ecef(latitude1, longitude1, altitude1) - to_ecef(latitude2, longitude2, altitude2),
+                          axis=-1)
+
+
+# Функция перевода градусов в единичные векторы на сфере, массив (N, 3)
+def _unit_vectors(latitude, longitude):
+    latitude, longitude = np.radians(latitude), np.radians(longitude)
+    return np.stack((np.cos(latitude) * np.cos(longitude), np.cos(latitude) * np.sin(longitude),
+                     np.sin(latitude)), axis=-1)
+
+
+# Функция поиска ближайшей точки набора points_b для каждой точки набора points_a.
+# Ближайшая по дуге точка - это максимум скалярного произведения единичных векторов, поэтому поиск сводится
+# к матричному умножению блоками по chunk_size строк (память - chunk_size x len(points_b)).
+# Возвращает (индексы в points_b, расстояния в м); для пустого points_a - пустые массивы
+def nearest_neighbours(points_a, points_b, chunk_size=1024):
+    if len(points_a.latitude) and not len(points_b.latitude):
+        raise ValueError('Cannot find nearest neighbours in an empty point set')
+    vectors_a = _unit_vectors(points_a.latitude, points_a.longitude)
+    vectors_b = _unit_vectors(points_b.latitude, points_b.longitude)
+    indices = np.empty(len(vectors_a), dtype=np.int64)
+    for start in range(0, len(vectors_a), chunk_size):
+        indices[start:start + chunk_size] = np.argmax(vectors_a[start:start + chunk_size] @ vectors_b.T, axis=1)
+    distances = haversine(points_a.latitude, points_a.longitude,
+                          points_b.latitude[indices], points_b.longitude[indices])
+    return indices, distances
+
+
+# Функция поиска k ближайших к точке отметок сессии (или отметок из готового набора points).
+# Возвращает (идентификаторы отметок, расстояния в м) по возрастанию расстояния
+def k_nearest_marks(latitude, longitude, k, session_id=None, points=None):
+    if points is None:
+        points = load_marks(session_id)
+    distances = haversine(latitude, longitude, points.latitude, points.longitude)
+    k = min(k, len(distances))
+    nearest = np.argpartition(distances, k - 1)[:k] if k else np.empty(0, dtype=np.int64)
+    nearest = nearest[np.argsort(distances[nearest])]
+    return points.ids[nearest], distances[nearest]
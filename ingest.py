@@ -0,0 +1,112 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import os
+import sys
+import time
+
+from main import init_db, SessionEntity, FileEntity
+
+# Число файлов, опрашиваемых (stat) одной задачей пула, и число файлов, регистрируемых одной транзакцией
+STAT_CHUNK_SIZE = 1000
+REGISTER_CHUNK_SIZE = 10000
+
+
+# Функция чтения одного каталога: пути файлов и подкаталогов (символьные ссылки на каталоги не обходятся)
+def _list_directory(directory):
+    files, subdirectories = [], []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+            elif entry.is_file():
+                files.append(entry.path)
+    return files, subdirectories
+
+
+# Функция опроса пачки файлов: (путь, размер, st_mtime_ns), файлы, удаленные во время обхода, пропускаются
+def _stat_files(paths):
+    signatures = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        signatures.append((path, stat.st_size, stat.st_mtime_ns))
+    return signatures
+
+
+# Функция параллельного обхода каталога: подкаталоги читаются, а файлы опрашиваются пачками по STAT_CHUNK_SIZE
+# в потоках пула (системные вызовы отпускают GIL). Возвращает список (путь, размер, st_mtime_ns)
+def scan_directory(directory, workers=8):
+    signatures = []
+    with ThreadPoolExecutor(workers) as executor:
+        pending = {executor.submit(_list_directory, directory)}
+        stats = []
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirectories = future.result()
+                pending.update(executor.submit(_list_directory, subdirectory) for subdirectory in subdirectories)
+                stats.extend(executor.submit(_stat_files, files[start:start + STAT_CHUNK_SIZE])
+                             for start in range(0, len(files), STAT_CHUNK_SIZE))
+        for future in stats:
+            signatures.extend(future.result())
+    return signatures
+
+
+# Функция получения имени и расширения файла из пути: /data/a/scan_01.rli -> ('scan_01', 'rli')
+def split_file_name(path):
+    name, extension = os.path.splitext(os.path.basename(path))
+    return name, extension[1:] or None
+
+
+# Функция инкрементальной загрузки каталога сессии (по умолчанию SessionEntity.path_to_directory).
+# Файл считается учтенным, если в сессии есть строка с тем же путем, размером и временем изменения.
+# Новые и измененные файлы регистрируются пачками: строки file и raw_rli с источником type_source_rli_id.
+# Строкам, созданным до появления размера и времени изменения, они дописываются без повторной регистрации.
+# extensions - регистрировать только файлы с этими расширениями (без точки).
+# Возвращает число просмотренных, зарегистрированных, дополненных и неизмененных файлов и время загрузки
+def ingest_directory(session_id, type_source_rli_id, directory=None, extensions=None, workers=8):
+    start = time.perf_counter()
+    if directory is None:
+        session_row = SessionEntity.get_by_id(session_id)
+        if session_row is None:
+            raise ValueError('Session {} does not exist'.format(session_id))
+        directory = session_row.path_to_directory
+    directory = os.path.abspath(directory)
+
+    scanned = scan_directory(directory, workers)
+    if extensions is not None:
+        extensions = {extension.lower() for extension in extensions}
+        scanned = [signature for signature in scanned
+                   if (split_file_name(signature[0])[1] or '').lower() in extensions]
+    known = FileEntity.get_file_signatures(session_id)
+
+    new, backfill = [], []
+    for path, size, mtime_ns in scanned:
+        row = known.get(path)
+        if row is None:
+            new.append((path, size, mtime_ns))
+        elif row.size is None:
+            backfill.append((row.id, size, mtime_ns))
+        elif (row.size, row.mtime_ns) != (size, mtime_ns):
+            new.append((path, size, mtime_ns))
+
+    FileEntity.update_file_signatures(backfill)
+    new.sort()
+    registered = 0
+    for chunk_start in range(0, len(new), REGISTER_CHUNK_SIZE):
+        files = []
+        for path, size, mtime_ns in new[chunk_start:chunk_start + REGISTER_CHUNK_SIZE]:
+            name, extension = split_file_name(path)
+            files.append((name, path, extension, size, mtime_ns))
+        registered += len(FileEntity.register_files(session_id, files, type_source_rli_id))
+    return {'scanned': len(scanned), 'registered': registered, 'updated': len(backfill),
+            'unchanged': len(scanned) - registered - len(backfill), 'seconds': time.perf_counter() - start}
+
+
+if __name__ == '__main__':
+    # python ingest.py session_id type_source_rli_id [directory] - загрузить новые файлы каталога сессии
+    init_db()
+    result = ingest_directory(int(sys.argv[1]), int(sys.argv[2]), sys.argv[3] if sys.argv[3:] else None)
+    print('{scanned} files scanned, {registered} registered, {updated} updated, {unchanged} unchanged '
+          'in {seconds:.2f} s'.format(**result))
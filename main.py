@@ -1,31 +1,573 @@
-from sqlalchemy import create_engine, Boolean, JSON, TIMESTAMP, Column, Integer, String, Float, ForeignKey
+from sqlalchemy import create_engine, event, func, inspect, insert, update, select, text, literal_column, cast, \
+    and_, or_, false, Boolean, JSON, TIMESTAMP, Column, Integer, String, Float, ForeignKey, Index, MetaData, Table
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import sessionmaker, relationship, scoped_session, aliased
+from contextlib import contextmanager
 import threading
-from datetime import datetime
+from collections import OrderedDict
+from datetime import datetime, timedelta
 import os
+import re
+import sys
+import json
+import csv
+import time
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat, islice
 import xlwt
 
-# Создание подключения к базе данных
-engine = create_engine('sqlite:///RLSDB.db')
-
-SessionDB = sessionmaker(bind=engine)
-session = SessionDB()
+# Профили хранения SQLite: прагмы, которые выполняются на каждом новом подключении.
+# default - настройки SQLite по умолчанию (журнал отката), остальные используют WAL, в котором читатели
+# не блокируются писателем (режим WAL сохраняется в файле базы и после возврата к default).
+# Внешние ключи не включаются ни в одном профиле: профиль не должен менять то, что удаляют delete_*
+# (с ними удаление строки справочника каскадно удалило бы все ссылающиеся на нее сессии и РЛИ), а данные
+# существующих баз не проходят PRAGMA foreign_key_check. Зависимые строки удаляет purge_sessions явно
+# wal_autocheckpoint - размер WAL в страницах, после которого выполняется контрольная
+# точка, journal_size_limit - размер, до которого WAL усекается после нее. cache_size < 0 - размер кэша в КиБ
+STORAGE_PROFILES = {
+    'default': {},
+    # Массовая загрузка: редкие контрольные точки, fsync только при контрольной точке, большой кэш
+    'ingest-heavy': {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'wal_autocheckpoint': 10000,
+                     'journal_size_limit': 67108864, 'cache_size': -262144, 'mmap_size': 268435456,
+                     'temp_store': 'MEMORY', 'busy_timeout': 30000},
+    # Чтение отчетов и выборок: отображение файла в память, частые контрольные точки держат WAL коротким
+    'read-heavy': {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'wal_autocheckpoint': 1000,
+                   'journal_size_limit': 16777216, 'cache_size': -131072, 'mmap_size': 1073741824,
+                   'temp_store': 'MEMORY', 'busy_timeout': 10000},
+    # Надежность: fsync на каждой фиксации, транзакция не теряется при отключении питания
+    'durable': {'journal_mode': 'WAL', 'synchronous': 'FULL', 'wal_autocheckpoint': 1000,
+                'journal_size_limit': 16777216, 'cache_size': -16384, 'mmap_size': 0,
+                'busy_timeout': 30000},
+}
+
+# Профиль хранения основного подключения, выбирается переменной окружения RLSDB_STORAGE_PROFILE
+storage_profile = os.environ.get('RLSDB_STORAGE_PROFILE', 'default')
+if storage_profile not in STORAGE_PROFILES:
+    raise ValueError('Unknown storage profile {!r}, expected one of: {}'.format(
+        storage_profile, ', '.join(STORAGE_PROFILES)))
+
+
+# Функция применения прагм профиля к подключению DB-API
+def apply_storage_profile(dbapi_connection, profile):
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma, value in STORAGE_PROFILES[profile].items():
+            cursor.execute('PRAGMA {} = {}'.format(pragma, value))
+    finally:
+        cursor.close()
+
+
+# Обработчик подключения основного движка: применяет текущий профиль хранения
+def _on_connect(dbapi_connection, connection_record):
+    apply_storage_profile(dbapi_connection, storage_profile)
+
+
+# Функция смены профиля хранения основного подключения. Открытые подключения пула закрываются,
+# новые получают прагмы нового профиля
+def use_storage_profile(profile):
+    global storage_profile
+    if profile not in STORAGE_PROFILES:
+        raise ValueError('Unknown storage profile {!r}'.format(profile))
+    session.remove()
+    if _engine is not None:
+        _engine.dispose()
+    storage_profile = profile
+
+
+# Функция выполнения контрольной точки WAL (PASSIVE, FULL, RESTART или TRUNCATE).
+# Возвращает (busy, страниц в WAL, страниц перенесено в базу)
+def wal_checkpoint(mode='PASSIVE'):
+    with get_engine().begin() as connection:
+        return tuple(connection.execute(text('PRAGMA wal_checkpoint({})'.format(mode))).one())
+
+
+# Функция включения постепенного освобождения места (auto_vacuum = INCREMENTAL). Режим сохраняется в файле базы,
+# но для существующей базы вступает в силу только после полного VACUUM, который выполняется здесь один раз
+# и перезаписывает весь файл. Возвращает True, если режим был изменен
+def enable_incremental_vacuum():
+    with BaseEntity.mutex:
+        session.remove()
+        with get_engine().connect() as connection:
+            connection = connection.execution_options(isolation_level='AUTOCOMMIT')
+            if connection.exec_driver_sql('PRAGMA auto_vacuum').scalar() == 2:
+                return False
+            connection.exec_driver_sql('PRAGMA auto_vacuum = INCREMENTAL')
+            connection.exec_driver_sql('VACUUM')
+            return True
+
+
+# Функция возврата свободных страниц базы в файловую систему (PRAGMA incremental_vacuum) шагами по step страниц,
+# каждый шаг - отдельная короткая транзакция. Без auto_vacuum = INCREMENTAL ничего не делает.
+# Возвращает число освобожденных страниц
+def reclaim_space(step=1000):
+    freed = 0
+    while True:
+        with BaseEntity.mutex:
+            with get_engine().begin() as connection:
+                if connection.exec_driver_sql('PRAGMA auto_vacuum').scalar() != 2:
+                    return freed
+                before = connection.exec_driver_sql('PRAGMA freelist_count').scalar()
+                if not before:
+                    return freed
+                connection.exec_driver_sql('PRAGMA incremental_vacuum({})'.format(step))
+                freed += before - connection.exec_driver_sql('PRAGMA freelist_count').scalar()
+
+
+# URL базы данных по умолчанию, переопределяется переменной окружения RLSDB_URL или функцией configure_database
+DEFAULT_DATABASE_URL = 'sqlite:///RLSDB.db'
+
+# Подключение к базе данных создается при первом обращении к ней, а не при импорте модуля
+_engine = None
+_engine_url = None
+_engine_options = {}
+_engine_lock = threading.Lock()
+
+
+# Функция получения подключения к базе данных, при первом вызове создает его
+def get_engine(check_schema=True):
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                new_engine = create_engine(_engine_url or os.environ.get('RLSDB_URL', DEFAULT_DATABASE_URL),
+                                           **_engine_options)
+                # Прагмы профилей хранения применимы только к SQLite
+                if new_engine.dialect.name == 'sqlite':
+                    event.listen(new_engine, 'connect', _on_connect)
+                # Профилирование SQL (модуль sql_profile) включается переменной окружения RLSDB_SQL_PROFILE
+                if os.environ.get('RLSDB_SQL_PROFILE'):
+                    import sql_profile
+                    sql_profile.enable_from_environment()
+                # База, созданная до появления новых колонок моделей, при открытии не изменяется: подключение
+                # отклоняется с перечнем колонок, их добавляет python main.py migrate (init_db, migrate_columns)
+                if check_schema:
+                    with new_engine.connect() as connection:
+                        missing = missing_columns(connection)
+                    if missing:
+                        new_engine.dispose()
+                        raise RuntimeError('Database is missing columns {}, run "python main.py migrate" to add '
+                                           'them'.format(', '.join('{}.{}'.format(table, column.name)
+                                                                   for table, column in missing)))
+                _engine = new_engine
+    return _engine
+
+
+# Функция настройки подключения: URL базы и параметры create_engine. Открытое подключение закрывается
+# и кэши сущностей очищаются, следующее обращение к базе создаст новое подключение с этими настройками
+def configure_database(url=None, **options):
+    global _engine, _engine_url, _engine_options
+    with _engine_lock:
+        session.remove()
+        if _engine is not None:
+            _engine.dispose()
+        _engine, _engine_url, _engine_options = None, url, options
+    for mapper in Base.registry.mappers:
+        mapper.class_._invalidate(None)
+    ObjectEntity._table_columns = None
+
+
+# Атрибут модуля engine вычисляется при обращении: main.engine - то же, что main.get_engine()
+def __getattr__(name):
+    if name == 'engine':
+        return get_engine()
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+# Функция создания сессии, привязанной к текущему подключению
+def _create_session():
+    return SessionDB(bind=get_engine())
+
+
+# Каждый поток получает собственную сессию (и подключение из пула)
+SessionDB = sessionmaker()
+session = scoped_session(_create_session)
 
 Base = declarative_base()
 
 
+# Единица работы: фиксирует изменения и возвращает подключение потока в пул
+@contextmanager
+def unit_of_work():
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.remove()
+
+
+# Блокировка читатель/писатель: чтения выполняются параллельно, запись - монопольно.
+# Ожидающий писатель не пропускает новых читателей, повторный вход в блокировку тем же потоком допускается.
+# Повышение чтения до записи запрещено: два потока, ожидающие повышения, ждали бы друг друга бесконечно
+class ReadWriteLock:
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._writer_depth = 0
+        self._waiting_writers = 0
+        self._local = threading.local()
+
+    def _read_depth(self):
+        return getattr(self._local, 'depth', 0)
+
+    @contextmanager
+    def read_lock(self):
+        me = threading.get_ident()
+        with self._condition:
+            if self._writer != me and not self._read_depth():
+                while self._writer is not None or self._waiting_writers:
+                    self._condition.wait()
+            self._readers += 1
+            self._local.depth = self._read_depth() + 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                self._local.depth -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        with self._condition:
+            if self._writer == me:
+                self._writer_depth += 1
+                return
+            if self._read_depth():
+                raise RuntimeError('Cannot acquire the write lock while holding the read lock')
+            self._waiting_writers += 1
+            while self._writer is not None or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writer = me
+            self._writer_depth = 1
+
+    def release_write(self):
+        with self._condition:
+            self._writer_depth -= 1
+            if not self._writer_depth:
+                self._writer = None
+                self._condition.notify_all()
+
+    @contextmanager
+    def write_lock(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+    def __enter__(self):
+        self.acquire_write()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release_write()
+
+
+# LRU-кэш строк по первичному ключу с ограничением размера и временем жизни записей (ttl, секунды; None - без
+# ограничения). Хранит неизменяемые Row, не привязанные к сессии. Записи сбрасываются при изменении строк (write-through
+# инвалидация из update_*/delete_*); загрузка, пересекшаяся с изменением, в кэш не попадает
+class IdentityCache:
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, entity_id, load):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(entity_id)
+            if entry is not None and (entry[0] is None or entry[0] > now):
+                self._entries.move_to_end(entity_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+        row = load(entity_id)
+        if row is not None and self.maxsize:
+            with self._lock:
+                if generation == self._generation:
+                    self._entries[entity_id] = (now + self.ttl if self.ttl is not None else None, row)
+                    self._entries.move_to_end(entity_id)
+                    while len(self._entries) > self.maxsize:
+                        self._entries.popitem(last=False)
+                        self.evictions += 1
+        return row
+
+    def invalidate(self, ids=None):
+        with self._lock:
+            self._generation += 1
+            if ids is None:
+                self._entries.clear()
+            else:
+                for entity_id in ids:
+                    self._entries.pop(entity_id, None)
+
+    def stats(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            hits, misses = self.hits, self.misses
+        # Оценка памяти: записи, строки и их значения (без разделяемых объектов интерпретатора)
+        memory = sum(sys.getsizeof(entry) + sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+                     for entry in entries for row in (entry[1],))
+        return {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+                'evictions': self.evictions, 'size': len(entries), 'maxsize': self.maxsize, 'memory_bytes': memory}
+
+
+# Значение по умолчанию параметров, которые не изменяются, если не переданы (None у них имеет свой смысл)
+_KEEP = object()
+
+
 class BaseEntity(Base):
     __abstract__ = True
+
+    # Параметры кэша get_by_id, переопределяются в сущностях или через configure_identity_cache
+    identity_cache_size = 1024
+    identity_cache_ttl = 60
+    # Размер страницы постраничных итераторов iter_all_*
+    page_size = 1000
     id = Column(Integer, nullable=False, unique=True, primary_key=True, autoincrement=True)
 
-    mutex = threading.Lock()
+    # Общая для всех сущностей блокировка: `with cls.mutex` - запись, `cls.mutex.read_lock()` - чтение
+    mutex = ReadWriteLock()
 
     def __repr__(self):
         return "<{0.__class__.__name__}(id={0.id!r})>".format(self)
 
+    # Функция для пакетной вставки строк (словарей значений колонок) одной транзакцией.
+    # INSERT ... VALUES (...), (...) ... RETURNING выполняется пачками, id возвращаются в порядке строк
+    @classmethod
+    def _bulk_insert(cls, rows):
+        rows = list(rows)
+        if not rows:
+            return []
+        with cls.mutex:
+            ids = cls._insert_rows(rows)
+            session.commit()
+            cls._invalidate(ids)
+            return ids
+
+    # Функция вставки строк в текущую транзакцию (без блокировки и фиксации), возвращает id в порядке строк.
+    # sort_by_parameter_order в SQLite вставляет по одной строке за запрос, поэтому id не сопоставляются
+    # со строками, а сортируются. Это верно при условиях, которые выполняются для всех вызовов:
+    # - строки не задают id, и SQLite выдает каждой новой строке rowid = max(rowid) + 1 в порядке VALUES
+    #   (таблицы без AUTOINCREMENT; при max(rowid) = 2^63 - 1 rowid стали бы случайными);
+    # - пачки одного вызова выполняются по очереди в одной транзакции под блокировкой записи, поэтому
+    #   чужие строки между ними не вставляются.
+    # RETURNING многострочного VALUES в SQLite 3.40 отдает id типа REAL, если в строках есть значения float
+    # (VALUES (1.5), (2.5) RETURNING id -> 1.0, 2.0), поэтому id приводятся к целому в самом запросе
+    @classmethod
+    def _insert_rows(cls, rows):
+        result = session.execute(insert(cls).returning(cast(cls.id, Integer).label('id')), rows)
+        return sorted(result.scalars())
+
+    # Функция сброса кэшей сущности после изменения строк с указанными id (None - всех строк)
+    @classmethod
+    def _invalidate(cls, ids):
+        cls.identity_cache().invalidate(ids)
+
+    @classmethod
+    def identity_cache(cls):
+        if '_identity_cache' not in cls.__dict__:
+            cls._identity_cache = IdentityCache(cls.identity_cache_size, cls.identity_cache_ttl)
+        return cls._identity_cache
+
+    # Функция изменения размера и времени жизни кэша get_by_id сущности (кэш очищается). Не переданные
+    # параметры сохраняются, ttl=None отключает устаревание записей
+    @classmethod
+    def configure_identity_cache(cls, maxsize=None, ttl=_KEEP):
+        cls.identity_cache_size = maxsize if maxsize is not None else cls.identity_cache_size
+        cls.identity_cache_ttl = ttl if ttl is not _KEEP else cls.identity_cache_ttl
+        cls._identity_cache = IdentityCache(cls.identity_cache_size, cls.identity_cache_ttl)
+
+    # Функция получения строки сущности по id через LRU-кэш. Возвращает неизменяемую Row с колонками таблицы
+    # (не объект сессии), либо None, если строки нет
+    @classmethod
+    def get_by_id(cls, entity_id):
+        return cls.identity_cache().get(entity_id, cls._load_row)
+
+    @classmethod
+    def _load_row(cls, entity_id):
+        with cls.mutex.read_lock():
+            return session.query(*cls.__table__.columns).filter(cls.id == entity_id).first()
+
+    # Генератор всех объектов сущности по возрастанию id, страницами по page_size: каждая страница выбирается
+    # по ключу (id > последний id страницы LIMIT page_size), а не через OFFSET, поэтому стоимость страницы
+    # не растет к концу таблицы. Блокировка чтения держится только на время выборки страницы, объекты
+    # обработанной страницы отсоединяются от сессии, и память не зависит от размера таблицы
+    @classmethod
+    def _iter_all(cls, page_size=None):
+        last_id = None
+        while True:
+            with cls.mutex.read_lock():
+                query = session.query(cls)
+                if last_id is not None:
+                    query = query.filter(cls.id > last_id)
+                page = query.order_by(cls.id).limit(page_size or cls.page_size).all()
+            if not page:
+                return
+            for entity in page:
+                yield entity
+            last_id = page[-1].id
+            for entity in page:
+                if entity in session:
+                    session.expunge(entity)
+
+    # Запрос id строк сущности, относящихся к сессии. Переопределяется в сущностях, связанных с сессией
+    @classmethod
+    def query_ids_by_session_id(cls, session_id):
+        raise ValueError('{} rows are not bound to a session'.format(cls.__name__))
+
+    # Функция изменения всех строк, удовлетворяющих условиям, одним запросом UPDATE вместо выборки и фиксации
+    # каждой строки. values - {атрибут: новое значение}; criteria - {атрибут: значение} (список, кортеж или
+    # множество - IN, None - IS NULL); conditions - выражения SQLAlchemy; session_id - только строки сессии
+    # (UPDATE ... WHERE id IN (запрос id строк сессии)). Без условий изменяются все строки, пустой values -
+    # ошибка. Фиксация делает загруженные объекты сессии устаревшими, они перечитываются при обращении;
+    # кэши сущности сбрасываются. Возвращает число измененных строк
+    @classmethod
+    def update_where(cls, values, *conditions, session_id=None, **criteria):
+        if not values:
+            raise ValueError('{}.update_where needs at least one column to set'.format(cls.__name__))
+        conditions = list(conditions)
+        for attribute, value in criteria.items():
+            column = getattr(cls, attribute)
+            if value is None:
+                conditions.append(column.is_(None))
+            elif isinstance(value, (list, tuple, set, frozenset)):
+                conditions.append(column.in_(value))
+            else:
+                conditions.append(column == value)
+        if session_id is not None:
+            conditions.append(cls.id.in_(cls.query_ids_by_session_id(session_id).order_by(None).scalar_subquery()))
+        with cls.mutex:
+            result = session.execute(update(cls).where(*conditions).values(**values),
+                                     execution_options={'synchronize_session': False})
+            session.commit()
+            cls._invalidate(None)
+            return result.rowcount
+
+    # Функция построения запроса по сущности целиком либо только по указанным колонкам (имена атрибутов).
+    # При проекции возвращаются строки (Row) без создания объектов сущности
+    @classmethod
+    def _query_columns(cls, columns=None):
+        if columns is None:
+            return session.query(cls)
+        return session.query(*(getattr(cls, column) for column in columns))
+
+
+# Функция получения сущностей, строки которых удаляются каскадно (ON DELETE CASCADE, в том числе через
+# промежуточные таблицы) при удалении строк сущности entity
+def cascade_dependents(entity):
+    entities = {mapper.local_table.name: mapper.class_ for mapper in Base.registry.mappers}
+    dependents = []
+    pending = [entity.__tablename__]
+    while pending:
+        parent = pending.pop()
+        for table in Base.metadata.sorted_tables:
+            if table.name not in dependents and table.name in entities and \
+                    any(key.ondelete == 'CASCADE' and key.column.table.name == parent for key in table.foreign_keys):
+                dependents.append(table.name)
+                pending.append(table.name)
+    return [entities[name] for name in dependents]
+
+
+# Зависимые сущности по удаляемой сущности: схема моделей не меняется во время работы, поэтому
+# cascade_dependents вычисляется один раз на сущность
+_cascade_dependents = {}
+
+
+# Удаление строки объектом сессии в базе с включенными внешними ключами (PRAGMA foreign_keys = ON в
+# подключении) каскадно удаляет зависимые строки, минуя ORM, поэтому кэши зависимых сущностей сбрасываются целиком
+@event.listens_for(BaseEntity, 'after_delete', propagate=True)
+def _invalidate_cascade(mapper, connection, target):
+    dependents = _cascade_dependents.get(mapper.class_)
+    if dependents is None:
+        dependents = _cascade_dependents[mapper.class_] = cascade_dependents(mapper.class_)
+    for dependent in dependents:
+        dependent._invalidate(None)
+
+
+# Кэш справочной таблицы в памяти процесса: все строки загружаются одним запросом при первом обращении
+# и сбрасываются целиком при любом изменении таблицы. Строки кэша - неизменяемые Row, не привязанные к сессии
+class LookupCache:
+    def __init__(self, entity):
+        self.entity = entity
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._rows = None
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def rows(self):
+        rows = self._rows
+        if rows is not None:
+            self.hits += 1
+            return rows
+        self.misses += 1
+        generation = self._generation
+        with self.entity.mutex.read_lock():
+            rows = {row.id: row for row in session.query(*self.entity.__table__.columns)}
+        with self._lock:
+            # Если за время загрузки таблица изменилась, загруженные строки уже устарели и не сохраняются
+            if generation == self._generation:
+                self._rows = rows
+        return rows
+
+    def get(self, entity_id):
+        return self.rows().get(entity_id)
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._rows = None
+            self.invalidations += 1
+
+    def stats(self):
+        rows = self._rows
+        return {'hits': self.hits, 'misses': self.misses, 'invalidations': self.invalidations,
+                'size': len(rows) if rows is not None else 0}
+
+
+# Базовый класс небольших, редко изменяемых справочников с кэшем чтения (LookupCache)
+class LookupEntity(BaseEntity):
+    __abstract__ = True
+
+    @classmethod
+    def lookup_cache(cls):
+        if '_lookup_cache' not in cls.__dict__:
+            cls._lookup_cache = LookupCache(cls)
+        return cls._lookup_cache
+
+    @classmethod
+    def _invalidate(cls, ids):
+        super()._invalidate(ids)
+        cls.lookup_cache().invalidate()
+
+    # Функция получения строки справочника по id из кэша (None, если строки нет)
+    @classmethod
+    def get_cached(cls, entity_id):
+        return cls.lookup_cache().get(entity_id)
+
+    # Функция получения всех строк справочника из кэша
+    @classmethod
+    def get_all_cached(cls):
+        return list(cls.lookup_cache().rows().values())
+
 
-class TypeSessionEntity(BaseEntity):
+class TypeSessionEntity(LookupEntity):
     __tablename__ = 'type_session'
 
     name = Column(String, nullable=False)
@@ -37,8 +579,15 @@ class TypeSessionEntity(BaseEntity):
             new_type_session = cls(name=name)
             session.add(new_type_session)
             session.commit()
+            cls._invalidate([new_type_session.id])
             return new_type_session.id
 
+    # Функция для пакетного создания объектов TypeSessionEntity одной транзакцией,
+    # type_sessions - наименования; возвращает id в порядке следования
+    @classmethod
+    def create_type_session_many(cls, type_sessions):
+        return cls._bulk_insert({'name': name} for name in type_sessions)
+
     # Функция для удаления объекта TypeSessionEntity по id
     @classmethod
     def delete_type_session(cls, type_session_id):
@@ -47,6 +596,7 @@ class TypeSessionEntity(BaseEntity):
             if type_session:
                 session.delete(type_session)
                 session.commit()
+                cls._invalidate([type_session_id])
 
     # Функция для изменения объекта TypeSessionEntity по id
     @classmethod
@@ -56,9 +606,10 @@ class TypeSessionEntity(BaseEntity):
             if type_session:
                 type_session.name = new_name
                 session.commit()
+                cls._invalidate([type_session_id])
 
 
-class TypeSourceRLIEntity(BaseEntity):
+class TypeSourceRLIEntity(LookupEntity):
     __tablename__ = 'type_source_rli'
 
     name = Column(String, nullable=False)
@@ -70,8 +621,15 @@ class TypeSourceRLIEntity(BaseEntity):
             new_type_source_rli = cls(name=name)
             session.add(new_type_source_rli)
             session.commit()
+            cls._invalidate([new_type_source_rli.id])
             return new_type_source_rli.id
 
+    # Функция для пакетного создания объектов TypeSourceRLIEntity одной транзакцией,
+    # type_sources_rli - наименования; возвращает id в порядке следования
+    @classmethod
+    def create_type_source_rli_many(cls, type_sources_rli):
+        return cls._bulk_insert({'name': name} for name in type_sources_rli)
+
     # Функция для удаления объекта TypeSourceRLIEntity по id
     @classmethod
     def delete_type_source_rli(cls, type_source_rli_id):
@@ -80,6 +638,7 @@ class TypeSourceRLIEntity(BaseEntity):
             if type_source_rli:
                 session.delete(type_source_rli)
                 session.commit()
+                cls._invalidate([type_source_rli_id])
 
     # Функция для изменения объекта TypeSourceRLIEntity по id
     @classmethod
@@ -89,6 +648,53 @@ class TypeSourceRLIEntity(BaseEntity):
             if type_source_rli:
                 type_source_rli.name = new_name
                 session.commit()
+                cls._invalidate([type_source_rli_id])
+
+
+# Удаление поддерева сессий по наборам id во временных таблицах purge_* подключения: сначала наборы
+# заполняются (сессии - из параметров, файлы и отметки - по сессиям), затем строки удаляются от зависимых
+# к родительским. Экстенты растров и привязанных РЛИ и координаты отметок и углов экстентов удаляются,
+# только если на них больше ничего не ссылается (регион или другая сессия)
+session_purge_tables = ['session', 'file', 'raster_rli', 'mark', 'extent', 'coordinates']
+extent_corners = ['top_left_id', 'bot_left_id', 'top_right_id', 'bot_right_id']
+
+session_purge_collect = [
+    'INSERT INTO purge_raster_rli SELECT id FROM raster_rli WHERE file_id IN (SELECT id FROM purge_file) UNION '
+    'SELECT raster_rli.id FROM raster_rli JOIN rli ON raster_rli.rli_id = rli.id '
+    'JOIN raw_rli ON rli.raw_rli_id = raw_rli.id WHERE raw_rli.file_id IN (SELECT id FROM purge_file)',
+    'INSERT OR IGNORE INTO purge_extent SELECT extent_id FROM raster_rli '
+    'WHERE id IN (SELECT id FROM purge_raster_rli) AND extent_id IS NOT NULL',
+    'INSERT OR IGNORE INTO purge_extent SELECT extent_id FROM linked_rli WHERE (raster_rli_id IN '
+    '(SELECT id FROM purge_raster_rli) OR file_id IN (SELECT id FROM purge_file)) AND extent_id IS NOT NULL',
+    'INSERT OR IGNORE INTO purge_coordinates SELECT coordinates_id FROM mark '
+    'WHERE id IN (SELECT id FROM purge_mark) AND coordinates_id IS NOT NULL',
+]
+
+session_purge_statements = [
+    ('target', 'DELETE FROM target WHERE raster_rli_id IN (SELECT id FROM purge_raster_rli) OR '
+               'object_id IN (SELECT id FROM object WHERE mark_id IN (SELECT id FROM purge_mark))'),
+    ('object', 'DELETE FROM object WHERE mark_id IN (SELECT id FROM purge_mark)'),
+    ('mark', 'DELETE FROM mark WHERE id IN (SELECT id FROM purge_mark)'),
+    ('linked_rli', 'DELETE FROM linked_rli WHERE raster_rli_id IN (SELECT id FROM purge_raster_rli) OR '
+                   'file_id IN (SELECT id FROM purge_file)'),
+    ('raster_rli', 'DELETE FROM raster_rli WHERE id IN (SELECT id FROM purge_raster_rli)'),
+    ('rli', 'DELETE FROM rli WHERE raw_rli_id IN '
+            '(SELECT id FROM raw_rli WHERE file_id IN (SELECT id FROM purge_file))'),
+    ('raw_rli', 'DELETE FROM raw_rli WHERE file_id IN (SELECT id FROM purge_file)'),
+    ('file', 'DELETE FROM file WHERE id IN (SELECT id FROM purge_file)'),
+    ('session', 'DELETE FROM session WHERE id IN (SELECT id FROM purge_session)'),
+    (None, 'DELETE FROM purge_extent WHERE EXISTS (SELECT 1 FROM raster_rli WHERE extent_id = purge_extent.id) OR '
+           'EXISTS (SELECT 1 FROM linked_rli WHERE extent_id = purge_extent.id) OR '
+           'EXISTS (SELECT 1 FROM region WHERE extent_id = purge_extent.id)'),
+    (None, 'INSERT OR IGNORE INTO purge_coordinates SELECT corner FROM (' + ' UNION '.join(
+        'SELECT {} AS corner FROM extent WHERE id IN (SELECT id FROM purge_extent)'.format(corner)
+        for corner in extent_corners) + ') WHERE corner IS NOT NULL'),
+    ('extent', 'DELETE FROM extent WHERE id IN (SELECT id FROM purge_extent)'),
+    (None, 'DELETE FROM purge_coordinates WHERE EXISTS (SELECT 1 FROM mark WHERE coordinates_id = purge_coordinates.id)'
+           + ''.join(' OR EXISTS (SELECT 1 FROM extent WHERE {} = purge_coordinates.id)'.format(corner)
+                     for corner in extent_corners)),
+    ('coordinates', 'DELETE FROM coordinates WHERE id IN (SELECT id FROM purge_coordinates)'),
+]
 
 
 class SessionEntity(BaseEntity):
@@ -110,14 +716,84 @@ class SessionEntity(BaseEntity):
             session.commit()
             return new_session.id
 
-    # Функция для удаления объекта SessionEntity по id
+    # Функция для пакетного создания объектов SessionEntity одной транзакцией,
+    # sessions - кортежи (name, path_to_directory, type_session_id[, date]), без даты - текущее время;
+    # возвращает id в порядке следования
+    @classmethod
+    def create_session_many(cls, sessions):
+        now = datetime.now()
+        return cls._bulk_insert({'name': name, 'path_to_directory': path_to_directory,
+                                 'type_session_id': type_session_id, 'date': date[0] if date else now}
+                                for name, path_to_directory, type_session_id, *date in sessions)
+
+    # Функция для удаления объекта SessionEntity по id вместе со всеми данными сессии
     @classmethod
     def delete_session(cls, session_id):
-        with cls.mutex:
-            session_obj = session.query(cls).get(session_id)
-            if session_obj:
-                session.delete(session_obj)
-                session.commit()
+        cls.purge_sessions([session_id])
+
+    # Функция удаления сессий со всеми зависимыми строками (файлы, сырые, обработанные, растровые и привязанные
+    # РЛИ, отметки, объекты, цели, экстенты и координаты) запросами по наборам строк, а не по одной строке.
+    # Без chunk_size - одна транзакция. С chunk_size - транзакции по chunk_size файлов и отметок с их
+    # зависимыми строками, строки сессий удаляются последней транзакцией: блокировка записи не держится долго,
+    # а прерванное удаление продолжается повторным вызовом. Возвращает {таблица: число удаленных строк}
+    @classmethod
+    def purge_sessions(cls, session_ids, chunk_size=None):
+        session_ids = list(session_ids)
+        counts = {}
+        while session_ids:
+            with cls.mutex:
+                try:
+                    chunk_counts = cls._purge_chunk(session_ids, chunk_size)
+                    session.commit()
+                except Exception:
+                    session.rollback()
+                    raise
+                entities = {mapper.local_table.name: mapper.class_ for mapper in Base.registry.mappers}
+                for table, count in chunk_counts.items():
+                    counts[table] = counts.get(table, 0) + count
+                    if count:
+                        entities[table]._invalidate(None)
+            if chunk_counts.get('session') is not None:
+                break
+        return counts
+
+    # Функция удаления в текущей транзакции одной порции поддерева сессий: до limit файлов и отметок (None - все)
+    # и, если у сессий больше ничего не осталось, самих сессий. Для сессий счетчик 'session' есть только
+    # в последней порции
+    @classmethod
+    def _purge_chunk(cls, session_ids, limit=None):
+        for table in session_purge_tables:
+            session.execute(text('CREATE TEMP TABLE IF NOT EXISTS purge_{} (id INTEGER PRIMARY KEY)'.format(table)))
+            session.execute(text('DELETE FROM temp.purge_{}'.format(table)))
+        session.execute(text('INSERT OR IGNORE INTO purge_session VALUES (:id)'),
+                        [{'id': session_id} for session_id in session_ids])
+        limit_clause = ' LIMIT {:d}'.format(limit) if limit else ''
+        for table in ('file', 'mark'):
+            session.execute(text('INSERT INTO purge_{0} SELECT id FROM {0} WHERE session_id IN '
+                                 '(SELECT id FROM purge_session) ORDER BY id{1}'.format(table, limit_clause)))
+        remaining = session.execute(text('SELECT (SELECT count(*) FROM purge_file) + '
+                                         '(SELECT count(*) FROM purge_mark)')).scalar()
+        if limit and remaining:
+            session.execute(text('DELETE FROM purge_session'))
+        for statement in session_purge_collect:
+            session.execute(text(statement))
+        counts = {}
+        for table, statement in session_purge_statements:
+            result = session.execute(text(statement))
+            if table is not None and (table != 'session' or not (limit and remaining)):
+                counts[table] = result.rowcount
+        return counts
+
+    # Функция удаления сессий с датой раньше before (datetime) порциями по chunk_size файлов и отметок
+    # (см. purge_sessions) и освобождения места в файле базы (reclaim_space). Возвращает
+    # {таблица: число удаленных строк} и число освобожденных страниц под ключом 'freed_pages'
+    @classmethod
+    def purge_sessions_before(cls, before, chunk_size=1000):
+        with cls.mutex.read_lock():
+            session_ids = [row.id for row in session.query(cls.id).filter(cls.date < before).order_by(cls.id)]
+        counts = cls.purge_sessions(session_ids, chunk_size) if session_ids else {}
+        counts['freed_pages'] = reclaim_space()
+        return counts
 
     # Функция для изменения объекта SessionEntity по id
     @classmethod
@@ -130,13 +806,24 @@ class SessionEntity(BaseEntity):
                 session_obj.type_session_id = new_type_session_id
                 session_obj.date = datetime.now()
                 session.commit()
+                cls._invalidate([session_id])
 
     # Функция получения перечня сессий
     @classmethod
     def get_all_sessions(cls):
-        with cls.mutex:
+        with cls.mutex.read_lock():
             return session.query(cls).all()
 
+    # Генератор перечня сессий постранично, без загрузки всей таблицы
+    @classmethod
+    def iter_all_sessions(cls, page_size=None):
+        return cls._iter_all(page_size)
+
+    # Запрос id самой сессии
+    @classmethod
+    def query_ids_by_session_id(cls, session_id):
+        return session.query(cls.id).filter(cls.id == session_id)
+
 
 class CoordinatesEntity(BaseEntity):
     __tablename__ = 'coordinates'
@@ -154,6 +841,13 @@ class CoordinatesEntity(BaseEntity):
             session.commit()
             return new_coordinates.id
 
+    # Функция для пакетного создания объектов CoordinatesEntity одной транзакцией,
+    # coordinates - кортежи (latitude, longitude, altitude); возвращает id в порядке следования
+    @classmethod
+    def create_coordinates_many(cls, coordinates):
+        return cls._bulk_insert({'latitude': latitude, 'longitude': longitude, 'altitude': altitude}
+                                for latitude, longitude, altitude in coordinates)
+
     # Функция для удаления объекта CoordinatesEntity по id
     @classmethod
     def delete_coordinates(cls, coordinates_id):
@@ -162,6 +856,7 @@ class CoordinatesEntity(BaseEntity):
             if coordinates:
                 session.delete(coordinates)
                 session.commit()
+                cls._invalidate([coordinates_id])
 
     # Функция для изменения объекта CoordinatesEntity по id
     @classmethod
@@ -173,18 +868,54 @@ class CoordinatesEntity(BaseEntity):
                 coordinates.longitude = new_longitude
                 coordinates.altitude = new_altitude
                 session.commit()
+                cls._invalidate([coordinates_id])
+
+
+# Пространственный индекс координат (модуль R*Tree SQLite): по одной вырожденной "коробке" на точку.
+# Поддерживается триггерами на таблице coordinates, поэтому синхронен и при пакетной вставке.
+# Таблица описана в отдельной MetaData, чтобы create_all не создавал ее как обычную
+coordinates_rtree = Table('coordinates_rtree', MetaData(),
+                          Column('id', Integer, primary_key=True),
+                          Column('min_latitude', Float), Column('max_latitude', Float),
+                          Column('min_longitude', Float), Column('max_longitude', Float))
+
+coordinates_rtree_ddl = [
+    'CREATE VIRTUAL TABLE IF NOT EXISTS coordinates_rtree '
+    'USING rtree(id, min_latitude, max_latitude, min_longitude, max_longitude)',
+    'CREATE TRIGGER IF NOT EXISTS coordinates_rtree_insert AFTER INSERT ON coordinates BEGIN '
+    'INSERT INTO coordinates_rtree VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude); END',
+    'CREATE TRIGGER IF NOT EXISTS coordinates_rtree_update '
+    'AFTER UPDATE OF id, latitude, longitude ON coordinates BEGIN '
+    'DELETE FROM coordinates_rtree WHERE id = old.id; '
+    'INSERT INTO coordinates_rtree VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude); END',
+    'CREATE TRIGGER IF NOT EXISTS coordinates_rtree_delete AFTER DELETE ON coordinates BEGIN '
+    'DELETE FROM coordinates_rtree WHERE id = old.id; END',
+    # Дозаполнение индекса для координат, созданных до его появления
+    'INSERT INTO coordinates_rtree SELECT id, latitude, latitude, longitude, longitude FROM coordinates '
+    'WHERE id NOT IN (SELECT id FROM coordinates_rtree)',
+]
+
+
+# Функция создания пространственного индекса координат (повторный вызов ничего не меняет)
+def create_coordinates_rtree(connection):
+    for statement in coordinates_rtree_ddl:
+        connection.exec_driver_sql(statement)
+
+
+event.listen(CoordinatesEntity.__table__, 'after_create', lambda target, connection, **kw:
+             create_coordinates_rtree(connection))
 
 
 class ExtentEntity(BaseEntity):
     __tablename__ = 'extent'
 
-    top_left_id = Column(Integer, ForeignKey('coordinates.id', ondelete='CASCADE'))
+    top_left_id = Column(Integer, ForeignKey('coordinates.id', ondelete='CASCADE'), index=True)
     top_left = relationship('CoordinatesEntity', foreign_keys=[top_left_id])
-    bot_left_id = Column(Integer, ForeignKey('coordinates.id', ondelete='CASCADE'))
+    bot_left_id = Column(Integer, ForeignKey('coordinates.id', ondelete='CASCADE'), index=True)
     bot_left = relationship('CoordinatesEntity', foreign_keys=[bot_left_id])
-    top_right_id = Column(Integer, ForeignKey('coordinates.id', ondelete='CASCADE'))
+    top_right_id = Column(Integer, ForeignKey('coordinates.id', ondelete='CASCADE'), index=True)
     top_right = relationship('CoordinatesEntity', foreign_keys=[top_right_id])
-    bot_right_id = Column(Integer, ForeignKey('coordinates.id', ondelete='CASCADE'))
+    bot_right_id = Column(Integer, ForeignKey('coordinates.id', ondelete='CASCADE'), index=True)
     bot_right = relationship('CoordinatesEntity', foreign_keys=[bot_right_id])
 
     # Функция для создания объекта ExtentEntity
@@ -196,6 +927,14 @@ class ExtentEntity(BaseEntity):
             session.commit()
             return new_extent.id
 
+    # Функция для пакетного создания объектов ExtentEntity одной транзакцией,
+    # extents - кортежи (top_left, bot_left, top_right, bot_right); возвращает id в порядке следования
+    @classmethod
+    def create_extent_many(cls, extents):
+        return cls._bulk_insert({'top_left_id': top_left, 'bot_left_id': bot_left,
+                                 'top_right_id': top_right, 'bot_right_id': bot_right}
+                                for top_left, bot_left, top_right, bot_right in extents)
+
     # Функция для удаления объекта ExtentEntity по id
     @classmethod
     def delete_extent(cls, extent_id):
@@ -204,6 +943,7 @@ class ExtentEntity(BaseEntity):
             if extent:
                 session.delete(extent)
                 session.commit()
+                cls._invalidate([extent_id])
 
     # Функция для изменения объекта ExtentEntity по id
     @classmethod
@@ -216,6 +956,86 @@ class ExtentEntity(BaseEntity):
                 extent.top_right_id = new_top_right
                 extent.bot_right_id = new_bot_right
                 session.commit()
+                cls._invalidate([extent_id])
+
+    # Запрос сущности с экстентом (entity - RasterRLIEntity, LinkedRLIEntity), чей описанный прямоугольник
+    # пересекает заданный прямоугольник широт/долгот. Точка - вырожденный прямоугольник
+    @classmethod
+    def query_footprints(cls, entity, min_latitude, max_latitude, min_longitude, max_longitude, columns=None):
+        return entity._query_columns(columns).\
+            join(extent_rtree, extent_rtree.c.id == entity.extent_id).\
+            filter(extent_rtree.c.max_latitude >= min_latitude, extent_rtree.c.min_latitude <= max_latitude,
+                   extent_rtree.c.max_longitude >= min_longitude, extent_rtree.c.min_longitude <= max_longitude).\
+            order_by(entity.id)
+
+    # Запрос сущности с экстентом, содержащим точку: кандидаты отбираются по описанному прямоугольнику (R*Tree),
+    # затем уточняются по угловым точкам. Экстент - выпуклый четырехугольник с обходом углов top_left -> top_right
+    # -> bot_right -> bot_left; точка внутри или на границе, если она не лежит по разные стороны от его сторон
+    # (векторные произведения сторон на точку одного знака при любом направлении обхода)
+    @classmethod
+    def query_containing_point(cls, entity, latitude, longitude, columns=None):
+        corners = [aliased(CoordinatesEntity) for _ in range(4)]
+        crosses = [(end.longitude - start.longitude) * (latitude - start.latitude) -
+                   (end.latitude - start.latitude) * (longitude - start.longitude)
+                   for start, end in zip(corners, corners[1:] + corners[:1])]
+        return cls.query_footprints(entity, latitude, latitude, longitude, longitude, columns).\
+            join(cls, cls.id == entity.extent_id).\
+            join(corners[0], corners[0].id == cls.top_left_id).\
+            join(corners[1], corners[1].id == cls.top_right_id).\
+            join(corners[2], corners[2].id == cls.bot_right_id).\
+            join(corners[3], corners[3].id == cls.bot_left_id).\
+            filter(or_(and_(*[cross >= 0 for cross in crosses]), and_(*[cross <= 0 for cross in crosses])))
+
+
+# Индекс описанных прямоугольников экстентов (R*Tree), чтобы поиск снимков по точке не требовал
+# четырех JOIN с coordinates на каждый экстент. Поддерживается триггерами на extent и coordinates,
+# то есть create_extent/update_extent/update_coordinates (и пакетные варианты) обновляют его автоматически
+extent_rtree = Table('extent_rtree', MetaData(),
+                     Column('id', Integer, primary_key=True),
+                     Column('min_latitude', Float), Column('max_latitude', Float),
+                     Column('min_longitude', Float), Column('max_longitude', Float))
+
+# Описанный прямоугольник экстента по его угловым точкам (дополняется условием WHERE ... GROUP BY e.id)
+extent_bbox_select = 'SELECT e.id, min(c.latitude), max(c.latitude), min(c.longitude), max(c.longitude) ' \
+                     'FROM extent e JOIN coordinates c ' \
+                     'ON c.id IN (e.top_left_id, e.bot_left_id, e.top_right_id, e.bot_right_id) '
+
+extent_rtree_ddl = [
+    'CREATE VIRTUAL TABLE IF NOT EXISTS extent_rtree '
+    'USING rtree(id, min_latitude, max_latitude, min_longitude, max_longitude)',
+    'CREATE TRIGGER IF NOT EXISTS extent_rtree_insert AFTER INSERT ON extent BEGIN '
+    'INSERT INTO extent_rtree ' + extent_bbox_select + 'WHERE e.id = new.id GROUP BY e.id; END',
+    'CREATE TRIGGER IF NOT EXISTS extent_rtree_update '
+    'AFTER UPDATE OF id, top_left_id, bot_left_id, top_right_id, bot_right_id ON extent BEGIN '
+    'DELETE FROM extent_rtree WHERE id = old.id; '
+    'INSERT INTO extent_rtree ' + extent_bbox_select + 'WHERE e.id = new.id GROUP BY e.id; END',
+    'CREATE TRIGGER IF NOT EXISTS extent_rtree_delete AFTER DELETE ON extent BEGIN '
+    'DELETE FROM extent_rtree WHERE id = old.id; END',
+    # Изменение или удаление угловой точки пересчитывает прямоугольники всех экстентов, где она используется
+    'CREATE TRIGGER IF NOT EXISTS extent_rtree_coordinates_update '
+    'AFTER UPDATE OF latitude, longitude ON coordinates BEGIN '
+    'DELETE FROM extent_rtree WHERE id IN (SELECT id FROM extent WHERE top_left_id = new.id OR '
+    'bot_left_id = new.id OR top_right_id = new.id OR bot_right_id = new.id); '
+    'INSERT INTO extent_rtree ' + extent_bbox_select + 'WHERE e.top_left_id = new.id OR e.bot_left_id = new.id OR '
+    'e.top_right_id = new.id OR e.bot_right_id = new.id GROUP BY e.id; END',
+    'CREATE TRIGGER IF NOT EXISTS extent_rtree_coordinates_delete AFTER DELETE ON coordinates BEGIN '
+    'DELETE FROM extent_rtree WHERE id IN (SELECT id FROM extent WHERE top_left_id = old.id OR '
+    'bot_left_id = old.id OR top_right_id = old.id OR bot_right_id = old.id); '
+    'INSERT INTO extent_rtree ' + extent_bbox_select + 'WHERE e.top_left_id = old.id OR e.bot_left_id = old.id OR '
+    'e.top_right_id = old.id OR e.bot_right_id = old.id GROUP BY e.id; END',
+    # Дозаполнение индекса для экстентов, созданных до его появления
+    'INSERT INTO extent_rtree ' + extent_bbox_select + 'WHERE e.id NOT IN (SELECT id FROM extent_rtree) GROUP BY e.id',
+]
+
+
+# Функция создания индекса прямоугольников экстентов (повторный вызов ничего не меняет)
+def create_extent_rtree(connection):
+    for statement in extent_rtree_ddl:
+        connection.exec_driver_sql(statement)
+
+
+event.listen(ExtentEntity.__table__, 'after_create', lambda target, connection, **kw:
+             create_extent_rtree(connection))
 
 
 class FileEntity(BaseEntity):
@@ -224,8 +1044,11 @@ class FileEntity(BaseEntity):
     name = Column(String, nullable=False)
     path_to_file = Column(String, nullable=False)
     file_extension = Column(String)
-    session_id = Column(Integer, ForeignKey('session.id', ondelete='CASCADE'))
+    session_id = Column(Integer, ForeignKey('session.id', ondelete='CASCADE'), index=True)
     session = relationship('SessionEntity')
+    # Размер и время изменения (st_mtime_ns) файла при регистрации: вместе с путем определяют уже учтенный файл
+    size = Column(Integer)
+    mtime_ns = Column(Integer)
 
     # Функция для создания объекта FileEntity
     @classmethod
@@ -236,6 +1059,54 @@ class FileEntity(BaseEntity):
             session.commit()
             return new_file.id
 
+    # Функция для пакетного создания объектов FileEntity одной транзакцией,
+    # files - кортежи (name, path_to_file, file_extension, session_id); возвращает id в порядке следования
+    @classmethod
+    def create_file_many(cls, files):
+        return cls._bulk_insert({'name': name, 'path_to_file': path_to_file,
+                                 'file_extension': file_extension, 'session_id': session_id}
+                                for name, path_to_file, file_extension, session_id in files)
+
+    # Функция регистрации файлов сессии одной транзакцией: строка file и строка raw_rli на каждый файл.
+    # files - кортежи (name, path_to_file, file_extension, size, mtime_ns); возвращает id файлов в порядке следования
+    @classmethod
+    def register_files(cls, session_id, files, type_source_rli_id):
+        rows = [{'name': name, 'path_to_file': path_to_file, 'file_extension': file_extension,
+                 'session_id': session_id, 'size': size, 'mtime_ns': mtime_ns}
+                for name, path_to_file, file_extension, size, mtime_ns in files]
+        if not rows:
+            return []
+        with cls.mutex:
+            file_ids = cls._insert_rows(rows)
+            date_receiving = datetime.now()
+            RawRLIEntity._insert_rows([{'file_id': file_id, 'type_source_rli_id': type_source_rli_id,
+                                        'date_receiving': date_receiving} for file_id in file_ids])
+            session.commit()
+            cls._invalidate(file_ids)
+            return file_ids
+
+    # Функция получения учтенных файлов сессии: {path_to_file: строка (id, path_to_file, size, mtime_ns)},
+    # для нескольких строк с одним путем - последняя зарегистрированная
+    @classmethod
+    def get_file_signatures(cls, session_id):
+        with cls.mutex.read_lock():
+            query = session.query(cls.id, cls.path_to_file, cls.size, cls.mtime_ns).\
+                filter(cls.session_id == session_id).\
+                order_by(cls.id)
+            return {row.path_to_file: row for row in query}
+
+    # Функция записи размера и времени изменения в строки файлов одной транзакцией,
+    # signatures - кортежи (file_id, size, mtime_ns)
+    @classmethod
+    def update_file_signatures(cls, signatures):
+        rows = [{'id': file_id, 'size': size, 'mtime_ns': mtime_ns} for file_id, size, mtime_ns in signatures]
+        if not rows:
+            return
+        with cls.mutex:
+            session.execute(update(cls), rows)
+            session.commit()
+            cls._invalidate([row['id'] for row in rows])
+
     # Функция для удаления объекта FileEntity по id
     @classmethod
     def delete_file(cls, file_id):
@@ -244,6 +1115,7 @@ class FileEntity(BaseEntity):
             if file:
                 session.delete(file)
                 session.commit()
+                cls._invalidate([file_id])
 
     # Функция для изменения объекта FileEntity по id
     @classmethod
@@ -256,12 +1128,18 @@ class FileEntity(BaseEntity):
                 file.file_extension = new_file_extension
                 file.session_id = new_session_id
                 session.commit()
+                cls._invalidate([file_id])
+
+    # Запрос id файлов сессии
+    @classmethod
+    def query_ids_by_session_id(cls, session_id):
+        return session.query(cls.id).filter(cls.session_id == session_id)
 
 
 class RawRLIEntity(BaseEntity):
     __tablename__ = 'raw_rli'
 
-    file_id = Column(Integer, ForeignKey('file.id', ondelete='CASCADE'))
+    file_id = Column(Integer, ForeignKey('file.id', ondelete='CASCADE'), index=True)
     file = relationship('FileEntity')
     type_source_rli_id = Column(Integer, ForeignKey('type_source_rli.id', ondelete='CASCADE'))
     type_source_rli = relationship('TypeSourceRLIEntity')
@@ -276,6 +1154,16 @@ class RawRLIEntity(BaseEntity):
             session.commit()
             return new_raw_rli.id
 
+    # Функция для пакетного создания объектов RawRLIEntity одной транзакцией,
+    # raw_rlis - кортежи (file_id, type_source_rli_id[, date_receiving]), без даты - текущее время;
+    # возвращает id в порядке следования
+    @classmethod
+    def create_raw_rli_many(cls, raw_rlis):
+        now = datetime.now()
+        return cls._bulk_insert({'file_id': file_id, 'type_source_rli_id': type_source_rli_id,
+                                 'date_receiving': date_receiving[0] if date_receiving else now}
+                                for file_id, type_source_rli_id, *date_receiving in raw_rlis)
+
     # Функция для удаления объекта RawRLIEntity по id
     @classmethod
     def delete_raw_rli(cls, raw_rli_id):
@@ -284,6 +1172,7 @@ class RawRLIEntity(BaseEntity):
             if raw_rli:
                 session.delete(raw_rli)
                 session.commit()
+                cls._invalidate([raw_rli_id])
 
     # Функция для изменения объекта RawRLIEntity по id
     @classmethod
@@ -295,16 +1184,30 @@ class RawRLIEntity(BaseEntity):
                 raw_rli.type_source_rli_id = new_type_source_rli_id
                 raw_rli.date_receiving = datetime.now()
                 session.commit()
+                cls._invalidate([raw_rli_id])
+
+    # Запрос id сырых РЛИ сессии: сырое РЛИ -> файл с соответствующим session_id
+    @classmethod
+    def query_ids_by_session_id(cls, session_id):
+        return session.query(cls.id).\
+            join(FileEntity, cls.file_id == FileEntity.id).\
+            filter(FileEntity.session_id == session_id)
 
 
 class RLIEntity(BaseEntity):
     __tablename__ = 'rli'
+    # Очередь обработки: РЛИ с is_processing = False ждут обработки, True - обработаны.
+    # Частичный индекс содержит только необработанные РЛИ, поэтому захват не просматривает обработанные
+    __table_args__ = (Index('ix_rli_pending', 'id', sqlite_where=text('is_processing = 0')),)
 
     time_location = Column(TIMESTAMP)
     name = Column(String, nullable=False)
     is_processing = Column(Boolean, nullable=False, default=False)
-    raw_rli_id = Column(Integer, ForeignKey('raw_rli.id', ondelete='CASCADE'))
+    raw_rli_id = Column(Integer, ForeignKey('raw_rli.id', ondelete='CASCADE'), index=True)
     raw_rli = relationship('RawRLIEntity')
+    # Обработчик, захвативший РЛИ, и время окончания захвата: после него РЛИ снова может быть захвачено
+    claimed_by = Column(String)
+    lease_expires_at = Column(TIMESTAMP)
 
     # Функция для создания объекта RLIEntity
     @classmethod
@@ -315,6 +1218,16 @@ class RLIEntity(BaseEntity):
             session.commit()
             return new_rli.id
 
+    # Функция для пакетного создания объектов RLIEntity одной транзакцией,
+    # rlis - кортежи (name, is_processing, raw_rli_id[, time_location]), без времени - текущее;
+    # возвращает id в порядке следования
+    @classmethod
+    def create_rli_many(cls, rlis):
+        now = datetime.now()
+        return cls._bulk_insert({'time_location': time_location[0] if time_location else now, 'name': name,
+                                 'is_processing': is_processing, 'raw_rli_id': raw_rli_id}
+                                for name, is_processing, raw_rli_id, *time_location in rlis)
+
     # Функция для удаления объекта RLIEntity по id
     @classmethod
     def delete_rli(cls, rli_id):
@@ -323,6 +1236,7 @@ class RLIEntity(BaseEntity):
             if rli:
                 session.delete(rli)
                 session.commit()
+                cls._invalidate([rli_id])
 
     # Функция для изменения объекта RLIEntity по id
     @classmethod
@@ -335,32 +1249,106 @@ class RLIEntity(BaseEntity):
                 rli.is_processing = new_is_processing
                 rli.raw_rli_id = new_raw_rli_id
                 session.commit()
+                cls._invalidate([rli_id])
 
     # Функция для получения РЛИ в сессии
     @classmethod
-    def get_rli_by_session_id(cls, session_id):
+    def get_rli_by_session_id(cls, session_id, columns=None):
+        with cls.mutex.read_lock():
+            return cls.query_rli_by_session_id(session_id, columns).all()
+
+    # Запрос РЛИ сессии одним JOIN: RLI -> сырое РЛИ -> файл с соответствующим session_id
+    @classmethod
+    def query_rli_by_session_id(cls, session_id, columns=None):
+        return cls._query_columns(columns).\
+            join(RawRLIEntity, cls.raw_rli_id == RawRLIEntity.id).\
+            join(FileEntity, RawRLIEntity.file_id == FileEntity.id).\
+            filter(FileEntity.session_id == session_id).\
+            order_by(cls.id)
+
+    # Функция захвата обработчиком worker до limit необработанных РЛИ (всех сессий или сессии session_id)
+    # на lease_seconds секунд. Захватываются РЛИ без захвата и с истекшим захватом, по возрастанию id.
+    # Выбор и захват - один запрос UPDATE ... WHERE id IN (SELECT ... LIMIT) RETURNING, поэтому одно РЛИ
+    # не достанется двум обработчикам ни в потоках, ни в разных процессах. Возвращает строки (id, name, raw_rli_id)
+    @classmethod
+    def claim_rli(cls, worker, limit=100, lease_seconds=300, session_id=None):
+        now = datetime.now()
+        pending = select(cls.id).\
+            where(cls.is_processing == false(), or_(cls.lease_expires_at.is_(None), cls.lease_expires_at < now))
+        if session_id is not None:
+            pending = pending.\
+                join(RawRLIEntity, cls.raw_rli_id == RawRLIEntity.id).\
+                join(FileEntity, RawRLIEntity.file_id == FileEntity.id).\
+                where(FileEntity.session_id == session_id)
+        pending = pending.order_by(cls.id).limit(limit)
         with cls.mutex:
-            # Выбираем id файлов с соответствующим session_id
-            ids_of_files_with_session_id = list(map(lambda x: x.id, session.query(FileEntity).
-                                                    filter_by(session_id=session_id).all()))
+            result = session.execute(update(cls).
+                                     where(cls.id.in_(pending)).
+                                     values(claimed_by=worker, lease_expires_at=now + timedelta(seconds=lease_seconds)).
+                                     returning(cls.id, cls.name, cls.raw_rli_id),
+                                     execution_options={'synchronize_session': False})
+            rows = sorted(result.all())
+            session.commit()
+            cls._invalidate([row.id for row in rows])
+            return rows
+
+    # Функция изменения РЛИ, захваченных обработчиком worker (захваты, перехваченные после истечения, не меняются).
+    # Возвращает число измененных РЛИ
+    @classmethod
+    def _update_claimed(cls, rli_ids, worker, **values):
+        rli_ids = list(rli_ids)
+        if not rli_ids:
+            return 0
+        with cls.mutex:
+            result = session.execute(update(cls).
+                                     where(cls.id.in_(rli_ids), cls.claimed_by == worker, cls.is_processing == false()).
+                                     values(**values),
+                                     execution_options={'synchronize_session': False})
+            session.commit()
+            cls._invalidate(rli_ids)
+            return result.rowcount
 
-            # Получаем RawRLIEntity по соответсвующим file_id
-            raw_rli_ids_with_session_id = list(map(lambda x: x.id, session.query(RawRLIEntity).
-                                                   filter(
-                RawRLIEntity.file_id.in_(ids_of_files_with_session_id)).all()))
+    # Функция отметки захваченных РЛИ обработанными одним запросом, возвращает число отмеченных
+    @classmethod
+    def complete_rli(cls, rli_ids, worker):
+        return cls._update_claimed(rli_ids, worker, is_processing=True, claimed_by=None, lease_expires_at=None)
 
-            # Возваращаем соответствующие RLIs по id RawRLIs
-            return session.query(cls).filter(cls.raw_rli_id.in_(raw_rli_ids_with_session_id)).all()
+    # Функция возврата захваченных РЛИ в очередь до истечения захвата, возвращает число возвращенных
+    @classmethod
+    def release_rli(cls, rli_ids, worker):
+        return cls._update_claimed(rli_ids, worker, claimed_by=None, lease_expires_at=None)
+
+    # Функция продления захвата РЛИ обработчиком на lease_seconds секунд от текущего времени
+    @classmethod
+    def extend_rli_lease(cls, rli_ids, worker, lease_seconds=300):
+        return cls._update_claimed(rli_ids, worker, lease_expires_at=datetime.now() + timedelta(seconds=lease_seconds))
+
+    # Функция получения состояния очереди: число ожидающих, захваченных (с действующим захватом) и обработанных РЛИ
+    @classmethod
+    def get_queue_stats(cls):
+        now = datetime.now()
+        with cls.mutex.read_lock():
+            row = session.query(func.count(cls.id).filter(cls.is_processing == false(), or_(
+                                    cls.lease_expires_at.is_(None), cls.lease_expires_at < now)).label('pending'),
+                                func.count(cls.id).filter(cls.is_processing == false(),
+                                                          cls.lease_expires_at >= now).label('claimed'),
+                                func.count(cls.id).filter(cls.is_processing).label('processed')).one()
+            return row._asdict()
+
+    # Запрос id РЛИ сессии
+    @classmethod
+    def query_ids_by_session_id(cls, session_id):
+        return cls.query_rli_by_session_id(session_id, ['id'])
 
 
 class RasterRLIEntity(BaseEntity):
     __tablename__ = 'raster_rli'
 
-    rli_id = Column(Integer, ForeignKey('rli.id', ondelete='CASCADE'))
+    rli_id = Column(Integer, ForeignKey('rli.id', ondelete='CASCADE'), index=True)
     rli = relationship('RLIEntity')
-    file_id = Column(Integer, ForeignKey('file.id', ondelete='CASCADE'))
+    file_id = Column(Integer, ForeignKey('file.id', ondelete='CASCADE'), index=True)
     file = relationship('FileEntity')
-    extent_id = Column(Integer, ForeignKey('extent.id', ondelete='CASCADE'))
+    extent_id = Column(Integer, ForeignKey('extent.id', ondelete='CASCADE'), index=True)
     extent = relationship('ExtentEntity')
 
     # Функция создания объекта RasterRLIEntity
@@ -372,6 +1360,13 @@ class RasterRLIEntity(BaseEntity):
             session.commit()
             return new_raster_rli.id
 
+    # Функция для пакетного создания объектов RasterRLIEntity одной транзакцией,
+    # raster_rlis - кортежи (rli_id, file_id, extent_id); возвращает id в порядке следования
+    @classmethod
+    def create_raster_rli_many(cls, raster_rlis):
+        return cls._bulk_insert({'rli_id': rli_id, 'file_id': file_id, 'extent_id': extent_id}
+                                for rli_id, file_id, extent_id in raster_rlis)
+
     # Функция для удаления объекта RasterRLIEntity по id
     @classmethod
     def delete_raster_rli(cls, raster_rli_id):
@@ -380,6 +1375,7 @@ class RasterRLIEntity(BaseEntity):
             if raster_rli:
                 session.delete(raster_rli)
                 session.commit()
+                cls._invalidate([raster_rli_id])
 
     # Функция для изменения объекта RasterRLIEntity по id
     @classmethod
@@ -391,9 +1387,30 @@ class RasterRLIEntity(BaseEntity):
                 raster_rli.file_id = new_file_id
                 raster_rli.extent_id = new_extent_id
                 session.commit()
+                cls._invalidate([raster_rli_id])
 
+    # Функция получения растровых РЛИ, чей экстент содержит точку (точная проверка по угловым точкам экстента)
+    @classmethod
+    def get_raster_rli_containing_point(cls, latitude, longitude, columns=None):
+        with cls.mutex.read_lock():
+            return ExtentEntity.query_containing_point(cls, latitude, longitude, columns).all()
 
-class TypeBindingMethodEntity(BaseEntity):
+    # Функция получения растровых РЛИ, чей экстент пересекает прямоугольник широт/долгот
+    @classmethod
+    def get_raster_rli_intersecting_box(cls, min_latitude, max_latitude, min_longitude, max_longitude, columns=None):
+        with cls.mutex.read_lock():
+            return ExtentEntity.query_footprints(cls, min_latitude, max_latitude, min_longitude, max_longitude,
+                                                 columns).all()
+
+    # Запрос id растровых РЛИ сессии: растровое РЛИ -> файл с соответствующим session_id
+    @classmethod
+    def query_ids_by_session_id(cls, session_id):
+        return session.query(cls.id).\
+            join(FileEntity, cls.file_id == FileEntity.id).\
+            filter(FileEntity.session_id == session_id)
+
+
+class TypeBindingMethodEntity(LookupEntity):
     __tablename__ = 'type_binding_method'
 
     name = Column(String, nullable=False)
@@ -405,8 +1422,15 @@ class TypeBindingMethodEntity(BaseEntity):
             new_type_binding_method = cls(name=name)
             session.add(new_type_binding_method)
             session.commit()
+            cls._invalidate([new_type_binding_method.id])
             return new_type_binding_method.id
 
+    # Функция для пакетного создания объектов TypeBindingMethodEntity одной транзакцией,
+    # type_binding_methods - наименования; возвращает id в порядке следования
+    @classmethod
+    def create_type_binding_method_many(cls, type_binding_methods):
+        return cls._bulk_insert({'name': name} for name in type_binding_methods)
+
     # Функция для удаления объекта TypeBindingMethodEntity по id
     @classmethod
     def delete_type_binding_method(cls, type_binding_method_id):
@@ -415,6 +1439,7 @@ class TypeBindingMethodEntity(BaseEntity):
             if type_binding_method:
                 session.delete(type_binding_method)
                 session.commit()
+                cls._invalidate([type_binding_method_id])
 
     # Функция для изменения объекта TypeBindingMethodEntity по id
     @classmethod
@@ -424,16 +1449,17 @@ class TypeBindingMethodEntity(BaseEntity):
             if type_binding_method:
                 type_binding_method.name = new_name
                 session.commit()
+                cls._invalidate([type_binding_method_id])
 
 
 class LinkedRLIEntity(BaseEntity):
     __tablename__ = 'linked_rli'
 
-    raster_rli_id = Column(Integer, ForeignKey('raster_rli.id', ondelete='CASCADE'))
+    raster_rli_id = Column(Integer, ForeignKey('raster_rli.id', ondelete='CASCADE'), index=True)
     raster_rli = relationship('RasterRLIEntity')
-    file_id = Column(Integer, ForeignKey('file.id', ondelete='CASCADE'))
+    file_id = Column(Integer, ForeignKey('file.id', ondelete='CASCADE'), index=True)
     file = relationship('FileEntity')
-    extent_id = Column(Integer, ForeignKey('extent.id', ondelete='CASCADE'))
+    extent_id = Column(Integer, ForeignKey('extent.id', ondelete='CASCADE'), index=True)
     extent = relationship('ExtentEntity')
     binding_attempt_number = Column(Integer)
     type_binding_method_id = Column(Integer, ForeignKey('type_binding_method.id', ondelete='CASCADE'))
@@ -450,6 +1476,17 @@ class LinkedRLIEntity(BaseEntity):
             session.commit()
             return new_linked_rli.id
 
+    # Функция для пакетного создания объектов LinkedRLIEntity одной транзакцией,
+    # linked_rlis - кортежи (raster_rli_id, file_id, extent_id,
+    # binding_attempt_number, type_binding_method_id); возвращает id в порядке следования
+    @classmethod
+    def create_linked_rli_many(cls, linked_rlis):
+        return cls._bulk_insert({'raster_rli_id': raster_rli_id, 'file_id': file_id, 'extent_id': extent_id,
+                                 'binding_attempt_number': binding_attempt_number,
+                                 'type_binding_method_id': type_binding_method_id}
+                                for raster_rli_id, file_id, extent_id, binding_attempt_number,
+                                type_binding_method_id in linked_rlis)
+
     # Функция для удаления объекта LinkedRLIEntity по id
     @classmethod
     def delete_linked_rli(cls, linked_rli_id):
@@ -458,6 +1495,7 @@ class LinkedRLIEntity(BaseEntity):
             if linked_rli:
                 session.delete(linked_rli)
                 session.commit()
+                cls._invalidate([linked_rli_id])
 
     # Функция для изменения объекта LinkedRLIEntity по id
     @classmethod
@@ -472,26 +1510,48 @@ class LinkedRLIEntity(BaseEntity):
                 linked_rli.binding_attempt_number = new_binding_attempt_number
                 linked_rli.type_binding_method_id = new_type_binding_method_id
                 session.commit()
+                cls._invalidate([linked_rli_id])
+
+    # Функция получения привязанных РЛИ, чей экстент содержит точку (точная проверка по угловым точкам экстента)
+    @classmethod
+    def get_linked_rli_containing_point(cls, latitude, longitude, columns=None):
+        with cls.mutex.read_lock():
+            return ExtentEntity.query_containing_point(cls, latitude, longitude, columns).all()
+
+    # Функция получения привязанных РЛИ, чей экстент пересекает прямоугольник широт/долгот
+    @classmethod
+    def get_linked_rli_intersecting_box(cls, min_latitude, max_latitude, min_longitude, max_longitude, columns=None):
+        with cls.mutex.read_lock():
+            return ExtentEntity.query_footprints(cls, min_latitude, max_latitude, min_longitude, max_longitude,
+                                                 columns).all()
 
     # Функция для получения привязанных РЛИ в сессии
     @classmethod
-    def get_linked_rli_by_session_id(cls, session_id):
-        with cls.mutex:
-            # Выбираем id файлов с соответствующим session_id
-            ids_of_files_with_session_id = list(map(lambda x: x.id, session.query(FileEntity).
-                                                    filter_by(session_id=session_id).all()))
+    def get_linked_rli_by_session_id(cls, session_id, columns=None):
+        with cls.mutex.read_lock():
+            return cls.query_linked_rli_by_session_id(session_id, columns).all()
 
-            # Возвращаем соответствующие LinkedRLIs по file_id
-            return session.query(cls).filter(cls.file_id.in_(ids_of_files_with_session_id)).all()
+    # Запрос привязанных РЛИ сессии одним JOIN: привязанное РЛИ -> файл с соответствующим session_id
+    @classmethod
+    def query_linked_rli_by_session_id(cls, session_id, columns=None):
+        return cls._query_columns(columns).\
+            join(FileEntity, cls.file_id == FileEntity.id).\
+            filter(FileEntity.session_id == session_id).\
+            order_by(cls.id)
+
+    # Запрос id привязанных РЛИ сессии
+    @classmethod
+    def query_ids_by_session_id(cls, session_id):
+        return cls.query_linked_rli_by_session_id(session_id, ['id'])
 
 
 class MarkEntity(BaseEntity):
     __tablename__ = 'mark'
 
-    coordinates_id = Column(Integer, ForeignKey('coordinates.id', ondelete='CASCADE'))
+    coordinates_id = Column(Integer, ForeignKey('coordinates.id', ondelete='CASCADE'), index=True)
     coordinates = relationship('CoordinatesEntity')
     datetime = Column(TIMESTAMP, nullable=False)
-    session_id = Column(Integer, ForeignKey('session.id', ondelete='CASCADE'))
+    session_id = Column(Integer, ForeignKey('session.id', ondelete='CASCADE'), index=True)
     session = relationship('SessionEntity')
 
     # Функция для создания объекта MarkEntity
@@ -503,6 +1563,16 @@ class MarkEntity(BaseEntity):
             session.commit()
             return new_mark.id
 
+    # Функция для пакетного создания объектов MarkEntity одной транзакцией,
+    # marks - кортежи (coordinates_id, session_id[, datetime]), без времени - текущее;
+    # возвращает id в порядке следования
+    @classmethod
+    def create_mark_many(cls, marks):
+        now = datetime.now()
+        return cls._bulk_insert({'coordinates_id': coordinates_id,
+                                 'datetime': mark_datetime[0] if mark_datetime else now, 'session_id': session_id}
+                                for coordinates_id, session_id, *mark_datetime in marks)
+
     # Функция для удаления объекта MarkEntity по id
     @classmethod
     def delete_mark(cls, mark_id):
@@ -511,6 +1581,7 @@ class MarkEntity(BaseEntity):
             if mark:
                 session.delete(mark)
                 session.commit()
+                cls._invalidate([mark_id])
 
     # Функция для изменения объекта MarkEntity по id
     @classmethod
@@ -522,20 +1593,66 @@ class MarkEntity(BaseEntity):
                 mark.datetime = datetime.now()
                 mark.session_id = new_session_id
                 session.commit()
+                cls._invalidate([mark_id])
 
     # Функция получения отметок
     @classmethod
     def get_all_marks(cls):
-        with cls.mutex:
+        with cls.mutex.read_lock():
             return session.query(cls).all()
 
+    # Генератор отметок постранично, без загрузки всей таблицы
+    @classmethod
+    def iter_all_marks(cls, page_size=None):
+        return cls._iter_all(page_size)
+
     # Функция получения отметок сессии
     @classmethod
     def get_marks_by_session_id(cls, session_id):
-        return session.query(cls).filter(cls.session_id == session_id).all()
+        with cls.mutex.read_lock():
+            return cls.query_marks_by_session_id(session_id).all()
 
+    # Запрос отметок сессии
+    @classmethod
+    def query_marks_by_session_id(cls, session_id, columns=None):
+        return cls._query_columns(columns).filter(cls.session_id == session_id)
 
-class RelatingObjectEntity(BaseEntity):
+    # Функция получения отметок в прямоугольнике широт/долгот, опционально за интервал времени и в сессии
+    @classmethod
+    def get_marks_in_box(cls, min_latitude, max_latitude, min_longitude, max_longitude,
+                         start=None, end=None, session_id=None, columns=None):
+        with cls.mutex.read_lock():
+            return cls.query_marks_in_box(min_latitude, max_latitude, min_longitude, max_longitude,
+                                          start, end, session_id, columns).all()
+
+    # Запрос отметок в прямоугольнике: кандидаты отбираются по R*Tree, затем уточняются по точным координатам
+    # (R*Tree хранит границы в float32 с округлением наружу)
+    @classmethod
+    def query_marks_in_box(cls, min_latitude, max_latitude, min_longitude, max_longitude,
+                           start=None, end=None, session_id=None, columns=None):
+        query = cls._query_columns(columns).\
+            join(coordinates_rtree, coordinates_rtree.c.id == cls.coordinates_id).\
+            join(CoordinatesEntity, CoordinatesEntity.id == cls.coordinates_id).\
+            filter(coordinates_rtree.c.max_latitude >= min_latitude, coordinates_rtree.c.min_latitude <= max_latitude,
+                   coordinates_rtree.c.max_longitude >= min_longitude,
+                   coordinates_rtree.c.min_longitude <= max_longitude,
+                   CoordinatesEntity.latitude.between(min_latitude, max_latitude),
+                   CoordinatesEntity.longitude.between(min_longitude, max_longitude))
+        if start is not None:
+            query = query.filter(cls.datetime >= start)
+        if end is not None:
+            query = query.filter(cls.datetime <= end)
+        if session_id is not None:
+            query = query.filter(cls.session_id == session_id)
+        return query.order_by(cls.id)
+
+    # Запрос id отметок сессии
+    @classmethod
+    def query_ids_by_session_id(cls, session_id):
+        return cls.query_marks_by_session_id(session_id, ['id'])
+
+
+class RelatingObjectEntity(LookupEntity):
     __tablename__ = 'relating_object'
 
     type_relating = Column(Integer, nullable=False)
@@ -548,8 +1665,16 @@ class RelatingObjectEntity(BaseEntity):
             new_relating_object = cls(type_relating=type_relating, name=name)
             session.add(new_relating_object)
             session.commit()
+            cls._invalidate([new_relating_object.id])
             return new_relating_object.id
 
+    # Функция для пакетного создания объектов RelatingObjectEntity одной транзакцией,
+    # relating_objects - кортежи (type_relating, name); возвращает id в порядке следования
+    @classmethod
+    def create_relating_object_many(cls, relating_objects):
+        return cls._bulk_insert({'type_relating': type_relating, 'name': name}
+                                for type_relating, name in relating_objects)
+
     # Функция для удаления объекта RelatingObjectEntity по id
     @classmethod
     def delete_relating_object(cls, relating_object_id):
@@ -558,6 +1683,7 @@ class RelatingObjectEntity(BaseEntity):
             if relating_object:
                 session.delete(relating_object)
                 session.commit()
+                cls._invalidate([relating_object_id])
 
     # Функция для изменения объекта RelatingObjectEntity по id
     @classmethod
@@ -568,12 +1694,46 @@ class RelatingObjectEntity(BaseEntity):
                 relating_object.type_relating = new_type_relating
                 relating_object.name = new_name
                 session.commit()
+                cls._invalidate([relating_object_id])
+
+
+# Ключи ObjectEntity.meta с индексом: {путь JSON: тип SQLAlchemy}. Для каждого ключа init_db создает
+# генерируемую колонку meta_<путь> = json_extract(meta, '$.<путь>') (VIRTUAL - вычисляется при чтении,
+# места в строке не занимает) и индекс по ней. Выборки по этим ключам идут по индексу, по остальным -
+# полным просмотром с json_extract
+META_INDEXES = {
+    'class': String,
+    'speed': Float,
+}
+
+# Операторы условий выборки по meta: {путь: (оператор, значение)}
+META_OPERATORS = {
+    '=': lambda value, operand: value == operand,
+    '!=': lambda value, operand: value != operand,
+    '<': lambda value, operand: value < operand,
+    '<=': lambda value, operand: value <= operand,
+    '>': lambda value, operand: value > operand,
+    '>=': lambda value, operand: value >= operand,
+    'in': lambda value, operand: value.in_(operand),
+    'between': lambda value, operand: value.between(*operand),
+}
+
+
+# Функция получения имени генерируемой колонки ключа meta: 'class' -> meta_class, 'sensor.mode' -> meta_sensor_mode.
+# Путь - имена через точку, он подставляется в DDL, поэтому другие символы не допускаются
+def meta_column_name(path):
+    if not re.fullmatch(r'[A-Za-z_]\w*(\.[A-Za-z_]\w*)*', path):
+        raise ValueError('Unsupported meta path {!r}'.format(path))
+    return 'meta_' + path.replace('.', '_')
 
 
 class ObjectEntity(BaseEntity):
     __tablename__ = 'object'
 
-    mark_id = Column(Integer, ForeignKey('mark.id', ondelete='CASCADE'))
+    # Кэш имен колонок таблицы в базе (table_columns)
+    _table_columns = None
+
+    mark_id = Column(Integer, ForeignKey('mark.id', ondelete='CASCADE'), index=True)
     mark = relationship('MarkEntity')
     name = Column(String)
     type = Column(String)
@@ -591,6 +1751,14 @@ class ObjectEntity(BaseEntity):
             session.commit()
             return new_object.id
 
+    # Функция для пакетного создания объектов ObjectEntity одной транзакцией,
+    # objects - кортежи (mark_id, name, object_type, relating_object_id, meta); возвращает id в порядке следования
+    @classmethod
+    def create_object_many(cls, objects):
+        return cls._bulk_insert({'mark_id': mark_id, 'name': name, 'type': object_type,
+                                 'relating_object_id': relating_object_id, 'meta': meta}
+                                for mark_id, name, object_type, relating_object_id, meta in objects)
+
     # Функция для удаления объекта ObjectEntity по id
     @classmethod
     def delete_object(cls, object_id):
@@ -599,6 +1767,7 @@ class ObjectEntity(BaseEntity):
             if object_:
                 session.delete(object_)
                 session.commit()
+                cls._invalidate([object_id])
 
     # Функция для изменения объекта ObjectEntity по id
     @classmethod
@@ -612,15 +1781,74 @@ class ObjectEntity(BaseEntity):
                 object_.relating_object_id = new_relating_object_id
                 object_.meta = new_meta
                 session.commit()
+                cls._invalidate([object_id])
+
+    # Функция получения выражения значения meta по пути JSON ('class', 'sensor.mode', '$.speed'):
+    # генерируемая колонка для ключей META_INDEXES, если она есть в базе (indexed=False - всегда json_extract),
+    # иначе json_extract. В базе без migrate_meta_indexes выборки работают, но без индекса
+    @classmethod
+    def meta_value(cls, path, indexed=True):
+        path = path[2:] if path.startswith('$.') else path
+        if indexed and path in META_INDEXES and meta_column_name(path) in cls.table_columns():
+            return literal_column('{}.{}'.format(cls.__tablename__, meta_column_name(path)), META_INDEXES[path]())
+        return func.json_extract(cls.meta, '$.' + path)
+
+    # Функция получения имен колонок таблицы в базе, включая генерируемые (PRAGMA table_xinfo). Читаются
+    # один раз; сбрасываются при смене базы (configure_database) и после migrate_meta_indexes
+    @classmethod
+    def table_columns(cls):
+        if cls._table_columns is None:
+            cls._table_columns = frozenset(row.name for row in session.execute(
+                text('PRAGMA table_xinfo({})'.format(cls.__tablename__))))
+        return cls._table_columns
+
+    # Функция построения условий выборки по meta: filters - {путь: значение}, значение - константа (равенство),
+    # None (ключа нет или он null) или кортеж (оператор, операнд) с оператором из META_OPERATORS:
+    # {'class': 'ship', 'speed': ('>=', 100), 'course': ('between', (0, 90))}
+    @classmethod
+    def meta_conditions(cls, filters, indexed=True):
+        conditions = []
+        for path, operand in filters.items():
+            value = cls.meta_value(path, indexed)
+            if operand is None:
+                conditions.append(value.is_(None))
+            elif isinstance(operand, tuple):
+                operator, operand = operand
+                if operator not in META_OPERATORS:
+                    raise ValueError('Unsupported meta operator {!r}'.format(operator))
+                conditions.append(META_OPERATORS[operator](value, operand))
+            else:
+                conditions.append(value == operand)
+        return conditions
+
+    # Функция для получения объектов по значениям meta
+    @classmethod
+    def get_objects_by_meta(cls, filters, columns=None):
+        with cls.mutex.read_lock():
+            return cls.query_objects_by_meta(filters, columns).all()
+
+    # Запрос объектов по значениям meta (см. meta_conditions)
+    @classmethod
+    def query_objects_by_meta(cls, filters, columns=None, indexed=True):
+        return cls._query_columns(columns).\
+            filter(*cls.meta_conditions(filters, indexed)).\
+            order_by(cls.id)
+
+    # Запрос id объектов сессии: объект -> отметка с соответствующим session_id
+    @classmethod
+    def query_ids_by_session_id(cls, session_id):
+        return session.query(cls.id).\
+            join(MarkEntity, cls.mark_id == MarkEntity.id).\
+            filter(MarkEntity.session_id == session_id)
 
 
 class TargetEntity(BaseEntity):
     __tablename__ = 'target'
 
     number = Column(Integer, nullable=False)
-    object_id = Column(Integer, ForeignKey('object.id', ondelete='CASCADE'))
+    object_id = Column(Integer, ForeignKey('object.id', ondelete='CASCADE'), index=True)
     object = relationship('ObjectEntity')
-    raster_rli_id = Column(Integer, ForeignKey('raster_rli.id', ondelete='CASCADE'))
+    raster_rli_id = Column(Integer, ForeignKey('raster_rli.id', ondelete='CASCADE'), index=True)
     raster_rli = relationship('RasterRLIEntity')
     datetime_sending = Column(TIMESTAMP)
     sppr_type_key = Column(String)
@@ -635,6 +1863,17 @@ class TargetEntity(BaseEntity):
             session.commit()
             return new_target.id
 
+    # Функция для пакетного создания объектов TargetEntity одной транзакцией,
+    # targets - кортежи (number, object_id, raster_rli_id, sppr_type_key[, datetime_sending]), без времени -
+    # текущее; возвращает id в порядке следования
+    @classmethod
+    def create_target_many(cls, targets):
+        now = datetime.now()
+        return cls._bulk_insert({'number': number, 'object_id': object_id, 'raster_rli_id': raster_rli_id,
+                                 'datetime_sending': datetime_sending[0] if datetime_sending else now,
+                                 'sppr_type_key': sppr_type_key}
+                                for number, object_id, raster_rli_id, sppr_type_key, *datetime_sending in targets)
+
     # Функция для удаления объекта TargetEntity по id
     @classmethod
     def delete_target(cls, target_id):
@@ -643,6 +1882,7 @@ class TargetEntity(BaseEntity):
             if target:
                 session.delete(target)
                 session.commit()
+                cls._invalidate([target_id])
 
     # Функция для изменения объекта TargetEntity по id
     @classmethod
@@ -656,28 +1896,52 @@ class TargetEntity(BaseEntity):
                 target.datetime_sending = datetime.now()
                 target.sppr_type_key = new_sppr_type_key
                 session.commit()
+                cls._invalidate([target_id])
 
     # Функция для получения целей сессии
     @classmethod
-    def get_targets_by_session_id(cls, session_id):
-        with cls.mutex:
-            # Выбираем id файлов с соответствующим session_id
-            ids_of_files_with_session_id = list(map(lambda x: x.id, session.query(FileEntity).
-                                                    filter_by(session_id=session_id).all()))
+    def get_targets_by_session_id(cls, session_id, columns=None):
+        with cls.mutex.read_lock():
+            return cls.query_targets_by_session_id(session_id, columns).all()
 
-            # Выбираем id RasterRLIs по соответсвующим id файлов
-            raster_rli_ids_with_session_id = list(map(lambda x: x.id, session.query(RasterRLIEntity).
-                                                      filter(RasterRLIEntity.file_id.in_(ids_of_files_with_session_id)).
-                                                      all()))
+    # Запрос целей сессии одним JOIN: цель -> растровое РЛИ -> файл с соответствующим session_id
+    @classmethod
+    def query_targets_by_session_id(cls, session_id, columns=None):
+        return cls._query_columns(columns).\
+            join(RasterRLIEntity, cls.raster_rli_id == RasterRLIEntity.id).\
+            join(FileEntity, RasterRLIEntity.file_id == FileEntity.id).\
+            filter(FileEntity.session_id == session_id).\
+            order_by(cls.id)
+
+    # Функция для получения целей по значениям meta их объектов (всех сессий или сессии session_id)
+    @classmethod
+    def get_targets_by_object_meta(cls, filters, session_id=None, columns=None):
+        with cls.mutex.read_lock():
+            return cls.query_targets_by_object_meta(filters, session_id, columns).all()
 
-            # Возваращаем соответствующие Targets по id RasterRLIs
-            return session.query(cls).filter(cls.raster_rli_id.in_(raster_rli_ids_with_session_id)).all()
+    # Запрос целей по значениям meta объектов (см. ObjectEntity.meta_conditions): цель -> объект
+    @classmethod
+    def query_targets_by_object_meta(cls, filters, session_id=None, columns=None):
+        query = cls._query_columns(columns).\
+            join(ObjectEntity, cls.object_id == ObjectEntity.id).\
+            filter(*ObjectEntity.meta_conditions(filters))
+        if session_id is not None:
+            query = query.\
+                join(RasterRLIEntity, cls.raster_rli_id == RasterRLIEntity.id).\
+                join(FileEntity, RasterRLIEntity.file_id == FileEntity.id).\
+                filter(FileEntity.session_id == session_id)
+        return query.order_by(cls.id)
+
+    # Запрос id целей сессии
+    @classmethod
+    def query_ids_by_session_id(cls, session_id):
+        return cls.query_targets_by_session_id(session_id, ['id'])
 
 
 class RegionEntity(BaseEntity):
     __tablename__ = 'region'
 
-    extent_id = Column(Integer, ForeignKey('extent.id', ondelete='CASCADE'))
+    extent_id = Column(Integer, ForeignKey('extent.id', ondelete='CASCADE'), index=True)
     extent = relationship('ExtentEntity')
     name = Column(String)
 
@@ -690,6 +1954,12 @@ class RegionEntity(BaseEntity):
             session.commit()
             return new_region.id
 
+    # Функция для пакетного создания объектов RegionEntity одной транзакцией,
+    # regions - кортежи (extent_id, name); возвращает id в порядке следования
+    @classmethod
+    def create_region_many(cls, regions):
+        return cls._bulk_insert({'extent_id': extent_id, 'name': name} for extent_id, name in regions)
+
     # Функция для удаления объекта RegionEntity по id
     @classmethod
     def delete_region(cls, region_id):
@@ -698,6 +1968,7 @@ class RegionEntity(BaseEntity):
             if region_:
                 session.delete(region_)
                 session.commit()
+                cls._invalidate([region_id])
 
     # Функция для изменения объекта RegionEntity по id
     @classmethod
@@ -708,92 +1979,221 @@ class RegionEntity(BaseEntity):
                 region_.extent_id = new_extent_id
                 region_.name = new_name
                 session.commit()
+                cls._invalidate([region_id])
 
     # Функция получения регионов
     @classmethod
     def get_all_regions(cls):
-        with cls.mutex:
+        with cls.mutex.read_lock():
             return session.query(cls).all()
 
-
-# Создание таблиц
-Base.metadata.create_all(bind=engine)
-
-
-class XLSReportGeneratorBySessionId:
-    def __init__(self, session_id, output_dir='xls_report', filename='report.xls'):
+    # Генератор регионов постранично, без загрузки всей таблицы
+    @classmethod
+    def iter_all_regions(cls, page_size=None):
+        return cls._iter_all(page_size)
+
+
+# Функция получения статистики кэшей справочников: {имя сущности: hits/misses/invalidations/size}
+def lookup_cache_stats():
+    return {entity.__name__: entity.lookup_cache().stats()
+            for entity in (TypeSessionEntity, TypeSourceRLIEntity, TypeBindingMethodEntity, RelatingObjectEntity)}
+
+
+# Функция получения статистики кэшей get_by_id всех сущностей: {имя сущности: hits/misses/hit_rate/size/memory}
+def identity_cache_stats():
+    return {mapper.class_.__name__: mapper.class_.identity_cache().stats()
+            for mapper in sorted(Base.registry.mappers, key=lambda mapper: mapper.class_.__name__)}
+
+
+# Функция миграции существующей базы: добавляет объявленные в моделях индексы, которых нет в файле БД,
+# и пространственные индексы координат и экстентов.
+# Повторный запуск ничего не меняет
+def migrate_indexes():
+    created = []
+    with BaseEntity.mutex:
+        existing = {name for name, in session.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+        session.commit()
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(bind=get_engine())
+                    created.append(index.name)
+        with get_engine().begin() as connection:
+            create_coordinates_rtree(connection)
+            create_extent_rtree(connection)
+    return created
+
+
+# Функция миграции существующей базы: добавляет в таблицы объявленные в моделях колонки, которых нет
+# в файле БД (ALTER TABLE ... ADD COLUMN, значения NULL). Повторный запуск ничего не меняет.
+# Возвращает имена добавленных колонок
+def migrate_columns():
+    added = []
+    with BaseEntity.mutex:
+        with get_engine(check_schema=False).begin() as connection:
+            for table, column in missing_columns(connection):
+                connection.execute(text('ALTER TABLE {} ADD COLUMN {} {}'.format(
+                    table, column.name, column.type.compile(dialect=connection.dialect))))
+                added.append('{}.{}'.format(table, column.name))
+    return added
+
+
+# Функция получения объявленных в моделях колонок, которых нет в существующих таблицах базы:
+# [(имя таблицы, колонка)]. Отсутствующие таблицы не учитываются, их создает init_db
+def missing_columns(connection):
+    missing = []
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        missing.extend((table.name, column) for column in table.columns if column.name not in existing)
+    return missing
+
+
+# Функция миграции существующей базы: добавляет генерируемые колонки и индексы ключей META_INDEXES,
+# которых нет в таблице object. Ключ, удаленный из META_INDEXES, остается в базе до ручного удаления.
+# Возвращает имена добавленных колонок и индексов
+def migrate_meta_indexes():
+    created = []
+    with BaseEntity.mutex:
+        with get_engine().begin() as connection:
+            table = ObjectEntity.__tablename__
+            columns = {row.name for row in connection.execute(text('PRAGMA table_xinfo({})'.format(table)))}
+            indexes = {name for name, in connection.execute(
+                text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+            for path, type_ in META_INDEXES.items():
+                column = meta_column_name(path)
+                if column not in columns:
+                    connection.execute(text("ALTER TABLE {} ADD COLUMN {} {} GENERATED ALWAYS AS "
+                                            "(json_extract(meta, '$.{}')) VIRTUAL".format(
+                                                table, column, type_().compile(dialect=connection.dialect), path)))
+                    created.append('{}.{}'.format(table, column))
+                index = 'ix_{}_{}'.format(table, column)
+                if index not in indexes:
+                    connection.execute(text('CREATE INDEX {} ON {} ({})'.format(index, table, column)))
+                    created.append(index)
+        ObjectEntity._table_columns = None
+    return created
+
+
+# Функция инициализации базы: создает отсутствующие таблицы, колонки, индексы и пространственные индексы.
+# Импорт модуля базу не изменяет, поэтому init_db вызывается явно перед работой с новой базой
+# и после обновления моделей. Возвращает имена колонок и индексов, добавленных в существующие таблицы
+def init_db():
+    Base.metadata.create_all(bind=get_engine(check_schema=False))
+    return migrate_columns() + migrate_indexes() + migrate_meta_indexes()
+
+
+# Функция получения плана выполнения запроса SQLite
+def get_query_plan(query):
+    statement = query.statement.compile(get_engine(), compile_kwargs={'literal_binds': True})
+    return [row.detail for row in session.execute(text('EXPLAIN QUERY PLAN ' + str(statement)))]
+
+
+# Функция проверки, что выборки по сессии используют индексы, а не полный просмотр таблиц.
+# Возвращает словарь {имя запроса: план}, при полном просмотре выбрасывает RuntimeError со всеми такими запросами
+def check_query_plans(session_id=1):
+    plans = {
+        'RLIEntity.get_rli_by_session_id': get_query_plan(RLIEntity.query_rli_by_session_id(session_id)),
+        'LinkedRLIEntity.get_linked_rli_by_session_id':
+            get_query_plan(LinkedRLIEntity.query_linked_rli_by_session_id(session_id)),
+        'TargetEntity.get_targets_by_session_id':
+            get_query_plan(TargetEntity.query_targets_by_session_id(session_id)),
+        'MarkEntity.get_marks_by_session_id': get_query_plan(MarkEntity.query_marks_by_session_id(session_id)),
+        'MarkEntity.get_marks_in_box': get_query_plan(MarkEntity.query_marks_in_box(0, 1, 0, 1)),
+        'RasterRLIEntity.get_raster_rli_containing_point':
+            get_query_plan(ExtentEntity.query_containing_point(RasterRLIEntity, 0, 0)),
+    }
+    full_scans = []
+    for name, plan in plans.items():
+        # Обход виртуальной таблицы R*Tree с ограничениями (VIRTUAL TABLE INDEX) - это поиск по индексу
+        scans = [step for step in plan
+                 if step.startswith('SCAN') and 'USING' not in step and 'VIRTUAL TABLE' not in step]
+        if scans:
+            full_scans.append('{} uses full table scan: {}'.format(name, '; '.join(scans)))
+    if full_scans:
+        raise RuntimeError('\n'.join(full_scans))
+    return plans
+
+
+# Описание отчета по сессии, не зависящее от формата файла: колонки листов и запросы их строк
+class ReportBySessionId:
+    raw_rli_sheet_name = 'Отчет по сырому РЛИ за сессию'
+    targets_sheet_name = 'Отчет по целям за сессию'
+
+    def __init__(self, session_id, output_dir, filename):
         self.output_dir = output_dir
         self.session_id = session_id
         self.filename = filename
         self.create_directory()
         self.file_path = os.path.join(self.output_dir,
                                       self.filename.replace('.', '_with_session_id_' + str(self.session_id) + '.'))
+        self.watermark_path = self.file_path + '.watermark.json'
+        # Границы id строк листов, читаемых запросами листов: {наименование листа: (после id, до id включительно)}
+        self.row_bounds = {}
 
-        self.workbook = xlwt.Workbook()
-
-        self.center_alignment_style = xlwt.easyxf("align: horiz center, vert center; font: height 220;")
-        self.header_row_style = xlwt.easyxf('pattern: pattern solid, fore_colour light_green;'
-                                            'font: bold on, height 220;'
-                                            'align: horiz center, vert center;')
-
+        # Колонки читают значения из строк, заранее собранных одним JOIN-запросом на лист
         self.rli_columns = [
-            {'header': 'Индентификатор Сырого РЛИ', 'data_func': lambda data: data.id},
-            {'header': 'Идентификатор сессии', 'data_func': lambda data: self.session_id},
-            {'header': 'Идентификатор файла', 'data_func': lambda data: data.file_id},
-            {'header': 'Наименование файла', 'data_func': lambda data: session.query(FileEntity).
-                get(data.file_id).name},
-            {'header': 'Путь к файлу', 'data_func': lambda data: session.query(FileEntity).
-                get(data.file_id).path_to_file},
-            {'header': 'Расширение файла', 'data_func': lambda data: session.query(FileEntity).
-                get(data.file_id).file_extension},
-            {'header': 'Идентификатор типа источника', 'data_func': lambda data: data.type_source_rli_id},
-            {'header': 'Наименование типа источника', 'data_func': lambda data: session.query(TypeSourceRLIEntity).
-                get(data.type_source_rli_id).name},
-            {'header': 'Дата и время получения', 'data_func': lambda data: data.date_receiving}
+            {'header': 'Индентификатор Сырого РЛИ', 'field': 'raw_rli_id', 'type': 'int',
+             'data_func': lambda data: data.id},
+            {'header': 'Идентификатор сессии', 'field': 'session_id', 'type': 'int',
+             'data_func': lambda data: self.session_id},
+            {'header': 'Идентификатор файла', 'field': 'file_id', 'type': 'int',
+             'data_func': lambda data: data.file_id},
+            {'header': 'Наименование файла', 'field': 'file_name', 'type': 'str',
+             'data_func': lambda data: data.file_name},
+            {'header': 'Путь к файлу', 'field': 'path_to_file', 'type': 'str',
+             'data_func': lambda data: data.path_to_file},
+            {'header': 'Расширение файла', 'field': 'file_extension', 'type': 'str',
+             'data_func': lambda data: data.file_extension},
+            {'header': 'Идентификатор типа источника', 'field': 'type_source_rli_id', 'type': 'int',
+             'data_func': lambda data: data.type_source_rli_id},
+            {'header': 'Наименование типа источника', 'field': 'type_source_rli_name', 'type': 'str',
+             'data_func': lambda data: data.type_source_rli_name},
+            {'header': 'Дата и время получения', 'field': 'date_receiving', 'type': 'datetime',
+             'data_func': lambda data: data.date_receiving}
         ]
 
         self.targets_columns = [
-            {'header': 'Идентификатор цели', 'data_func': lambda data: data.id},
-            {'header': 'Идентификатор сессии', 'data_func': lambda data: self.session_id},
-            {'header': 'Номер цели', 'data_func': lambda data: data.number},
-            {'header': 'Идентификатор объекта', 'data_func': lambda data: data.object_id},
-            {'header': 'Идентификатор Отметки', 'data_func': lambda data: session.query(ObjectEntity).
-                get(data.object_id).mark_id},
-            {'header': 'Наименование объекта', 'data_func': lambda data: session.query(ObjectEntity).
-                get(data.object_id).name},
-            {'header': 'Тип объекта', 'data_func': lambda data: session.query(ObjectEntity).
-                get(data.object_id).type},
-            {'header': 'Принадлежность объекта (идентификатор)', 'data_func': lambda data: session.query(ObjectEntity).
-                get(data.object_id).relating_object_id},
-            {'header': 'Meta данные', 'data_func': lambda data: session.query(ObjectEntity).
-                get(data.object_id).meta},
-            {'header': 'Идентификатор РЛИ', 'data_func': lambda data: session.query(RLIEntity).
-                get(session.query(RasterRLIEntity).get(data.raster_rli_id).rli_id).id},
-            {'header': 'Время локации', 'data_func': lambda data: session.query(RLIEntity).
-                get(session.query(RasterRLIEntity).get(data.raster_rli_id).rli_id).time_location},
-            {'header': 'Наименование РЛИ', 'data_func': lambda data: session.query(RLIEntity).
-                get(session.query(RasterRLIEntity).get(data.raster_rli_id).rli_id).name},
-            {'header': 'Признак обработки', 'data_func': lambda data: session.query(RLIEntity).
-                get(session.query(RasterRLIEntity).get(data.raster_rli_id).rli_id).is_processing},
-            {'header': 'Идентификатор сырого РЛИ', 'data_func': lambda data: session.query(RLIEntity).
-                get(session.query(RasterRLIEntity).get(data.raster_rli_id).rli_id).raw_rli_id},
-            {'header': 'Дата и время отправки', 'data_func': lambda data: data.datetime_sending},
-            {'header': 'SPPR TYPE KEY', 'data_func': lambda data: data.sppr_type_key}
+            {'header': 'Идентификатор цели', 'field': 'target_id', 'type': 'int',
+             'data_func': lambda data: data.id},
+            {'header': 'Идентификатор сессии', 'field': 'session_id', 'type': 'int',
+             'data_func': lambda data: self.session_id},
+            {'header': 'Номер цели', 'field': 'number', 'type': 'int',
+             'data_func': lambda data: data.number},
+            {'header': 'Идентификатор объекта', 'field': 'object_id', 'type': 'int',
+             'data_func': lambda data: data.object_id},
+            {'header': 'Идентификатор Отметки', 'field': 'mark_id', 'type': 'int',
+             'data_func': lambda data: data.mark_id},
+            {'header': 'Наименование объекта', 'field': 'object_name', 'type': 'str',
+             'data_func': lambda data: data.object_name},
+            {'header': 'Тип объекта', 'field': 'object_type', 'type': 'str',
+             'data_func': lambda data: data.object_type},
+            {'header': 'Принадлежность объекта (идентификатор)', 'field': 'relating_object_id', 'type': 'int',
+             'data_func': lambda data: data.relating_object_id},
+            {'header': 'Meta данные', 'field': 'meta', 'type': 'json',
+             'data_func': lambda data: data.meta},
+            {'header': 'Идентификатор РЛИ', 'field': 'rli_id', 'type': 'int',
+             'data_func': lambda data: data.rli_id},
+            {'header': 'Время локации', 'field': 'time_location', 'type': 'datetime',
+             'data_func': lambda data: data.time_location},
+            {'header': 'Наименование РЛИ', 'field': 'rli_name', 'type': 'str',
+             'data_func': lambda data: data.rli_name},
+            {'header': 'Признак обработки', 'field': 'is_processing', 'type': 'bool',
+             'data_func': lambda data: data.is_processing},
+            {'header': 'Идентификатор сырого РЛИ', 'field': 'raw_rli_id', 'type': 'int',
+             'data_func': lambda data: data.raw_rli_id},
+            {'header': 'Дата и время отправки', 'field': 'datetime_sending', 'type': 'datetime',
+             'data_func': lambda data: data.datetime_sending},
+            {'header': 'SPPR TYPE KEY', 'field': 'sppr_type_key', 'type': 'str',
+             'data_func': lambda data: data.sppr_type_key}
         ]
 
-        self.generate_xls_report_raw_rli()
-        self.generate_xls_report_targets()
-
     def create_directory(self):
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
 
-    @staticmethod
-    def set_column_width(worksheet, column_index, value):
-        column_width = len(str(value)) * 300
-        if worksheet.col(column_index).width < column_width:
-            worksheet.col(column_index).width = column_width
-
     @staticmethod
     def format_bool(value):
         return 'Обработан' if value else 'Не обработан'
@@ -802,25 +2202,179 @@ class XLSReportGeneratorBySessionId:
     def format_datetime(value):
         return value.strftime("%Y-%m-%d %H:%M:%S")
 
-    def generate_xls_report_raw_rli(self):
-        worksheet = self.workbook.add_sheet('Отчет по сырому РЛИ за сессию')
+    @classmethod
+    def format_value(cls, value):
+        if isinstance(value, bool):
+            return cls.format_bool(value)
+        if isinstance(value, datetime):
+            return cls.format_datetime(value)
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, ensure_ascii=False)
+        return value
+
+    # Листы отчета: (наименование, колонки, функция построения запроса строк)
+    def sheets(self):
+        return [(self.raw_rli_sheet_name, self.rli_columns, self.query_raw_rli_data),
+                (self.targets_sheet_name, self.targets_columns, self.query_targets_data)]
+
+    # Колонки водяных знаков листов: {наименование листа: (колонка id строк листа, колонки времени строк)}
+    def watermark_columns(self):
+        return {self.raw_rli_sheet_name: (RawRLIEntity.id, [RawRLIEntity.date_receiving]),
+                self.targets_sheet_name: (TargetEntity.id, [TargetEntity.datetime_sending, RLIEntity.time_location])}
+
+    # Функция ограничения запроса листа границами id из row_bounds
+    def bound_query(self, sheet_name, query):
+        if sheet_name not in self.row_bounds:
+            return query
+        id_column = self.watermark_columns()[sheet_name][0]
+        after_id, upto_id = self.row_bounds[sheet_name]
+        if after_id is not None:
+            query = query.filter(id_column > after_id)
+        return query.filter(id_column <= (upto_id or 0))
+
+    # Водяной знак листа - агрегаты строк одним запросом: поля колонок, число строк, максимальный id, сумма id
+    # и максимальные значения колонок времени; upto_id - только строки с id не больше указанного
+    def sheet_watermark(self, sheet_name, columns, query_func, upto_id=None):
+        id_column, time_columns = self.watermark_columns()[sheet_name]
+        query = query_func()
+        if upto_id is not None:
+            query = query.filter(id_column <= upto_id)
+        count, max_id, id_sum, *max_times = query.order_by(None).\
+            with_entities(func.count(id_column), func.max(id_column), func.total(id_column),
+                          *[func.max(time_column) for time_column in time_columns]).\
+            one()
+        return {'columns': [column_info['field'] for column_info in columns], 'count': count, 'max_id': max_id,
+                'id_sum': id_sum, 'max_times': [value.isoformat() if value else None for value in max_times]}
+
+    def read_watermark(self):
+        try:
+            with open(self.watermark_path, encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    # Запись водяных знаков после успешной генерации: через временный файл, чтобы прерванная запись
+    # не оставила знак, не соответствующий отчету
+    def write_watermark(self, plan):
+        temporary_path = self.watermark_path + '.tmp'
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            json.dump({sheet_name: watermark for sheet_name, (_, watermark) in plan.items()}, file, indent=2,
+                      ensure_ascii=False)
+        os.replace(temporary_path, self.watermark_path)
+
+    # Функция сравнения водяных знаков листов с сохраненными (saved - None, если отчета еще нет).
+    # Возвращает {наименование листа: (действие, новый водяной знак)}; действие - 'skip' (лист не изменился),
+    # 'append' (добавились только строки с id больше прежнего максимума, прежние строки не изменились)
+    # или 'rebuild'. Изменение значений в строках без изменения id и времени (update_file, update_object,
+    # переименование справочника, update_where) не обнаруживается, поэтому отчеты по умолчанию строятся
+    # полностью, а incremental=True включается только для сессий, строки которых лишь добавляются.
+    # Задает границы id строк листов: до максимального id водяного знака, для 'append' - после прежнего
+    def plan_sheets(self, saved):
+        plan = {}
+        for sheet_name, columns, query_func in self.sheets():
+            watermark = self.sheet_watermark(sheet_name, columns, query_func)
+            previous = (saved or {}).get(sheet_name)
+            if previous is None or previous['columns'] != watermark['columns']:
+                action = 'rebuild'
+            elif previous == watermark:
+                action = 'skip'
+            elif watermark['count'] > previous['count'] and \
+                    self.sheet_watermark(sheet_name, columns, query_func, previous['max_id'] or 0) == previous:
+                action = 'append'
+            else:
+                action = 'rebuild'
+            plan[sheet_name] = (action, watermark)
+            self.row_bounds[sheet_name] = (previous['max_id'] if action == 'append' else None, watermark['max_id'])
+        return plan
+
+    # Функция подготовки инкрементальной генерации отчета одним файлом, который нельзя дописать:
+    # план листов (None без incremental), все листы читаются целиком до максимального id водяного знака
+    def plan_report(self, incremental):
+        if not incremental:
+            return None
+        plan = self.plan_sheets(self.read_watermark() if os.path.exists(self.file_path) else None)
+        for sheet_name, (_, upto_id) in self.row_bounds.items():
+            self.row_bounds[sheet_name] = (None, upto_id)
+        return plan
 
-        list_of_raw_rli = self.get_raw_rli_data()
+    @staticmethod
+    def is_up_to_date(plan):
+        return plan is not None and all(action == 'skip' for action, _ in plan.values())
 
-        self.write_header_row(worksheet, self.rli_columns)
+    def get_raw_rli_data(self):
+        return self.query_raw_rli_data().all()
+
+    # Запрос строк листа сырого РЛИ: сырое РЛИ + файл + тип источника одним JOIN
+    def query_raw_rli_data(self):
+        query = session.query(RawRLIEntity.id, RawRLIEntity.file_id, FileEntity.name.label('file_name'),
+                              FileEntity.path_to_file, FileEntity.file_extension, RawRLIEntity.type_source_rli_id,
+                              TypeSourceRLIEntity.name.label('type_source_rli_name'), RawRLIEntity.date_receiving).\
+            join(FileEntity, RawRLIEntity.file_id == FileEntity.id).\
+            outerjoin(TypeSourceRLIEntity, RawRLIEntity.type_source_rli_id == TypeSourceRLIEntity.id).\
+            filter(FileEntity.session_id == self.session_id).\
+            order_by(RawRLIEntity.id)
+        return self.bound_query(self.raw_rli_sheet_name, query)
+
+    def get_targets_data(self):
+        return self.query_targets_data().all()
+
+    # Запрос строк листа целей: цель + объект + растровое РЛИ + РЛИ одним JOIN
+    def query_targets_data(self):
+        query = session.query(TargetEntity.id, TargetEntity.number, TargetEntity.object_id, ObjectEntity.mark_id,
+                              ObjectEntity.name.label('object_name'), ObjectEntity.type.label('object_type'),
+                              ObjectEntity.relating_object_id, ObjectEntity.meta, RLIEntity.id.label('rli_id'),
+                              RLIEntity.time_location, RLIEntity.name.label('rli_name'), RLIEntity.is_processing,
+                              RLIEntity.raw_rli_id, TargetEntity.datetime_sending, TargetEntity.sppr_type_key).\
+            join(RasterRLIEntity, TargetEntity.raster_rli_id == RasterRLIEntity.id).\
+            join(FileEntity, RasterRLIEntity.file_id == FileEntity.id).\
+            outerjoin(ObjectEntity, TargetEntity.object_id == ObjectEntity.id).\
+            outerjoin(RLIEntity, RasterRLIEntity.rli_id == RLIEntity.id).\
+            filter(FileEntity.session_id == self.session_id).\
+            order_by(TargetEntity.id)
+        return self.bound_query(self.targets_sheet_name, query)
+
+
+class XLSReportGeneratorBySessionId(ReportBySessionId):
+    def __init__(self, session_id, output_dir='xls_report', filename='report.xls', incremental=False):
+        super().__init__(session_id, output_dir, filename)
+
+        # XLS-файл не дописывается: при incremental, если листы не изменились с прошлого отчета,
+        # он не перегенерируется
+        plan = self.plan_report(incremental)
+        if self.is_up_to_date(plan):
+            print('XLS report is up to date at {}'.format(self.file_path))
+            return
 
-        for row_index, raw_rli_data in enumerate(list_of_raw_rli):
-            self.write_data_rli_row(worksheet, row_index + 1, raw_rli_data)
+        self.workbook = xlwt.Workbook()
+
+        self.center_alignment_style = xlwt.easyxf("align: horiz center, vert center; font: height 220;")
+        self.header_row_style = xlwt.easyxf('pattern: pattern solid, fore_colour light_green;'
+                                            'font: bold on, height 220;'
+                                            'align: horiz center, vert center;')
+
+        self.generate_xls_report_raw_rli()
+        self.generate_xls_report_targets()
 
         self.workbook.save(self.file_path)
+        if plan:
+            self.write_watermark(plan)
         print('XLS report generated at {}'.format(self.file_path))
 
-    def get_raw_rli_data(self):
-        ids_of_files_with_session_id = [
-            x.id for x in session.query(FileEntity).filter_by(session_id=self.session_id).all()
-        ]
+    @staticmethod
+    def set_column_width(worksheet, column_index, value):
+        column_width = len(str(value)) * 300
+        if worksheet.col(column_index).width < column_width:
+            worksheet.col(column_index).width = column_width
 
-        return session.query(RawRLIEntity).filter(RawRLIEntity.file_id.in_(ids_of_files_with_session_id)).all()
+    def generate_xls_report_raw_rli(self):
+        worksheet = self.workbook.add_sheet(self.raw_rli_sheet_name)
+
+        list_of_raw_rli = self.get_raw_rli_data()
+
+        self.write_header_row(worksheet, self.rli_columns)
+
+        for row_index, raw_rli_data in enumerate(list_of_raw_rli):
+            self.write_data_rli_row(worksheet, row_index + 1, raw_rli_data)
 
     def write_header_row(self, worksheet, columns):
         for column_index, column_info in enumerate(columns):
@@ -830,38 +2384,352 @@ class XLSReportGeneratorBySessionId:
 
     def write_data_rli_row(self, worksheet, row_index, raw_rli_data):
         for column_index, column_info in enumerate(self.rli_columns):
-            value = column_info['data_func'](raw_rli_data)
-            if isinstance(value, datetime):
-                value = self.format_datetime(value)
+            value = self.format_value(column_info['data_func'](raw_rli_data))
             worksheet.write(row_index, column_index, value, self.center_alignment_style)
             self.set_column_width(worksheet, column_index, value)
 
     def generate_xls_report_targets(self):
-        worksheet = self.workbook.add_sheet('Отчет по целям за сессию')
+        worksheet = self.workbook.add_sheet(self.targets_sheet_name)
 
-        list_of_targets = TargetEntity.get_targets_by_session_id(self.session_id)
+        list_of_targets = self.get_targets_data()
 
         self.write_header_row(worksheet, self.targets_columns)
 
         for row_index, target_data in enumerate(list_of_targets):
             self.write_data_target_row(worksheet, row_index + 1, target_data)
 
-        self.workbook.save(self.file_path)
-        print('XLS report generated at {}'.format(self.file_path))
-
     def write_data_target_row(self, worksheet, row_index, target_data):
         for column_index, column_info in enumerate(self.targets_columns):
-            value = column_info['data_func'](target_data)
-            if isinstance(value, bool):
-                value = self.format_bool(value)
-            elif isinstance(value, datetime):
-                value = self.format_datetime(value)
-
+            value = self.format_value(column_info['data_func'](target_data))
             worksheet.write(row_index, column_index, value, self.center_alignment_style)
             self.set_column_width(worksheet, column_index, value)
 
 
-report_generator = XLSReportGeneratorBySessionId(session_id=1)
+# Потоковый генератор отчета в формате XLSX. Строки читаются из курсора БД пачками и сразу уходят
+# во временные файлы xlsxwriter (режим constant_memory), поэтому расход памяти не зависит от размера сессии.
+# Лист, превысивший лимит строк XLSX, продолжается на листе "<наименование> (2)" и т.д.; файл пишется один раз
+class XLSXReportGeneratorBySessionId(ReportBySessionId):
+    max_rows_per_sheet = 1048576
+    fetch_size = 1000
+
+    def __init__(self, session_id, output_dir='xls_report', filename='report.xlsx', incremental=False):
+        import xlsxwriter
+
+        super().__init__(session_id, output_dir, filename)
+
+        plan = self.plan_report(incremental)
+        if self.is_up_to_date(plan):
+            print('XLSX report is up to date at {}'.format(self.file_path))
+            return
+
+        self.workbook = xlsxwriter.Workbook(self.file_path, {'constant_memory': True})
+
+        self.center_alignment_style = self.workbook.add_format({'align': 'center', 'valign': 'vcenter',
+                                                                'font_size': 11})
+        self.header_row_style = self.workbook.add_format({'bg_color': '#CCFFCC', 'bold': True, 'font_size': 11,
+                                                          'align': 'center', 'valign': 'vcenter'})
+
+        for sheet_name, columns, query in self.sheets():
+            self.generate_xlsx_sheet(sheet_name, columns, query())
+
+        self.workbook.close()
+        if plan:
+            self.write_watermark(plan)
+        print('XLSX report generated at {}'.format(self.file_path))
+
+    def add_worksheet(self, sheet_name, columns, part):
+        if part > 1:
+            # Наименование листа в Excel ограничено 31 символом
+            suffix = ' ({})'.format(part)
+            sheet_name = sheet_name[:31 - len(suffix)] + suffix
+        worksheet = self.workbook.add_worksheet(sheet_name)
+        for column_index, column_info in enumerate(columns):
+            worksheet.write(0, column_index, column_info['header'], self.header_row_style)
+        return worksheet
+
+    def generate_xlsx_sheet(self, sheet_name, columns, query):
+        # Ширины колонок копятся по всем строкам и выставляются в конце (в constant_memory это допустимо)
+        widths = [len(column_info['header']) for column_info in columns]
+        worksheets = [self.add_worksheet(sheet_name, columns, 1)]
+        row_index = 0
+
+        for data in query.yield_per(self.fetch_size):
+            row_index += 1
+            if row_index == self.max_rows_per_sheet:
+                worksheets.append(self.add_worksheet(sheet_name, columns, len(worksheets) + 1))
+                row_index = 1
+            for column_index, column_info in enumerate(columns):
+                value = self.format_value(column_info['data_func'](data))
+                worksheets[-1].write(row_index, column_index, value, self.center_alignment_style)
+                widths[column_index] = max(widths[column_index], len(str(value)))
+
+        # Ширина в тех же единицах, что и у XLS-отчета (300/256 символа на знак)
+        for worksheet in worksheets:
+            for column_index, width in enumerate(widths):
+                worksheet.set_column(column_index, column_index, width * 300 / 256)
+
+
+# Экспорт отчета по сессии для аналитики без оформления Excel: CSV, JSONL, Parquet или Arrow IPC.
+# Колонки те же, что у XLS-отчета; строки читаются из курсора пачками по batch_size и сразу дописываются
+# в файл, по одному файлу на лист (<filename>_with_session_id_<id>_raw_rli.<ext> и ..._targets.<ext>).
+# При incremental неизмененные листы пропускаются, в CSV и JSONL дописываются только новые строки,
+# Parquet и Arrow измененного листа строятся заново
+class ColumnarReportExporterBySessionId(ReportBySessionId):
+    extensions = {'csv': '.csv', 'jsonl': '.jsonl', 'parquet': '.parquet', 'arrow': '.arrow'}
+    appendable_formats = ('csv', 'jsonl')
+    sheet_keys = ('raw_rli', 'targets')
+    batch_size = 10000
+
+    def __init__(self, session_id, export_format='csv', output_dir='reports', filename='report',
+                 incremental=False):
+        super().__init__(session_id, output_dir, filename + self.extensions[export_format])
+        self.export_format = export_format
+        self.file_paths = ['{0}_{2}{1}'.format(*os.path.splitext(self.file_path), sheet_key)
+                           for sheet_key in self.sheet_keys]
+
+        plan = None
+        if incremental:
+            plan = self.plan_sheets(self.read_watermark() if all(map(os.path.exists, self.file_paths)) else None)
+
+        export = getattr(self, 'export_' + export_format)
+        for file_path, (sheet_name, columns, query) in zip(self.file_paths, self.sheets()):
+            action = plan[sheet_name][0] if plan else 'rebuild'
+            if action == 'skip':
+                print('{} export is up to date at {}'.format(export_format.upper(), file_path))
+                continue
+            if action == 'append' and export_format in self.appendable_formats:
+                export(file_path, columns, self.iter_batches(columns, query()), append=True)
+                print('{} export appended at {}'.format(export_format.upper(), file_path))
+                continue
+            if plan:
+                self.row_bounds[sheet_name] = (None, self.row_bounds[sheet_name][1])
+            export(file_path, columns, self.iter_batches(columns, query()))
+            print('{} export generated at {}'.format(export_format.upper(), file_path))
+
+        if plan:
+            self.write_watermark(plan)
+
+    # Пачки строк листа: значения колонок без форматирования, JSON-колонки сериализуются в строку
+    # (кроме JSONL, где они остаются вложенными объектами)
+    def iter_batches(self, columns, query):
+        rows = iter(query.yield_per(self.batch_size))
+        keep_json = self.export_format == 'jsonl'
+        json_columns = [column_info['type'] == 'json' and not keep_json for column_info in columns]
+        while True:
+            batch = []
+            for data in islice(rows, self.batch_size):
+                values = [column_info['data_func'](data) for column_info in columns]
+                batch.append([json.dumps(value, ensure_ascii=False) if is_json and value is not None else value
+                              for value, is_json in zip(values, json_columns)])
+            if not batch:
+                return
+            yield batch
+
+    @staticmethod
+    def export_csv(file_path, columns, batches, append=False):
+        with open(file_path, 'a' if append else 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            if not append:
+                writer.writerow([column_info['field'] for column_info in columns])
+            for batch in batches:
+                writer.writerows(batch)
+
+    @staticmethod
+    def export_jsonl(file_path, columns, batches, append=False):
+        fields = [column_info['field'] for column_info in columns]
+        with open(file_path, 'a' if append else 'w', encoding='utf-8') as file:
+            for batch in batches:
+                file.writelines(json.dumps(dict(zip(fields, row)), ensure_ascii=False, default=str) + '\n'
+                                for row in batch)
+
+    @staticmethod
+    def arrow_schema(columns):
+        import pyarrow
+
+        types = {'int': pyarrow.int64(), 'float': pyarrow.float64(), 'str': pyarrow.string(),
+                 'bool': pyarrow.bool_(), 'datetime': pyarrow.timestamp('us'), 'json': pyarrow.string()}
+        return pyarrow.schema([(column_info['field'], types[column_info['type']]) for column_info in columns])
+
+    @classmethod
+    def arrow_batches(cls, schema, batches):
+        import pyarrow
+
+        for batch in batches:
+            yield pyarrow.RecordBatch.from_arrays([pyarrow.array(values, type=field.type)
+                                                   for values, field in zip(zip(*batch), schema)], schema=schema)
+
+    @classmethod
+    def export_parquet(cls, file_path, columns, batches):
+        import pyarrow.parquet
+
+        schema = cls.arrow_schema(columns)
+        with pyarrow.parquet.ParquetWriter(file_path, schema) as writer:
+            for record_batch in cls.arrow_batches(schema, batches):
+                writer.write_batch(record_batch)
+
+    @classmethod
+    def export_arrow(cls, file_path, columns, batches):
+        import pyarrow
+
+        schema = cls.arrow_schema(columns)
+        with pyarrow.OSFile(file_path, 'wb') as sink, pyarrow.ipc.new_file(sink, schema) as writer:
+            for record_batch in cls.arrow_batches(schema, batches):
+                writer.write_batch(record_batch)
+
+
+# Функция параметров подключения текущего процесса (URL, параметры движка, профиль хранения) для передачи
+# процессам-обработчикам через initargs: при запуске spawn/forkserver они не наследуют configure_database родителя
+def _worker_initargs():
+    return _engine_url or os.environ.get('RLSDB_URL', DEFAULT_DATABASE_URL), _engine_options, storage_profile
+
+
+# Функция инициализации процесса-обработчика (отчетов, очереди РЛИ) параметрами из _worker_initargs: подключения,
+# унаследованные от родителя при fork, не используются, каждый процесс открывает собственные к той же базе
+def _init_worker_process(url, options, profile):
+    global _engine, storage_profile
+    if _engine is not None:
+        _engine.dispose(close=False)
+        _engine = None
+    session.registry.clear()
+    storage_profile = profile
+    configure_database(url, **options)
+
+
+# Функция генерации отчета по одной сессии в процессе-обработчике, ошибки возвращаются в результате
+def _generate_report(session_id, generator_class, output_dir):
+    start = time.perf_counter()
+    try:
+        report = generator_class(session_id, output_dir=output_dir)
+        return {'session_id': session_id, 'file_path': report.file_path, 'error': None,
+                'seconds': time.perf_counter() - start}
+    except Exception as e:
+        return {'session_id': session_id, 'file_path': None, 'error': repr(e),
+                'seconds': time.perf_counter() - start}
+    finally:
+        session.remove()
+
+
+# Функция пакетной генерации отчетов по списку сессий (или по всем сессиям, начиная с даты since)
+# в пуле процессов. Возвращает результаты по каждой сессии: путь к файлу, время генерации и ошибку
+def generate_reports(session_ids=None, since=None, generator_class=XLSReportGeneratorBySessionId,
+                     output_dir='xls_report', processes=None):
+    if session_ids is None:
+        with BaseEntity.mutex.read_lock():
+            query = session.query(SessionEntity.id)
+            if since is not None:
+                query = query.filter(SessionEntity.date >= since)
+            session_ids = [row.id for row in query.order_by(SessionEntity.id)]
+
+    with ProcessPoolExecutor(processes, initializer=_init_worker_process,
+                             initargs=_worker_initargs()) as executor:
+        return list(executor.map(_generate_report, session_ids, repeat(generator_class), repeat(output_dir)))
+
+
+# Функция измерения пропускной способности профилей хранения на временных базах с той же схемой:
+# вставки с фиксацией каждой строки, одна массовая вставка и чтения readers потоков во время записи.
+# Возвращает {профиль: {операция: в секунду, lock_errors: число ошибок "database is locked"}}
+def benchmark_storage_profiles(profiles=None, rows=2000, readers=4):
+    results = {}
+    for profile in profiles or STORAGE_PROFILES:
+        with tempfile.TemporaryDirectory() as directory:
+            bench_engine = create_engine('sqlite:///' + os.path.join(directory, 'benchmark.db'))
+            event.listen(bench_engine, 'connect',
+                         lambda dbapi_connection, connection_record, profile=profile:
+                         apply_storage_profile(dbapi_connection, profile))
+            Base.metadata.create_all(bind=bench_engine)
+            table = CoordinatesEntity.__table__
+            values = [{'latitude': 55.0 + i * 1e-5, 'longitude': 37.0 + i * 1e-5, 'altitude': 150.0}
+                      for i in range(rows)]
+            result = {}
+
+            start = time.perf_counter()
+            for row in values:
+                with bench_engine.begin() as connection:
+                    connection.execute(insert(table), row)
+            result['row_commits_per_second'] = rows / (time.perf_counter() - start)
+
+            start = time.perf_counter()
+            with bench_engine.begin() as connection:
+                connection.execute(insert(table), values * 10)
+            result['bulk_rows_per_second'] = rows * 10 / (time.perf_counter() - start)
+
+            # Читатели выполняют выборку по индексу R*Tree, пока писатель фиксирует строки по одной
+            writing = threading.Event()
+            reads, errors = [], []
+            box = text('SELECT count(*) FROM coordinates_rtree WHERE min_latitude >= 55 AND max_latitude <= 55.01 '
+                       'AND min_longitude >= 37 AND max_longitude <= 37.01')
+
+            def read():
+                count = 0
+                with bench_engine.connect() as connection:
+                    while writing.is_set():
+                        try:
+                            connection.execute(box).scalar()
+                            connection.rollback()
+                            count += 1
+                        except OperationalError as e:
+                            connection.rollback()
+                            if 'locked' not in str(e):
+                                raise
+                            errors.append(1)
+                reads.append(count)
+
+            writing.set()
+            threads = [threading.Thread(target=read) for _ in range(readers)]
+            for thread in threads:
+                thread.start()
+            start = time.perf_counter()
+            for row in values:
+                with bench_engine.begin() as connection:
+                    connection.execute(insert(table), row)
+            seconds = time.perf_counter() - start
+            writing.clear()
+            for thread in threads:
+                thread.join()
+            result['concurrent_row_commits_per_second'] = rows / seconds
+            result['concurrent_reads_per_second'] = sum(reads) / seconds
+            result['lock_errors'] = len(errors)
+            bench_engine.dispose()
+            results[profile] = result
+    return results
+
+
+if __name__ == '__main__':
+    # python main.py init - создать таблицы, колонки и индексы в новой (или дополнить существующую) базе RLSDB_URL
+    if sys.argv[1:2] == ['init']:
+        print('Created columns and indexes: {}'.format(', '.join(init_db()) or 'none'))
+    # python main.py migrate - добавить колонки и индексы в существующий RLSDB.db и проверить планы запросов
+    elif sys.argv[1:2] == ['migrate']:
+        print('Created columns and indexes: {}'.format(
+            ', '.join(migrate_columns() + migrate_indexes() + migrate_meta_indexes()) or 'none'))
+        for query_name, query_plan in check_query_plans().items():
+            print('{}: {}'.format(query_name, '; '.join(query_plan)))
+    # python main.py reports [session_id ...] - отчеты по указанным (или всем) сессиям в пуле процессов
+    elif sys.argv[1:2] == ['reports']:
+        batch_start = time.perf_counter()
+        results = generate_reports([int(session_id) for session_id in sys.argv[2:]] or None)
+        for result in results:
+            print('session {}: {:.2f} s {}'.format(result['session_id'], result['seconds'],
+                                                   result['error'] or '').rstrip())
+        print('{} reports, {} failed, {:.2f} s'.format(len(results), sum(1 for result in results if result['error']),
+                                                       time.perf_counter() - batch_start))
+    # python main.py incremental-vacuum - один раз перевести базу в auto_vacuum = INCREMENTAL (полный VACUUM,
+    # файл базы перезаписывается целиком), после чего retention возвращает освобожденное место постепенно
+    elif sys.argv[1:2] == ['incremental-vacuum']:
+        print('auto_vacuum = INCREMENTAL {}'.format('enabled' if enable_incremental_vacuum() else 'already enabled'))
+    # python main.py retention days - удалить сессии старше days дней и освободить место в файле базы
+    # (место освобождается, если база переведена в режим incremental-vacuum)
+    elif sys.argv[1:2] == ['retention']:
+        purged = SessionEntity.purge_sessions_before(datetime.now() - timedelta(days=int(sys.argv[2])))
+        print(', '.join('{} {}'.format(name, count) for name, count in purged.items()))
+    # python main.py profiles [rows] - пропускная способность профилей хранения на временных базах
+    elif sys.argv[1:2] == ['profiles']:
+        profile_rows = int(sys.argv[2]) if sys.argv[2:] else 2000
+        for profile_name, profile_result in benchmark_storage_profiles(rows=profile_rows).items():
+            print('{}: {}'.format(profile_name, ', '.join('{} {:.0f}'.format(name, value)
+                                                         for name, value in profile_result.items())))
+    else:
+        report_generator = XLSReportGeneratorBySessionId(session_id=1)
 
 # # Проверка работы методов
 #
@@ -0,0 +1,310 @@
+from collections import Counter
+from itertools import count
+import atexit
+import json
+import os
+import re
+import runpy
+import sys
+import threading
+import time
+import warnings
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Каталог проекта: операцией считается ближайший вызов функции или метода из модулей этого каталога
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Границы корзин гистограмм: длительность запроса в секундах и число запросов за вызов операции
+DURATION_BUCKETS = (0.0001, 0.001, 0.01, 0.1, 1.0)
+STATEMENTS_BUCKETS = (1, 2, 5, 10, 100)
+
+# Число почти одинаковых запросов за один вызов операции, после которого выдается предупреждение N+1
+REPEAT_THRESHOLD = 10
+
+# Вспомогательные классы, методы которых не считаются операциями: запрос относится к вызвавшему их методу
+HELPER_CLASSES = ('IdentityCache', 'LookupCache', 'ReadWriteLock')
+
+# Служебная локальная переменная, которой помечается кадр вызова операции (номер вызова)
+CALL_MARKER = '__sql_profile_call__'
+
+
+class NPlusOneWarning(RuntimeWarning):
+    pass
+
+
+# Функция приведения запроса к шаблону: списки параметров IN (?, ?, ...) любой длины, числовые литералы
+# и пробелы не различаются, поэтому запросы, отличающиеся только значениями, дают один шаблон
+def normalize_statement(statement):
+    statement = re.sub(r'\(\s*\?(\s*,\s*\?)*\s*\)', '(?)', statement)
+    statement = re.sub(r'\b\d+(\.\d+)?\b', '?', statement)
+    return ' '.join(statement.split())
+
+
+# Функция определения операции, выполнившей запрос: ближайший по стеку публичный метод или функция модулей
+# проекта (MarkEntity.get_marks_by_session_id, XLSReportGeneratorBySessionId.get_raw_rli_data).
+# Внутренние функции (_bulk_insert, _load_row), лямбды, генераторы и методы HELPER_CLASSES относятся
+# к вызвавшему их методу. Возвращает (имя операции, кадр ее вызова)
+def _find_operation():
+    frame = sys._getframe(2)
+    outer = None
+    while frame is not None:
+        code = frame.f_code
+        if os.path.dirname(os.path.abspath(code.co_filename)) == PROJECT_DIR and \
+                code.co_filename != __file__:
+            if not code.co_name.startswith(('_', '<')):
+                name = _operation_name(frame)
+                if not name.startswith(HELPER_CLASSES):
+                    return name, frame
+            if outer is None:
+                outer = frame
+        frame = frame.f_back
+    if outer is not None:
+        return '{}:{}'.format(os.path.basename(outer.f_code.co_filename), _operation_name(outer)), outer
+    return '<other>', None
+
+
+# Имя операции по классу, для которого она вызвана: унаследованный get_by_id сущности координат -
+# CoordinatesEntity.get_by_id, а не BaseEntity.get_by_id. Функции без cls/self - по имени функции
+# (co_qualname появился только в Python 3.11)
+def _operation_name(frame):
+    code = frame.f_code
+    if code.co_argcount and code.co_varnames[0] in ('cls', 'self'):
+        owner = frame.f_locals.get(code.co_varnames[0])
+        if owner is not None:
+            owner = owner if isinstance(owner, type) else type(owner)
+            return '{}.{}'.format(owner.__name__, code.co_name)
+    return code.co_name
+
+
+# Функция получения номера вызова, которым помечен кадр операции (None - кадр еще не помечен). Кадр функции
+# помечается локальной переменной CALL_MARKER: профилировщик не удерживает кадры, а адрес (в Python 3.8 и сам
+# объект) кадра завершенного вызова достается следующему вызову той же функции, поэтому id кадра вызов не
+# отличает. Кадр модуля живет до конца скрипта, его номер - id кадра
+def _call_marker(frame):
+    if frame.f_locals is frame.f_globals:
+        return id(frame)
+    return frame.f_locals.get(CALL_MARKER)
+
+
+def _mark_call(frame, marker):
+    if frame.f_locals is frame.f_globals:
+        return id(frame)
+    frame.f_locals[CALL_MARKER] = marker
+    return marker
+
+
+def _bucket(value, bounds):
+    for bound in bounds:
+        if value <= bound:
+            return '<={}'.format(bound)
+    return '>{}'.format(bounds[-1])
+
+
+# Курсор-обертка: считает строки, выбранные из результата SELECT, в записи вызова операции
+class _CountingCursor:
+    def __init__(self, cursor, call):
+        self._cursor = cursor
+        self._call = call
+
+    def _count(self, rows):
+        self._call['rows'] += len(rows)
+        return rows
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._call['rows'] += 1
+        return row
+
+    def fetchmany(self, *args):
+        return self._count(self._cursor.fetchmany(*args))
+
+    def fetchall(self):
+        return self._count(self._cursor.fetchall())
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._call['rows'] += 1
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+# Профилировщик SQL: слушает события курсора всех подключений SQLAlchemy, относит каждый запрос
+# (длительность и число строк) к операции, собирает по операциям счетчики и гистограммы
+# и предупреждает о повторяющихся запросах внутри одного вызова (N+1)
+class SQLProfiler:
+    def __init__(self, repeat_threshold=REPEAT_THRESHOLD):
+        self.repeat_threshold = repeat_threshold
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.operations = {}
+        self.n_plus_one = {}
+        # Текущий вызов операции каждого потока: {id потока: запись вызова}. Записи хранят номер вызова,
+        # а не кадр и контекст выполнения; вызовы завершившихся потоков переносятся в статистику
+        self.calls = {}
+        self.markers = count(1)
+
+    def enable(self):
+        if not self.enabled:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self.enabled = True
+        return self
+
+    def disable(self):
+        if self.enabled:
+            event.remove(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.remove(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self.enabled = False
+        self._flush_calls()
+
+    def reset(self):
+        with self.lock:
+            self.operations.clear()
+            self.n_plus_one.clear()
+            self.calls.clear()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._profile_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - context._profile_start
+        name, frame = _find_operation()
+        marker = _call_marker(frame) if frame is not None else None
+        thread_id = threading.get_ident()
+        with self.lock:
+            call = self.calls.get(thread_id)
+            # Новый вызов операции - непомеченный кадр или кадр другого вызова; предыдущий вызов потока завершен
+            if call is None or call['name'] != name or call['marker'] != marker or \
+                    (frame is not None and marker is None):
+                if call is not None:
+                    self._finish_call(call)
+                if len(self.calls) > threading.active_count():
+                    self._finish_exited_threads()
+                if frame is not None:
+                    marker = _mark_call(frame, next(self.markers))
+                call = {'name': name, 'marker': marker, 'statements': 0, 'rows': 0, 'seconds': 0.0,
+                        'durations': Counter(), 'templates': Counter()}
+                self.calls[thread_id] = call
+            template = normalize_statement(statement)
+            call['statements'] += 1
+            call['seconds'] += seconds
+            call['durations'][_bucket(seconds, DURATION_BUCKETS)] += 1
+            # Пачки одного executemany - один логический запрос, повтором не считаются
+            if executemany and getattr(context, '_profile_counted', False):
+                repeats = 0
+            else:
+                call['templates'][template] += 1
+                repeats = call['templates'][template]
+            context._profile_counted = True
+            if cursor.description is None:
+                call['rows'] += max(cursor.rowcount, 0)
+        if cursor.description is not None:
+            context.cursor = _CountingCursor(cursor, call)
+        if repeats == self.repeat_threshold:
+            self._report_repeats(name, template)
+
+    def _report_repeats(self, name, template):
+        with self.lock:
+            key = (name, template)
+            first = key not in self.n_plus_one
+            self.n_plus_one[key] = self.n_plus_one.get(key, 0) + 1
+        if first:
+            warnings.warn('{} issued the same statement {} or more times in one call (N+1?): {}'.format(
+                name, self.repeat_threshold, template[:200]), NPlusOneWarning)
+
+    # Функция добавления завершенного вызова в статистику операции (вызывается под self.lock)
+    def _finish_call(self, call):
+        stats = self.operations.get(call['name'])
+        if stats is None:
+            stats = self.operations[call['name']] = {
+                'calls': 0, 'statements': 0, 'rows': 0, 'seconds': 0.0, 'max_call_seconds': 0.0,
+                'statement_seconds_histogram': Counter(), 'statements_per_call_histogram': Counter(),
+                'templates': Counter()}
+        stats['calls'] += 1
+        stats['statements'] += call['statements']
+        stats['rows'] += call['rows']
+        stats['seconds'] += call['seconds']
+        stats['max_call_seconds'] = max(stats['max_call_seconds'], call['seconds'])
+        stats['statement_seconds_histogram'].update(call['durations'])
+        stats['statements_per_call_histogram'][_bucket(call['statements'], STATEMENTS_BUCKETS)] += 1
+        stats['templates'].update(call['templates'])
+
+    def _flush_calls(self):
+        with self.lock:
+            for call in self.calls.values():
+                self._finish_call(call)
+            self.calls.clear()
+
+    # Функция переноса в статистику вызовов потоков, которые завершились (вызывается под self.lock)
+    def _finish_exited_threads(self):
+        alive = {thread.ident for thread in threading.enumerate()}
+        for thread_id in [thread_id for thread_id in self.calls if thread_id not in alive]:
+            self._finish_call(self.calls.pop(thread_id))
+
+    # Функция получения профиля: {операция: счетчики, гистограммы и самые частые шаблоны запросов},
+    # по убыванию суммарного времени, и список предупреждений N+1. Текущие вызовы считаются завершенными
+    def profile(self, top_statements=5):
+        self._flush_calls()
+        with self.lock:
+            operations = {}
+            for name, stats in sorted(self.operations.items(), key=lambda item: -item[1]['seconds']):
+                operations[name] = dict(stats,
+                                        statement_seconds_histogram=dict(stats['statement_seconds_histogram']),
+                                        statements_per_call_histogram=dict(stats['statements_per_call_histogram']),
+                                        templates=dict(stats['templates'].most_common(top_statements)))
+            n_plus_one = [{'operation': name, 'statement': template, 'calls': count}
+                          for (name, template), count in self.n_plus_one.items()]
+        return {'operations': operations, 'n_plus_one': n_plus_one}
+
+    # Функция вывода профиля: в JSON-файл path или сводной таблицей в stderr
+    def dump(self, path=None):
+        profile = self.profile()
+        if path:
+            with open(path, 'w', encoding='utf-8') as profile_file:
+                json.dump(profile, profile_file, indent=2, ensure_ascii=False)
+            return
+        print('{:60} {:>7} {:>9} {:>10} {:>10}'.format('operation', 'calls', 'queries', 'rows', 'seconds'),
+              file=sys.stderr)
+        for name, stats in profile['operations'].items():
+            print('{:60} {calls:7} {statements:9} {rows:10} {seconds:10.4f}'.format(name[:60], **stats),
+                  file=sys.stderr)
+        for warning in profile['n_plus_one']:
+            print('N+1: {operation}: {statement}'.format(**warning)[:200], file=sys.stderr)
+
+
+# Профилировщик по умолчанию
+profiler = SQLProfiler()
+
+
+# Функция включения профилирования. dump_at_exit - вывести профиль при завершении процесса
+# (True - в stderr, строка - в JSON-файл по этому пути)
+def enable(dump_at_exit=None):
+    profiler.enable()
+    if dump_at_exit:
+        atexit.register(profiler.dump, dump_at_exit if isinstance(dump_at_exit, str) else None)
+    return profiler
+
+
+def disable():
+    profiler.disable()
+
+
+# Функция включения профилирования по переменной окружения RLSDB_SQL_PROFILE:
+# 1 - профиль в stderr при завершении процесса, иначе - путь к JSON-файлу профиля
+def enable_from_environment():
+    value = os.environ.get('RLSDB_SQL_PROFILE')
+    if value and not profiler.enabled:
+        enable(True if value == '1' else value)
+
+
+if __name__ == '__main__':
+    # python sql_profile.py script.py [args] - выполнить скрипт с профилированием SQL, профиль в stderr
+    sys.argv = sys.argv[1:]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(sys.argv[0])))
+    enable(True)
+    runpy.run_path(sys.argv[0], run_name='__main__')
@@ -0,0 +1,186 @@
+from datetime import datetime, timedelta
+import os
+import random
+import sys
+import time
+
+from main import configure_database, init_db, TypeSessionEntity, TypeSourceRLIEntity, TypeBindingMethodEntity, \
+    RelatingObjectEntity, SessionEntity, CoordinatesEntity, ExtentEntity, FileEntity, RawRLIEntity, RLIEntity, \
+    RasterRLIEntity, LinkedRLIEntity, MarkEntity, ObjectEntity, TargetEntity, RegionEntity
+
+# Справочники синтетической базы: имена создаются, если их еще нет
+TYPE_SESSIONS = ['Synthetic flight', 'Synthetic survey']
+TYPE_SOURCES_RLI = ['Synthetic SAR', 'Synthetic RLS']
+TYPE_BINDING_METHODS = ['Synthetic telemetry', 'Synthetic reference points']
+RELATING_OBJECTS = [(1, 'Synthetic own'), (2, 'Synthetic foreign'), (3, 'Synthetic unknown')]
+OBJECT_TYPES = ['ship', 'aircraft', 'vehicle', 'building', 'unknown']
+SPPR_TYPE_KEYS = ['sea', 'air', 'ground']
+
+# Начало отсчета времени синтетических сессий: даты не зависят от времени запуска
+EPOCH = datetime(2024, 1, 1)
+
+# Размер пачки файлов, вставляемых одной транзакцией на каждую таблицу
+CHUNK_SIZE = 5000
+
+
+# Функция получения id записей справочника по именам, недостающие записи создаются
+def _lookup_ids(entity, names, create_many):
+    existing = {row.name: row.id for row in entity.get_all_cached()}
+    missing = [name for name in names if name not in existing]
+    if missing:
+        create_many(missing)
+        existing = {row.name: row.id for row in entity.get_all_cached()}
+    return [existing[name] for name in names]
+
+
+# Функция получения id связанных объектов (ключ - имя, тип связи задается при создании)
+def _relating_object_ids():
+    existing = {row.name: row.id for row in RelatingObjectEntity.get_all_cached()}
+    missing = [(type_relating, name) for type_relating, name in RELATING_OBJECTS if name not in existing]
+    if missing:
+        RelatingObjectEntity.create_relating_object_many(missing)
+        existing = {row.name: row.id for row in RelatingObjectEntity.get_all_cached()}
+    return [existing[name] for _, name in RELATING_OBJECTS]
+
+
+# Функция генерации meta объекта: скорость, курс, достоверность и класс
+def object_meta(rnd):
+    return {'speed': round(rnd.uniform(0, 300), 1), 'course': rnd.randrange(360),
+            'confidence': round(rnd.random(), 3), 'class': 'c{}'.format(rnd.randrange(10))}
+
+
+# Функция вставки прямоугольных экстентов: 4 угловые координаты и экстент на каждый прямоугольник,
+# boxes - кортежи (min_latitude, max_latitude, min_longitude, max_longitude); возвращает id экстентов
+def _create_extents(boxes, altitude):
+    corners = []
+    for min_latitude, max_latitude, min_longitude, max_longitude in boxes:
+        corners.extend(((max_latitude, min_longitude), (min_latitude, min_longitude),
+                        (max_latitude, max_longitude), (min_latitude, max_longitude)))
+    coordinates_ids = CoordinatesEntity.create_coordinates_many((latitude, longitude, altitude)
+                                                                for latitude, longitude in corners)
+    return ExtentEntity.create_extent_many(coordinates_ids[i:i + 4] for i in range(0, len(coordinates_ids), 4))
+
+
+# Функция генерации одной сессии: отметки с координатами и объектами, затем пачками по CHUNK_SIZE файлов -
+# сырые и обработанные РЛИ, растры с экстентами, привязанные РЛИ и цели по растрам
+def _generate_session(rnd, number, lookups, files, marks, linked_per_raster, targets_per_raster):
+    date = EPOCH + timedelta(days=number)
+    center_latitude, center_longitude = rnd.uniform(-60, 60), rnd.uniform(-170, 170)
+    session_id = SessionEntity.create_session_many([('Synthetic session {}'.format(number),
+                                                     '/synthetic/session_{}'.format(number),
+                                                     rnd.choice(lookups['type_session']), date)])[0]
+    counts = dict.fromkeys(['files', 'raster_rli', 'linked_rli', 'marks', 'objects', 'targets'], 0)
+
+    object_ids = []
+    for start in range(0, marks, CHUNK_SIZE):
+        size = min(CHUNK_SIZE, marks - start)
+        coordinates_ids = CoordinatesEntity.create_coordinates_many(
+            (center_latitude + rnd.gauss(0, 0.5), center_longitude + rnd.gauss(0, 0.5), rnd.uniform(0, 3000))
+            for _ in range(size))
+        mark_ids = MarkEntity.create_mark_many((coordinates_id, session_id, date + timedelta(seconds=start + i))
+                                               for i, coordinates_id in enumerate(coordinates_ids))
+        object_ids.extend(ObjectEntity.create_object_many(
+            (mark_id, 'Object {}'.format(start + i), rnd.choice(OBJECT_TYPES),
+             rnd.choice(lookups['relating_object']), object_meta(rnd))
+            for i, mark_id in enumerate(mark_ids)))
+        counts['marks'] += size
+    counts['objects'] = len(object_ids)
+
+    for start in range(0, files, CHUNK_SIZE):
+        size = min(CHUNK_SIZE, files - start)
+        file_ids = FileEntity.create_file_many(
+            ('file_{}.rli'.format(start + i), '/synthetic/session_{}/file_{}.rli'.format(number, start + i), 'rli',
+             session_id) for i in range(size))
+        raw_rli_ids = RawRLIEntity.create_raw_rli_many(
+            (file_id, rnd.choice(lookups['type_source_rli']), date + timedelta(seconds=start + i))
+            for i, file_id in enumerate(file_ids))
+        rli_ids = RLIEntity.create_rli_many(
+            ('RLI {}'.format(start + i), rnd.random() < 0.5, raw_rli_id, date + timedelta(seconds=start + i))
+            for i, raw_rli_id in enumerate(raw_rli_ids))
+        boxes = []
+        for _ in range(size):
+            latitude, longitude = center_latitude + rnd.gauss(0, 0.5), center_longitude + rnd.gauss(0, 0.5)
+            boxes.append((latitude, latitude + 0.05, longitude, longitude + 0.05))
+        extent_ids = _create_extents(boxes, 0.0)
+        raster_rli_ids = RasterRLIEntity.create_raster_rli_many(zip(rli_ids, file_ids, extent_ids))
+
+        # Привязанное РЛИ - экстент растра, смещенный на ошибку привязки
+        linked = [(raster_rli_id, file_id, box, attempt)
+                  for raster_rli_id, file_id, box in zip(raster_rli_ids, file_ids, boxes)
+                  for attempt in range(1, linked_per_raster + 1)]
+        linked_boxes = []
+        for _, _, (min_latitude, max_latitude, min_longitude, max_longitude), _ in linked:
+            shift = rnd.gauss(0, 0.001)
+            linked_boxes.append((min_latitude + shift, max_latitude + shift, min_longitude + shift,
+                                 max_longitude + shift))
+        linked_extent_ids = _create_extents(linked_boxes, 0.0)
+        LinkedRLIEntity.create_linked_rli_many(
+            (raster_rli_id, file_id, extent_id, attempt, rnd.choice(lookups['type_binding_method']))
+            for (raster_rli_id, file_id, _, attempt), extent_id in zip(linked, linked_extent_ids))
+
+        if object_ids:
+            TargetEntity.create_target_many(
+                (i * targets_per_raster + k, rnd.choice(object_ids), raster_rli_id, rnd.choice(SPPR_TYPE_KEYS),
+                 date + timedelta(seconds=i))
+                for i, raster_rli_id in enumerate(raster_rli_ids, start) for k in range(targets_per_raster))
+            counts['targets'] += size * targets_per_raster
+        counts['files'] += size
+        counts['raster_rli'] += size
+        counts['linked_rli'] += len(linked)
+    return session_id, counts
+
+
+# Функция заполнения базы синтетическими данными: sessions сессий, в каждой files файлов (с сырым,
+# обработанным и растровым РЛИ), linked_per_raster привязанных РЛИ и targets_per_raster целей на растр,
+# marks отметок с объектами, и regions регионов. Одинаковый seed дает одинаковые данные.
+# Возвращает id сессий, число созданных строк и время генерации
+def generate(sessions=1, files=100, marks=1000, linked_per_raster=1, targets_per_raster=1, regions=10, seed=0):
+    start = time.perf_counter()
+    init_db()
+    rnd = random.Random(seed)
+    lookups = {
+        'type_session': _lookup_ids(TypeSessionEntity, TYPE_SESSIONS, TypeSessionEntity.create_type_session_many),
+        'type_source_rli': _lookup_ids(TypeSourceRLIEntity, TYPE_SOURCES_RLI,
+                                       TypeSourceRLIEntity.create_type_source_rli_many),
+        'type_binding_method': _lookup_ids(TypeBindingMethodEntity, TYPE_BINDING_METHODS,
+                                           TypeBindingMethodEntity.create_type_binding_method_many),
+        'relating_object': _relating_object_ids(),
+    }
+    session_ids = []
+    counts = {}
+    for number in range(sessions):
+        session_id, session_counts = _generate_session(rnd, number, lookups, files, marks, linked_per_raster,
+                                                       targets_per_raster)
+        session_ids.append(session_id)
+        for name, count in session_counts.items():
+            counts[name] = counts.get(name, 0) + count
+
+    boxes = []
+    for _ in range(regions):
+        latitude, longitude = rnd.uniform(-60, 60), rnd.uniform(-170, 170)
+        boxes.append((latitude, latitude + 1, longitude, longitude + 1))
+    RegionEntity.create_region_many((extent_id, 'Synthetic region {}'.format(i))
+                                    for i, extent_id in enumerate(_create_extents(boxes, 0.0)))
+    counts['sessions'] = sessions
+    counts['regions'] = regions
+    return {'session_ids': session_ids, 'counts': counts, 'seconds': time.perf_counter() - start}
+
+
+if __name__ == '__main__':
+    # python synthetic.py --db URL [sessions] [files] [marks] [seed] - заполнить базу URL синтетическими данными.
+    # Без --db используется база RLSDB_URL; если не задано ни то, ни другое, генерация не запускается,
+    # чтобы не дописать синтетику в рабочую базу по умолчанию
+    arguments = sys.argv[1:]
+    if arguments[:1] == ['--db'] and arguments[1:]:
+        configure_database(arguments[1])
+        arguments = arguments[2:]
+    elif not os.environ.get('RLSDB_URL'):
+        sys.exit('Usage: python synthetic.py --db URL [sessions] [files] [marks] [seed] '
+                 '(or set RLSDB_URL to the target database)')
+    arguments = [int(argument) for argument in arguments[:4]]
+    keywords = dict(zip(['sessions', 'files', 'marks', 'seed'], arguments))
+    result = generate(**keywords)
+    print('Sessions {}: {} in {:.1f} s'.format(', '.join(map(str, result['session_ids'])),
+                                                ', '.join('{} {}'.format(name, count)
+                                                          for name, count in result['counts'].items()),
+                                                result['seconds']))
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import configure_database, init_db, session  # noqa: E402
+import synthetic  # noqa: E402
+
+
+# Временная база с созданной схемой на время теста, после теста - возврат к базе по умолчанию
+@pytest.fixture
+def database(tmp_path):
+    configure_database('sqlite:///' + str(tmp_path / 'test.db'))
+    init_db()
+    yield tmp_path
+    session.remove()
+    configure_database()
+
+
+# Временная база с одной синтетической сессией (3 файла, 5 отметок, 2 региона), возвращает id сессии
+@pytest.fixture
+def session_id(database):
+    yield synthetic.generate(files=3, marks=5, regions=2, seed=1)['session_ids'][0]
+    session.remove()
@@ -0,0 +1,71 @@
+import asyncio
+import threading
+
+import pytest
+
+from async_api import AsyncRLSDB, READ_METHODS, WRITE_METHODS, STREAM_METHODS
+from main import session, Base, BaseEntity, SessionEntity, FileEntity, RLIEntity, MarkEntity
+
+# Classmethod'ы, которые намеренно не доступны асинхронно: построение запросов и служебные функции
+SYNC_ONLY_METHODS = {'identity_cache', 'configure_identity_cache', 'lookup_cache', 'meta_conditions', 'meta_value',
+                     'table_columns'}
+
+
+# Каждый публичный classmethod сущностей либо есть в реестре, либо явно оставлен синхронным
+def test_registry_covers_public_classmethods():
+    names = set()
+    for mapper in Base.registry.mappers:
+        for klass in mapper.class_.__mro__:
+            if klass is Base:
+                break
+            names.update(name for name, value in vars(klass).items()
+                         if isinstance(value, classmethod) and not name.startswith('_'))
+
+    registered = READ_METHODS | WRITE_METHODS | STREAM_METHODS
+    assert names - registered - SYNC_ONLY_METHODS == {name for name in names if name.startswith('query_')}
+    assert registered <= names
+    assert not READ_METHODS & WRITE_METHODS
+
+
+# Методы, изменяющие базу без префиксов create_/update_/delete_, выполняются в потоке записи
+@pytest.mark.parametrize('entity, name', [
+    (SessionEntity, 'purge_sessions'), (SessionEntity, 'purge_sessions_before'), (FileEntity, 'register_files'),
+    (RLIEntity, 'claim_rli'), (RLIEntity, 'complete_rli'), (RLIEntity, 'release_rli'),
+    (RLIEntity, 'extend_rli_lease'),
+])
+def test_writes_run_on_write_thread(monkeypatch, entity, name):
+    monkeypatch.setattr(entity, name, classmethod(lambda cls, *args, **kwargs: threading.current_thread().name))
+
+    async def call():
+        async with AsyncRLSDB(readers=2) as db:
+            return await getattr(getattr(db, entity.__name__), name)()
+
+    assert asyncio.run(call()).startswith('rlsdb-write')
+
+
+def test_queue_and_stream_through_facade(session_id):
+    async def run():
+        async with AsyncRLSDB(readers=2) as db:
+            claimed = await db.RLIEntity.claim_rli('worker', session_id=session_id)
+            stats = await db.RLIEntity.get_queue_stats()
+            marks = [mark async for mark in db.MarkEntity.iter_all_marks(page_size=2)]
+            return claimed, stats, marks
+
+    pending = RLIEntity.get_queue_stats()['pending']
+    claimed, stats, marks = asyncio.run(run())
+
+    assert len(claimed) == pending
+    assert stats['claimed'] == pending
+    assert [mark.id for mark in marks] == [mark.id for mark in MarkEntity.get_marks_by_session_id(session_id)]
+    session.remove()
+
+
+def test_unregistered_methods_are_not_exposed(database):
+    db = AsyncRLSDB(readers=1)
+    try:
+        assert not hasattr(db.MarkEntity, 'query_marks_by_session_id')
+        assert hasattr(db.SessionEntity, 'purge_sessions')
+        assert all(hasattr(getattr(db, mapper.class_.__name__), 'get_by_id') for mapper in Base.registry.mappers
+                   if issubclass(mapper.class_, BaseEntity))
+    finally:
+        db.close()
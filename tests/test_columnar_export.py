@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from main import session, FileEntity, RawRLIEntity, ColumnarReportExporterBySessionId
+
+pyarrow = pytest.importorskip('pyarrow')
+pyarrow_parquet = pytest.importorskip('pyarrow.parquet')
+
+
+# Функция чтения выгрузки Parquet или Arrow IPC в таблицу pyarrow
+def read_table(file_path, export_format):
+    if export_format == 'parquet':
+        return pyarrow_parquet.read_table(file_path)
+    with pyarrow.memory_map(file_path) as source:
+        return pyarrow.ipc.open_file(source).read_all()
+
+
+# Функция чтения выгрузки JSONL в список словарей
+def read_jsonl(file_path):
+    with open(file_path, encoding='utf-8') as file:
+        return [json.loads(line) for line in file]
+
+
+# Parquet и Arrow содержат те же строки, что и JSONL, с типизированными колонками; JSON-колонки - строки.
+# Маленький batch_size проверяет запись нескольких пачек в один файл
+@pytest.mark.parametrize('export_format', ['parquet', 'arrow'])
+def test_export_matches_jsonl(session_id, database, monkeypatch, export_format):
+    monkeypatch.setattr(ColumnarReportExporterBySessionId, 'batch_size', 2)
+    jsonl = ColumnarReportExporterBySessionId(session_id, 'jsonl', output_dir=str(database))
+    export = ColumnarReportExporterBySessionId(session_id, export_format, output_dir=str(database))
+
+    for jsonl_path, file_path, columns in zip(jsonl.file_paths, export.file_paths,
+                                              [export.rli_columns, export.targets_columns]):
+        table = read_table(file_path, export_format)
+        assert table.schema.names == [column_info['field'] for column_info in columns]
+        expected = read_jsonl(jsonl_path)
+        assert table.num_rows == len(expected)
+        for row, expected_row in zip(table.to_pylist(), expected):
+            for column_info in columns:
+                field, value = column_info['field'], row[column_info['field']]
+                if column_info['type'] == 'json':
+                    assert json.loads(value) == expected_row[field]
+                elif column_info['type'] == 'datetime':
+                    assert str(value) == expected_row[field]
+                else:
+                    assert value == expected_row[field]
+
+    raw_rli = read_table(export.file_paths[0], export_format)
+    assert raw_rli.num_rows == RawRLIEntity.query_ids_by_session_id(session_id).count()
+    assert raw_rli.schema.field('date_receiving').type == pyarrow.timestamp('us')
+    assert raw_rli.schema.field('raw_rli_id').type == pyarrow.int64()
+    assert read_table(export.file_paths[1], export_format).schema.field('meta').type == pyarrow.string()
+
+
+# Инкрементальная выгрузка в Parquet/Arrow не дописывает файл, а строит измененный лист заново
+@pytest.mark.parametrize('export_format', ['parquet', 'arrow'])
+def test_incremental_export_rebuilds_changed_sheet(session_id, database, export_format):
+    export = ColumnarReportExporterBySessionId(session_id, export_format, output_dir=str(database), incremental=True)
+    before = read_table(export.file_paths[0], export_format).num_rows
+
+    file_id = FileEntity.create_file('new.rli', '/new.rli', 'rli', session_id)
+    RawRLIEntity.create_raw_rli(file_id, RawRLIEntity.get_by_id(1).type_source_rli_id)
+    session.remove()
+    export = ColumnarReportExporterBySessionId(session_id, export_format, output_dir=str(database), incremental=True)
+
+    table = read_table(export.file_paths[0], export_format)
+    assert table.num_rows == before + 1
+    assert table.column('file_name').to_pylist()[-1] == 'new.rli'
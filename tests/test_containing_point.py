@@ -0,0 +1,34 @@
+import pytest
+
+from main import CoordinatesEntity, ExtentEntity, RasterRLIEntity, LinkedRLIEntity
+
+
+# Экстент-ромб с углами на серединах сторон квадрата широт/долгот [0, 2] x [0, 2]:
+# его описанный прямоугольник - весь квадрат, а углы квадрата в экстент не входят
+@pytest.fixture
+def diamond_extent(database):
+    corners = CoordinatesEntity._bulk_insert({'latitude': latitude, 'longitude': longitude, 'altitude': 0}
+                                             for latitude, longitude in ((2, 1), (1, 2), (0, 1), (1, 0)))
+    return ExtentEntity._bulk_insert([{'top_left_id': corners[0], 'top_right_id': corners[1],
+                                       'bot_right_id': corners[2], 'bot_left_id': corners[3]}])[0]
+
+
+@pytest.mark.parametrize('entity, get_containing_point', [
+    (RasterRLIEntity, RasterRLIEntity.get_raster_rli_containing_point),
+    (LinkedRLIEntity, LinkedRLIEntity.get_linked_rli_containing_point),
+])
+@pytest.mark.parametrize('latitude, longitude, contained', [
+    (1, 1, True),
+    (0.5, 0.5, True),
+    (2, 1, True),
+    (0.1, 0.1, False),
+    (1.9, 1.9, False),
+    (3, 1, False),
+])
+def test_containing_point_checks_extent_corners(diamond_extent, entity, get_containing_point,
+                                                latitude, longitude, contained):
+    entity_id = entity._bulk_insert([{'extent_id': diamond_extent}])[0]
+
+    rows = get_containing_point(latitude, longitude, ['id'])
+
+    assert [row.id for row in rows] == ([entity_id] if contained else [])
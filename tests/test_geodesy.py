@@ -0,0 +1,79 @@
+import math
+
+import numpy as np
+import pytest
+
+import geodesy
+from main import session, MarkEntity
+
+
+# Функция создания набора точек из списков широт и долгот
+def points(latitudes, longitudes):
+    return geodesy.Points(np.arange(len(latitudes)), np.array(latitudes, dtype=float),
+                          np.array(longitudes, dtype=float), np.zeros(len(latitudes)))
+
+
+def test_haversine_known_distances():
+    assert geodesy.haversine(0, 0, 0, 1) == pytest.approx(2 * math.pi * geodesy.EARTH_RADIUS / 360)
+    assert geodesy.haversine(90, 0, -90, 0) == pytest.approx(math.pi * geodesy.EARTH_RADIUS)
+    assert geodesy.haversine(55.75, 37.62, 55.75, 37.62) == 0
+    np.testing.assert_allclose(geodesy.haversine(0, 0, np.array([0, 0]), np.array([1, -1])),
+                               [geodesy.haversine(0, 0, 0, 1)] * 2)
+
+
+def test_ecef_axes_and_distance():
+    np.testing.assert_allclose(geodesy.to_ecef(0, 0), [geodesy.WGS84_A, 0, 0])
+    np.testing.assert_allclose(geodesy.to_ecef(90, 0, 100), [0, 0, geodesy.WGS84_A * (1 - geodesy.WGS84_F) + 100],
+                               atol=1e-6)
+    assert geodesy.ecef_distance(10, 20, 0, 10, 20, 500) == pytest.approx(500)
+
+
+# Ближайшие точки совпадают с полным перебором попарных расстояний, в том числе на границах блоков
+def test_nearest_neighbours_matches_brute_force():
+    rnd = np.random.default_rng(0)
+    points_a = points(rnd.uniform(-80, 80, 300), rnd.uniform(-180, 180, 300))
+    points_b = points(rnd.uniform(-80, 80, 50), rnd.uniform(-180, 180, 50))
+
+    indices, distances = geodesy.nearest_neighbours(points_a, points_b, chunk_size=7)
+
+    all_distances = geodesy.haversine(points_a.latitude[:, None], points_a.longitude[:, None],
+                                      points_b.latitude[None, :], points_b.longitude[None, :])
+    np.testing.assert_array_equal(indices, all_distances.argmin(axis=1))
+    np.testing.assert_allclose(distances, all_distances.min(axis=1))
+
+
+def test_nearest_neighbours_empty_sets():
+    indices, distances = geodesy.nearest_neighbours(points([], []), points([1], [2]))
+    assert indices.shape == distances.shape == (0,)
+
+    indices, distances = geodesy.nearest_neighbours(points([], []), points([], []))
+    assert indices.shape == distances.shape == (0,)
+
+    with pytest.raises(ValueError, match='empty point set'):
+        geodesy.nearest_neighbours(points([1], [2]), points([], []))
+
+
+def test_k_nearest_marks_from_points():
+    mark_points = points([0, 0, 0, 0], [3, 1, 4, 2])
+
+    ids, distances = geodesy.k_nearest_marks(0, 0, 2, points=mark_points)
+    np.testing.assert_array_equal(ids, [1, 3])
+    assert list(distances) == sorted(distances)
+
+    assert len(geodesy.k_nearest_marks(0, 0, 10, points=mark_points)[0]) == 4
+    assert len(geodesy.k_nearest_marks(0, 0, 0, points=mark_points)[0]) == 0
+
+
+# Загрузка одним запросом возвращает те же координаты, что и объекты отметок
+def test_load_marks_and_coordinates(session_id):
+    marks = MarkEntity.get_marks_by_session_id(session_id)
+    expected = sorted((mark.id, mark.coordinates.latitude, mark.coordinates.longitude) for mark in marks)
+
+    loaded = geodesy.load_marks(session_id)
+    assert list(zip(loaded.ids, loaded.latitude, loaded.longitude)) == expected
+
+    coordinates_ids = sorted(mark.coordinates_id for mark in marks)
+    coordinates = geodesy.load_coordinates(coordinates_ids + [coordinates_ids[0]])
+    assert list(coordinates.ids) == coordinates_ids
+    assert len(geodesy.load_coordinates([]).ids) == 0
+    session.remove()
@@ -0,0 +1,232 @@
+import threading
+import time
+
+import pytest
+
+from main import session, use_storage_profile, STORAGE_PROFILES, IdentityCache, TypeSessionEntity, \
+    TypeSourceRLIEntity, SessionEntity, CoordinatesEntity, ExtentEntity, FileEntity, RawRLIEntity, RLIEntity, \
+    RasterRLIEntity, TypeBindingMethodEntity, LinkedRLIEntity, MarkEntity, RelatingObjectEntity, ObjectEntity, \
+    TargetEntity, RegionEntity
+
+# Изменения строк через update_*: (сущность, метод, аргументы по текущей строке, колонка, новое значение)
+UPDATES = [
+    (TypeSessionEntity, 'update_type_session', lambda row: (row.id, 'Renamed'), 'name', 'Renamed'),
+    (TypeSourceRLIEntity, 'update_type_source_rli', lambda row: (row.id, 'Renamed'), 'name', 'Renamed'),
+    (SessionEntity, 'update_session', lambda row: (row.id, 'Renamed', row.path_to_directory, row.type_session_id),
+     'name', 'Renamed'),
+    (CoordinatesEntity, 'update_coordinates', lambda row: (row.id, 12.5, row.longitude, row.altitude),
+     'latitude', 12.5),
+    (ExtentEntity, 'update_extent', lambda row: (row.id, None, row.bot_left_id, row.top_right_id, row.bot_right_id),
+     'top_left_id', None),
+    (FileEntity, 'update_file', lambda row: (row.id, 'renamed.bin', row.path_to_file, row.file_extension,
+                                             row.session_id), 'name', 'renamed.bin'),
+    (RawRLIEntity, 'update_raw_rli', lambda row: (row.id, None, row.type_source_rli_id), 'file_id', None),
+    (RLIEntity, 'update_rli', lambda row: (row.id, 'Renamed', not row.is_processing, row.raw_rli_id),
+     'name', 'Renamed'),
+    (RasterRLIEntity, 'update_raster_rli', lambda row: (row.id, row.rli_id, None, row.extent_id), 'file_id', None),
+    (TypeBindingMethodEntity, 'update_type_binding_method', lambda row: (row.id, 'Renamed'), 'name', 'Renamed'),
+    (LinkedRLIEntity, 'update_linked_rli', lambda row: (row.id, row.raster_rli_id, row.file_id, row.extent_id, 42,
+                                                        row.type_binding_method_id), 'binding_attempt_number', 42),
+    (MarkEntity, 'update_mark', lambda row: (row.id, row.coordinates_id, None), 'session_id', None),
+    (RelatingObjectEntity, 'update_relating_object', lambda row: (row.id, row.type_relating, 'Renamed'),
+     'name', 'Renamed'),
+    (ObjectEntity, 'update_object', lambda row: (row.id, row.mark_id, 'Renamed', row.type, row.relating_object_id,
+                                                 row.meta), 'name', 'Renamed'),
+    (TargetEntity, 'update_target', lambda row: (row.id, 4242, row.object_id, row.raster_rli_id, row.sppr_type_key),
+     'number', 4242),
+    (RegionEntity, 'update_region', lambda row: (row.id, row.extent_id, 'Renamed'), 'name', 'Renamed'),
+]
+
+# Удаление строк через delete_*: (сущность, метод)
+DELETES = [
+    (TypeSessionEntity, 'delete_type_session'), (TypeSourceRLIEntity, 'delete_type_source_rli'),
+    (SessionEntity, 'delete_session'), (CoordinatesEntity, 'delete_coordinates'), (ExtentEntity, 'delete_extent'),
+    (FileEntity, 'delete_file'), (RawRLIEntity, 'delete_raw_rli'), (RLIEntity, 'delete_rli'),
+    (RasterRLIEntity, 'delete_raster_rli'), (TypeBindingMethodEntity, 'delete_type_binding_method'),
+    (LinkedRLIEntity, 'delete_linked_rli'), (MarkEntity, 'delete_mark'),
+    (RelatingObjectEntity, 'delete_relating_object'), (ObjectEntity, 'delete_object'),
+    (TargetEntity, 'delete_target'), (RegionEntity, 'delete_region'),
+]
+
+
+# Функция получения id первой строки сущности, строка заодно загружается в кэш get_by_id
+def cached_first_id(entity):
+    entity_id = session.query(entity.id).order_by(entity.id).limit(1).scalar()
+    session.remove()
+    assert entity.get_by_id(entity_id) is not None
+    return entity_id
+
+
+@pytest.mark.parametrize('entity, method, arguments, column, value', UPDATES,
+                         ids=[update[1] for update in UPDATES])
+def test_update_invalidates_cached_row(session_id, entity, method, arguments, column, value):
+    entity_id = cached_first_id(entity)
+
+    getattr(entity, method)(*arguments(entity.get_by_id(entity_id)))
+
+    assert getattr(entity.get_by_id(entity_id), column) == value
+
+
+def test_update_file_signatures_invalidates_cached_row(session_id):
+    file_id = cached_first_id(FileEntity)
+
+    FileEntity.update_file_signatures([(file_id, 123, 456)])
+
+    assert FileEntity.get_by_id(file_id).size == 123
+
+
+def test_update_where_invalidates_cached_rows(session_id):
+    rli_id = cached_first_id(RLIEntity)
+
+    RLIEntity.update_where({'name': 'Renamed'}, id=rli_id)
+
+    assert RLIEntity.get_by_id(rli_id).name == 'Renamed'
+
+
+@pytest.mark.parametrize('entity, method', DELETES, ids=[delete[1] for delete in DELETES])
+def test_delete_invalidates_cached_row(session_id, entity, method):
+    entity_id = cached_first_id(entity)
+
+    getattr(entity, method)(entity_id)
+
+    assert entity.get_by_id(entity_id) is None
+
+
+# Подключения с включенными внешними ключами: удаление строки каскадно удаляет зависимые строки в базе
+@pytest.fixture
+def foreign_keys(session_id, monkeypatch):
+    monkeypatch.setitem(STORAGE_PROFILES, 'default', {'foreign_keys': 'ON'})
+    use_storage_profile('default')
+
+
+# Каскадное удаление в базе сбрасывает кэши зависимых сущностей
+def test_delete_invalidates_cascaded_rows(foreign_keys):
+    raster_rli_id = cached_first_id(RasterRLIEntity)
+    target_id = session.query(TargetEntity.id).filter(TargetEntity.raster_rli_id == raster_rli_id).limit(1).scalar()
+    assert TargetEntity.get_by_id(target_id) is not None
+
+    FileEntity.delete_file(RasterRLIEntity.get_by_id(raster_rli_id).file_id)
+
+    assert RasterRLIEntity.get_by_id(raster_rli_id) is None
+    assert TargetEntity.get_by_id(target_id) is None
+
+
+# Источник строк для кэша: словарь значений со счетчиком загрузок
+class Loader:
+    def __init__(self, rows):
+        self.rows = rows
+        self.loads = 0
+
+    def __call__(self, entity_id):
+        self.loads += 1
+        return self.rows.get(entity_id)
+
+
+def test_ttl_expires_entries():
+    loader = Loader({1: 'old'})
+    cache = IdentityCache(ttl=0.05)
+    assert cache.get(1, loader) == 'old'
+    loader.rows[1] = 'new'
+
+    assert cache.get(1, loader) == 'old'
+    time.sleep(0.1)
+    assert cache.get(1, loader) == 'new'
+    assert loader.loads == 2
+
+
+def test_lru_evicts_least_recently_used():
+    loader = Loader({1: 'a', 2: 'b', 3: 'c'})
+    cache = IdentityCache(maxsize=2)
+    cache.get(1, loader)
+    cache.get(2, loader)
+    cache.get(1, loader)
+
+    cache.get(3, loader)
+
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['size'] == 2
+    cache.get(1, loader)
+    cache.get(3, loader)
+    assert loader.loads == 3
+    cache.get(2, loader)
+    assert loader.loads == 4
+
+
+# configure_identity_cache меняет только переданные параметры: TTL сохраняется при изменении размера
+def test_configure_identity_cache_keeps_unset_parameters(monkeypatch):
+    monkeypatch.setattr(RegionEntity, '_identity_cache', RegionEntity.identity_cache())
+    monkeypatch.setattr(RegionEntity, 'identity_cache_size', RegionEntity.identity_cache_size)
+    monkeypatch.setattr(RegionEntity, 'identity_cache_ttl', RegionEntity.identity_cache_ttl)
+
+    RegionEntity.configure_identity_cache(maxsize=10)
+    assert (RegionEntity.identity_cache().maxsize, RegionEntity.identity_cache().ttl) == (10, 60)
+
+    RegionEntity.configure_identity_cache(ttl=5)
+    assert (RegionEntity.identity_cache().maxsize, RegionEntity.identity_cache().ttl) == (10, 5)
+
+    RegionEntity.configure_identity_cache(ttl=None)
+    assert (RegionEntity.identity_cache().maxsize, RegionEntity.identity_cache().ttl) == (10, None)
+
+
+def test_missing_rows_are_not_cached():
+    loader = Loader({})
+    cache = IdentityCache()
+
+    assert cache.get(1, loader) is None
+    assert cache.get(1, loader) is None
+    assert loader.loads == 2
+
+
+# Загрузка, прочитавшая строку до изменения и завершившаяся после инвалидации, не оставляет в кэше старую строку
+def test_load_racing_with_invalidation_is_not_cached():
+    rows = {1: 'old'}
+    loaded, invalidated = threading.Event(), threading.Event()
+
+    def slow_load(entity_id):
+        row = rows[entity_id]
+        loaded.set()
+        invalidated.wait(5)
+        return row
+
+    cache = IdentityCache()
+    reader = threading.Thread(target=cache.get, args=(1, slow_load))
+    reader.start()
+    loaded.wait(5)
+    rows[1] = 'new'
+    cache.invalidate([1])
+    invalidated.set()
+    reader.join(5)
+
+    assert cache.get(1, rows.get) == 'new'
+
+
+# Читатели get_by_id в потоках во время изменений: после остановки записи кэш совпадает с базой
+def test_concurrent_readers_see_last_write(session_id):
+    coordinates_id = cached_first_id(CoordinatesEntity)
+    stop = threading.Event()
+    errors = []
+
+    def read():
+        try:
+            while not stop.is_set():
+                CoordinatesEntity.get_by_id(coordinates_id)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            session.remove()
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    try:
+        for latitude in range(50):
+            CoordinatesEntity.update_coordinates(coordinates_id, latitude, 0, 0)
+    finally:
+        stop.set()
+        for reader in readers:
+            reader.join(10)
+        session.remove()
+
+    assert errors == []
+    assert CoordinatesEntity.get_by_id(coordinates_id).latitude == 49
+    assert session.query(CoordinatesEntity.latitude).filter(CoordinatesEntity.id == coordinates_id).scalar() == 49
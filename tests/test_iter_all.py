@@ -0,0 +1,28 @@
+import pytest
+
+from main import session, SessionEntity, MarkEntity, RegionEntity
+
+
+# Постраничный обход возвращает все строки по возрастанию id, а в сессии остаются объекты только текущей страницы
+@pytest.mark.parametrize('entity, method', [
+    (SessionEntity, 'iter_all_sessions'), (MarkEntity, 'iter_all_marks'), (RegionEntity, 'iter_all_regions'),
+])
+def test_iter_all_keeps_identity_map_bounded(session_id, entity, method):
+    expected = [row.id for row in session.query(entity.id).order_by(entity.id)]
+    session.remove()
+
+    ids = []
+    for row in getattr(entity, method)(page_size=2):
+        ids.append(row.id)
+        assert len(session.identity_map) <= 2
+
+    assert ids == expected
+    assert len(session.identity_map) == 0
+
+
+def test_iter_all_uses_entity_page_size(session_id, monkeypatch):
+    monkeypatch.setattr(MarkEntity, 'page_size', 1)
+
+    for _ in MarkEntity.iter_all_marks():
+        assert len(session.identity_map) == 1
+    assert len(session.identity_map) == 0
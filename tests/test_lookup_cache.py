@@ -0,0 +1,87 @@
+import pytest
+from sqlalchemy import update
+
+import main
+from main import session, configure_database, get_engine, init_db, lookup_cache_stats, TypeSessionEntity, \
+    TypeSourceRLIEntity, TypeBindingMethodEntity, RelatingObjectEntity
+
+# Справочники: (сущность, создание строки, изменение имени строки, удаление строки)
+LOOKUPS = [
+    (TypeSessionEntity, lambda: TypeSessionEntity.create_type_session('Old'),
+     lambda row_id: TypeSessionEntity.update_type_session(row_id, 'New'), TypeSessionEntity.delete_type_session),
+    (TypeSourceRLIEntity, lambda: TypeSourceRLIEntity.create_type_source_rli('Old'),
+     lambda row_id: TypeSourceRLIEntity.update_type_source_rli(row_id, 'New'),
+     TypeSourceRLIEntity.delete_type_source_rli),
+    (TypeBindingMethodEntity, lambda: TypeBindingMethodEntity.create_type_binding_method('Old'),
+     lambda row_id: TypeBindingMethodEntity.update_type_binding_method(row_id, 'New'),
+     TypeBindingMethodEntity.delete_type_binding_method),
+    (RelatingObjectEntity, lambda: RelatingObjectEntity.create_relating_object(1, 'Old'),
+     lambda row_id: RelatingObjectEntity.update_relating_object(row_id, 2, 'New'),
+     RelatingObjectEntity.delete_relating_object),
+]
+
+
+# Создание, изменение, удаление и update_where сбрасывают кэш справочника, следующее чтение видит изменения
+@pytest.mark.parametrize('entity, create, rename, delete', LOOKUPS)
+def test_writes_invalidate_lookup_cache(database, entity, create, rename, delete):
+    cache = entity.lookup_cache()
+    assert entity.get_all_cached() == []
+
+    row_id = create()
+    assert entity.get_cached(row_id).name == 'Old'
+
+    rename(row_id)
+    assert entity.get_cached(row_id).name == 'New'
+
+    entity.update_where({'name': 'Bulk'}, id=row_id)
+    assert entity.get_cached(row_id).name == 'Bulk'
+
+    delete(row_id)
+    assert entity.get_cached(row_id) is None
+    assert cache.invalidations >= 4
+
+
+def test_repeated_reads_hit_the_cache(database):
+    TypeSessionEntity.create_type_session('Cached')
+    cache = TypeSessionEntity.lookup_cache()
+    hits, misses = cache.hits, cache.misses
+
+    for _ in range(5):
+        assert [row.name for row in TypeSessionEntity.get_all_cached()] == ['Cached']
+
+    assert (cache.hits - hits, cache.misses - misses) == (4, 1)
+    assert lookup_cache_stats()['TypeSessionEntity']['size'] == 1
+
+
+# Загрузка, прочитавшая справочник до изменения и завершившаяся после инвалидации, не сохраняет старые строки
+def test_load_racing_with_invalidation_is_not_cached(database, monkeypatch):
+    row_id = TypeSessionEntity.create_type_session('Old')
+    cache = TypeSessionEntity.lookup_cache()
+    cache.invalidate()
+
+    # Изменение другим потоком между выборкой строк и сохранением их в кэш
+    class RacingSession:
+        def query(self, *columns):
+            rows = session.query(*columns).all()
+            with get_engine().begin() as connection:
+                connection.execute(update(TypeSessionEntity).where(TypeSessionEntity.id == row_id).
+                                   values(name='New'))
+            cache.invalidate()
+            return rows
+
+    monkeypatch.setattr(main, 'session', RacingSession())
+    assert cache.get(row_id).name == 'Old'
+    monkeypatch.undo()
+
+    assert TypeSessionEntity.get_cached(row_id).name == 'New'
+
+
+# Смена базы сбрасывает кэши справочников: строки прежней базы не видны
+def test_configure_database_resets_lookup_cache(database):
+    TypeSessionEntity.create_type_session('First database')
+    assert len(TypeSessionEntity.get_all_cached()) == 1
+
+    configure_database('sqlite:///' + str(database / 'other.db'))
+    init_db()
+
+    assert TypeSessionEntity.get_all_cached() == []
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import synthetic
+from main import session, CoordinatesEntity, MarkEntity
+
+BOX = (10.0, 11.0, 20.0, 21.0)
+
+
+# Функция отбора отметок в прямоугольнике полным перебором по объектам
+def marks_in_box(min_latitude, max_latitude, min_longitude, max_longitude, start=None, end=None, session_id=None):
+    return [mark.id for mark in session.query(MarkEntity).order_by(MarkEntity.id)
+            if min_latitude <= mark.coordinates.latitude <= max_latitude
+            and min_longitude <= mark.coordinates.longitude <= max_longitude
+            and (start is None or mark.datetime >= start) and (end is None or mark.datetime <= end)
+            and (session_id is None or mark.session_id == session_id)]
+
+
+# Две синтетические сессии, возвращает их id
+@pytest.fixture
+def session_ids(database):
+    yield synthetic.generate(sessions=2, files=2, marks=200, regions=0, seed=3)['session_ids']
+    session.remove()
+
+
+# Отметки сессии в прямоугольнике: точки на границах, вплотную за границами (R*Tree хранит границы в float32)
+# и внутри; возвращает {имя точки: id отметки}
+def boundary_marks(session_id):
+    points = {'corner': (10.0, 20.0), 'edge': (11.0, 20.5), 'inside': (10.5, 20.5),
+              'outside_latitude': (11.0 + 1e-9, 20.5), 'outside_longitude': (10.5, 20.0 - 1e-9)}
+    coordinates_ids = CoordinatesEntity.create_coordinates_many((latitude, longitude, 0.0)
+                                                                for latitude, longitude in points.values())
+    mark_ids = MarkEntity.create_mark_many((coordinates_id, session_id, datetime(2024, 6, 1) + timedelta(hours=i))
+                                           for i, coordinates_id in enumerate(coordinates_ids))
+    return dict(zip(points, mark_ids))
+
+
+def test_marks_in_box_match_full_scan(session_ids):
+    rows = session.query(CoordinatesEntity.latitude, CoordinatesEntity.longitude).\
+        join(MarkEntity, MarkEntity.coordinates_id == CoordinatesEntity.id).first()
+    box = (rows.latitude - 0.5, rows.latitude + 0.5, rows.longitude - 0.5, rows.longitude + 0.5)
+
+    ids = [mark.id for mark in MarkEntity.get_marks_in_box(*box)]
+    assert ids and ids == marks_in_box(*box)
+    assert [mark.id for mark in MarkEntity.get_marks_in_box(*box, session_id=session_ids[1])] == \
+        marks_in_box(*box, session_id=session_ids[1])
+
+
+def test_boundaries_are_exact(session_ids):
+    marks = boundary_marks(session_ids[0])
+
+    ids = [row.id for row in MarkEntity.get_marks_in_box(*BOX, columns=['id'])]
+
+    assert ids == [marks['corner'], marks['edge'], marks['inside']]
+
+
+def test_time_window_and_session_filters(session_ids):
+    marks = boundary_marks(session_ids[0])
+
+    window = MarkEntity.get_marks_in_box(*BOX, start=datetime(2024, 6, 1, 1), end=datetime(2024, 6, 1, 2))
+    assert [mark.id for mark in window] == [marks['edge'], marks['inside']]
+    assert MarkEntity.get_marks_in_box(*BOX, session_id=session_ids[1]) == []
+
+
+# Изменение координат обновляет R*Tree: перемещенная отметка выходит из прямоугольника и попадает в новый
+def test_moved_coordinates_follow_the_index(session_ids):
+    marks = boundary_marks(session_ids[0])
+    coordinates_id = MarkEntity.get_by_id(marks['inside']).coordinates_id
+
+    CoordinatesEntity.update_coordinates(coordinates_id, -30.0, -40.0, 0.0)
+
+    assert marks['inside'] not in [mark.id for mark in MarkEntity.get_marks_in_box(*BOX)]
+    assert [mark.id for mark in MarkEntity.get_marks_in_box(-31, -29, -41, -39)] == \
+        marks_in_box(-31, -29, -41, -39)
+    assert marks['inside'] in [mark.id for mark in MarkEntity.get_marks_in_box(-31, -29, -41, -39)]
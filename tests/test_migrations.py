@@ -0,0 +1,82 @@
+import sqlite3
+
+import pytest
+
+from main import configure_database, get_engine, migrate_columns, migrate_meta_indexes, session, Base, FileEntity, \
+    RLIEntity, ObjectEntity
+
+
+# База, созданная до появления колонок: колонки удаляются из готовой базы, затем подключение открывается заново
+def drop_columns(database, table, columns):
+    session.remove()
+    configure_database()
+    connection = sqlite3.connect(str(database / 'test.db'))
+    for column in columns:
+        connection.execute('ALTER TABLE {} DROP COLUMN {}'.format(table, column))
+    connection.commit()
+    connection.close()
+    configure_database('sqlite:///' + str(database / 'test.db'))
+
+
+# Функция получения имен колонок таблицы в файле базы в обход движка
+def file_columns(database, table):
+    connection = sqlite3.connect(str(database / 'test.db'))
+    try:
+        return {row[1] for row in connection.execute('PRAGMA table_info({})'.format(table))}
+    finally:
+        connection.close()
+
+
+# Открытие базы без колонок моделей не изменяет ее, а завершается ошибкой с перечнем колонок
+@pytest.mark.parametrize('table, columns', [('file', ['size', 'mtime_ns']),
+                                            ('rli', ['claimed_by', 'lease_expires_at'])])
+def test_missing_columns_fail_loudly(database, session_id, table, columns):
+    drop_columns(database, table, columns)
+
+    with pytest.raises(RuntimeError, match='{}.{}.*python main.py migrate'.format(table, columns[0])):
+        RLIEntity.get_rli_by_session_id(session_id)
+
+    assert not set(columns) & file_columns(database, table)
+
+
+def test_migrate_adds_file_columns(database, session_id):
+    drop_columns(database, 'file', ['size', 'mtime_ns'])
+
+    assert migrate_columns() == ['file.size', 'file.mtime_ns']
+
+    file_id = session.query(FileEntity.id).order_by(FileEntity.id).limit(1).scalar()
+    FileEntity.update_file(file_id, 'renamed.bin', '/renamed.bin', 'bin', session_id)
+    assert FileEntity.get_by_id(file_id).name == 'renamed.bin'
+    assert len(FileEntity.get_file_signatures(session_id)) == 3
+
+
+def test_migrate_adds_rli_queue_columns(database, session_id):
+    drop_columns(database, 'rli', ['claimed_by', 'lease_expires_at'])
+
+    assert migrate_columns() == ['rli.claimed_by', 'rli.lease_expires_at']
+
+    assert len(RLIEntity.get_rli_by_session_id(session_id)) == 3
+    pending = RLIEntity.get_queue_stats()['pending']
+    assert len(RLIEntity.claim_rli('worker', session_id=session_id)) == pending
+    assert RLIEntity.get_queue_stats()['claimed'] == pending
+
+
+# Выборки по индексируемым ключам meta в базе без генерируемых колонок идут через json_extract
+def test_meta_queries_work_before_meta_columns_are_created(tmp_path):
+    configure_database('sqlite:///' + str(tmp_path / 'test.db'))
+    try:
+        Base.metadata.create_all(bind=get_engine())
+        object_ids = ObjectEntity.create_object_many([(None, 'Ship', 'ship', None, {'class': 'ship', 'speed': 20}),
+                                                      (None, 'Plane', 'aircraft', None, {'class': 'air'})])
+        filters = {'class': 'ship', 'speed': ('>=', 10)}
+
+        assert [row.id for row in ObjectEntity.get_objects_by_meta(filters, ['id'])] == object_ids[:1]
+        assert 'json_extract' in str(ObjectEntity.query_objects_by_meta(filters))
+
+        migrate_meta_indexes()
+
+        assert [row.id for row in ObjectEntity.get_objects_by_meta(filters, ['id'])] == object_ids[:1]
+        assert 'json_extract' not in str(ObjectEntity.query_objects_by_meta(filters))
+    finally:
+        session.remove()
+        configure_database()
@@ -0,0 +1,141 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+
+from main import session, Base, SessionEntity, TypeSessionEntity, TypeSourceRLIEntity, TypeBindingMethodEntity, \
+    RelatingObjectEntity, CoordinatesEntity, ExtentEntity, FileEntity, RawRLIEntity, RasterRLIEntity, \
+    LinkedRLIEntity, MarkEntity, ObjectEntity, RegionEntity
+import synthetic
+
+
+# Функция получения {таблица: число строк} по всем таблицам моделей
+def table_counts():
+    session.remove()
+    return {table.name: session.execute(text('SELECT count(*) FROM {}'.format(table.name))).scalar()
+            for table in Base.metadata.sorted_tables}
+
+
+# Функция проверки целостности: ни одной строки со ссылкой на отсутствующую строку и индексы R*Tree
+# совпадают с таблицами координат и экстентов
+def assert_consistent():
+    session.remove()
+    assert session.execute(text('PRAGMA foreign_key_check')).all() == []
+    for table in ('coordinates', 'extent'):
+        assert session.execute(text('SELECT id FROM {} ORDER BY id'.format(table))).scalars().all() == \
+            session.execute(text('SELECT id FROM {}_rtree ORDER BY id'.format(table))).scalars().all()
+
+
+# Две сессии с одинаковым объемом данных (3 файла, 5 отметок) и регионы
+@pytest.fixture
+def session_ids(database):
+    yield synthetic.generate(sessions=2, files=3, marks=5, regions=2, seed=1)['session_ids']
+    session.remove()
+
+
+@pytest.mark.parametrize('chunk_size', [None, 1, 2])
+def test_purge_sessions_removes_session_subtree(session_ids, chunk_size):
+    before = table_counts()
+
+    counts = SessionEntity.purge_sessions(session_ids[:1], chunk_size)
+
+    after = table_counts()
+    assert counts['session'] == 1
+    assert counts['file'] == 3
+    assert counts['mark'] == 5
+    assert {table: before[table] - after[table] for table in before if before[table] != after[table]} == \
+        {table: count for table, count in counts.items() if count}
+    assert SessionEntity.get_by_id(session_ids[0]) is None
+    assert SessionEntity.get_by_id(session_ids[1]) is not None
+    assert len(FileEntity.get_file_signatures(session_ids[1])) == 3
+    assert len(MarkEntity.get_marks_by_session_id(session_ids[1])) == 5
+    assert_consistent()
+
+
+# Порционное удаление удаляет те же строки, что и удаление одной транзакцией
+def test_chunked_purge_matches_single_transaction(database):
+    results = []
+    for chunk_size in (None, 2):
+        session_id = synthetic.generate(files=3, marks=5, regions=0, seed=1)['session_ids'][0]
+        before = table_counts()
+        SessionEntity.purge_sessions([session_id], chunk_size)
+        results.append({table: before[table] - count for table, count in table_counts().items()})
+    assert results[0] == results[1]
+
+
+# Координаты и экстенты, на которые ссылаются регион или отметка другой сессии, не удаляются
+def test_purge_keeps_shared_coordinates_and_extents(session_ids):
+    raster_rli = session.query(RasterRLIEntity).join(FileEntity, RasterRLIEntity.file_id == FileEntity.id).\
+        filter(FileEntity.session_id == session_ids[0]).order_by(RasterRLIEntity.id).first()
+    extent_id = raster_rli.extent_id
+    corner_ids = [getattr(raster_rli.extent, corner) for corner in ('top_left_id', 'bot_left_id', 'top_right_id',
+                                                                   'bot_right_id')]
+    mark = session.query(MarkEntity).filter(MarkEntity.session_id == session_ids[0]).order_by(MarkEntity.id).first()
+    mark_coordinates_id = mark.coordinates_id
+    session.remove()
+    region_id = RegionEntity.create_region(extent_id, 'Shared region')
+    shared_mark_id = MarkEntity.create_mark(mark_coordinates_id, session_ids[1])
+
+    SessionEntity.purge_sessions(session_ids[:1])
+
+    assert RegionEntity.get_by_id(region_id).extent_id == extent_id
+    assert ExtentEntity.get_by_id(extent_id) is not None
+    assert all(CoordinatesEntity.get_by_id(corner_id) is not None for corner_id in corner_ids)
+    assert MarkEntity.get_by_id(shared_mark_id).coordinates_id == mark_coordinates_id
+    assert CoordinatesEntity.get_by_id(mark_coordinates_id) is not None
+    assert RasterRLIEntity.get_by_id(raster_rli.id) is None
+    assert_consistent()
+
+
+# Координаты и экстенты, на которые больше ничего не ссылается, удаляются вместе с сессией
+def test_purge_removes_unshared_coordinates_and_extents(database):
+    session_id = synthetic.generate(files=3, marks=5, regions=0, seed=1)['session_ids'][0]
+
+    SessionEntity.purge_sessions([session_id])
+
+    counts = table_counts()
+    assert {table: counts[table] for table in ('coordinates', 'extent', 'file', 'mark', 'raster_rli', 'linked_rli',
+                                               'raw_rli', 'rli', 'object', 'target', 'session')} == \
+        dict.fromkeys(['coordinates', 'extent', 'file', 'mark', 'raster_rli', 'linked_rli', 'raw_rli', 'rli',
+                       'object', 'target', 'session'], 0)
+    assert_consistent()
+
+
+# Сессии внутри окна хранения остаются; синтетические сессии датированы 1, 2 и 3 января 2024 года
+def test_purge_sessions_before_keeps_retention_window(database):
+    session_ids = synthetic.generate(sessions=3, files=2, marks=3, seed=1)['session_ids']
+
+    counts = SessionEntity.purge_sessions_before(datetime(2024, 1, 2), chunk_size=1)
+
+    assert counts['session'] == 1
+    assert 'freed_pages' in counts
+    assert [SessionEntity.get_by_id(session_id) is not None for session_id in session_ids] == [False, True, True]
+    assert_consistent()
+
+
+def test_purge_sessions_before_without_expired_sessions(session_ids):
+    before = table_counts()
+
+    assert SessionEntity.purge_sessions_before(datetime(2000, 1, 1)) == {'freed_pages': 0}
+
+    assert table_counts() == before
+
+
+# Удаление строк справочников не удаляет ссылающиеся на них строки
+@pytest.mark.parametrize('lookup, delete, entity, column', [
+    (TypeSessionEntity, 'delete_type_session', SessionEntity, 'type_session_id'),
+    (TypeSourceRLIEntity, 'delete_type_source_rli', RawRLIEntity, 'type_source_rli_id'),
+    (TypeBindingMethodEntity, 'delete_type_binding_method', LinkedRLIEntity, 'type_binding_method_id'),
+    (RelatingObjectEntity, 'delete_relating_object', ObjectEntity, 'relating_object_id'),
+])
+def test_lookup_delete_keeps_referencing_rows(session_ids, lookup, delete, entity, column):
+    lookup_id = session.query(getattr(entity, column)).filter(getattr(entity, column).isnot(None)).\
+        order_by(entity.id).limit(1).scalar()
+    before = table_counts()
+
+    getattr(lookup, delete)(lookup_id)
+
+    after = table_counts()
+    assert lookup.get_by_id(lookup_id) is None
+    assert {table: before[table] - after[table] for table in before if before[table] != after[table]} == \
+        {lookup.__tablename__: 1}
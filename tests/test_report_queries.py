@@ -0,0 +1,52 @@
+import pytest
+from sqlalchemy import event
+
+from main import get_engine, session, Base, FileEntity, XLSReportGeneratorBySessionId, \
+    XLSXReportGeneratorBySessionId, ColumnarReportExporterBySessionId
+import synthetic
+
+
+# Функция подсчета запросов к базе при генерации отчета по сессии с пустыми кэшами сущностей
+def count_report_queries(generator_class, session_id, output_dir):
+    session.remove()
+    for mapper in Base.registry.mappers:
+        mapper.class_._invalidate(None)
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(get_engine(), 'before_cursor_execute', before_cursor_execute)
+    try:
+        generator_class(session_id, output_dir=str(output_dir), incremental=False)
+    finally:
+        event.remove(get_engine(), 'before_cursor_execute', before_cursor_execute)
+    return len(statements)
+
+
+# Число запросов отчета не зависит от размера сессии: строки листов читаются одним запросом на лист
+@pytest.mark.parametrize('generator_class', [XLSReportGeneratorBySessionId, XLSXReportGeneratorBySessionId,
+                                             ColumnarReportExporterBySessionId])
+def test_report_query_count_does_not_depend_on_session_size(database, generator_class):
+    small = synthetic.generate(files=3, marks=10, seed=1)['session_ids'][0]
+    large = synthetic.generate(files=300, marks=1000, linked_per_raster=2, targets_per_raster=3,
+                               seed=2)['session_ids'][0]
+
+    small_count = count_report_queries(generator_class, small, database / 'small')
+    large_count = count_report_queries(generator_class, large, database / 'large')
+
+    assert small_count == large_count
+    assert small_count < 20
+
+
+# Отчет по умолчанию строится заново: изменения строк без новых id (update_file) попадают в повторный отчет
+def test_report_reflects_in_place_updates_by_default(database):
+    session_id = synthetic.generate(files=2, marks=5, seed=1)['session_ids'][0]
+    ColumnarReportExporterBySessionId(session_id, output_dir=str(database))
+    file_row = FileEntity.get_by_id(session.query(FileEntity.id).order_by(FileEntity.id).limit(1).scalar())
+
+    FileEntity.update_file(file_row.id, 'renamed.bin', file_row.path_to_file, file_row.file_extension, session_id)
+    report = ColumnarReportExporterBySessionId(session_id, output_dir=str(database))
+
+    with open(report.file_paths[0], encoding='utf-8') as report_file:
+        assert 'renamed.bin' in report_file.read()
@@ -0,0 +1,50 @@
+import threading
+import warnings
+
+import pytest
+
+from main import session, CoordinatesEntity
+from sql_profile import SQLProfiler, NPlusOneWarning
+
+
+@pytest.fixture
+def profiler(database):
+    profiler = SQLProfiler().enable()
+    yield profiler
+    profiler.disable()
+
+
+@pytest.fixture
+def coordinates_ids(database):
+    return CoordinatesEntity.create_coordinates_many([(i, i, 0) for i in range(20)])
+
+
+# Повторные вызовы операции в цикле - отдельные вызовы, а не один вызов с повторяющимся запросом
+def test_repeated_operation_calls_are_counted_separately(profiler, coordinates_ids):
+    CoordinatesEntity._invalidate(None)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', NPlusOneWarning)
+        for coordinates_id in coordinates_ids:
+            CoordinatesEntity.get_by_id(coordinates_id)
+
+    stats = profiler.profile()['operations']['CoordinatesEntity.get_by_id']
+    assert stats['calls'] == len(coordinates_ids)
+    assert stats['statements'] == len(coordinates_ids)
+
+
+# Вызовы завершившихся потоков переносятся в статистику
+def test_exited_thread_calls_are_finished(profiler, coordinates_ids):
+    CoordinatesEntity._invalidate(None)
+
+    def read(coordinates_id):
+        CoordinatesEntity.get_by_id(coordinates_id)
+        session.remove()
+
+    for coordinates_id in coordinates_ids[:5]:
+        thread = threading.Thread(target=read, args=(coordinates_id,))
+        thread.start()
+        thread.join()
+    CoordinatesEntity.get_by_id(coordinates_ids[5])
+
+    assert len(profiler.calls) <= threading.active_count()
+    assert profiler.profile()['operations']['CoordinatesEntity.get_by_id']['calls'] == 6
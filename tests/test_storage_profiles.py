@@ -0,0 +1,35 @@
+import pytest
+from sqlalchemy import text
+
+from main import session, use_storage_profile, STORAGE_PROFILES
+
+# Значения, которые SQLite возвращает при чтении прагм, заданных профилями именами режимов
+PRAGMA_VALUES = {'WAL': 'wal', 'NORMAL': 1, 'FULL': 2, 'MEMORY': 2}
+
+
+@pytest.fixture
+def profile_database(database):
+    yield database
+    use_storage_profile('default')
+
+
+# Новые подключения получают прагмы выбранного профиля
+@pytest.mark.parametrize('profile', [profile for profile in STORAGE_PROFILES if STORAGE_PROFILES[profile]])
+def test_profile_pragmas_are_applied(profile_database, profile):
+    use_storage_profile(profile)
+
+    for pragma, value in STORAGE_PROFILES[profile].items():
+        assert session.execute(text('PRAGMA {}'.format(pragma))).scalar() == PRAGMA_VALUES.get(value, value), pragma
+
+
+# Профиль по умолчанию не меняет прагмы SQLite, в том числе не включает внешние ключи
+def test_default_profile_keeps_sqlite_defaults(profile_database):
+    use_storage_profile('default')
+
+    assert session.execute(text('PRAGMA journal_mode')).scalar() == 'delete'
+    assert session.execute(text('PRAGMA foreign_keys')).scalar() == 0
+
+
+def test_unknown_profile_is_rejected(profile_database):
+    with pytest.raises(ValueError, match='Unknown storage profile'):
+        use_storage_profile('fast')
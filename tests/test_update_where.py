@@ -0,0 +1,75 @@
+import pytest
+
+from main import session, RLIEntity, FileEntity
+import synthetic
+
+
+# Функция получения {id: значение колонки} всех строк сущности
+def column_values(entity, column):
+    session.remove()
+    return dict(session.query(entity.id, getattr(entity, column)))
+
+
+def test_update_where_changes_session_rows(session_id):
+    assert RLIEntity.update_where({'is_processing': True}, session_id=session_id) == 3
+    assert session.query(RLIEntity).filter(RLIEntity.is_processing.is_(False)).count() == 0
+
+
+# Строки других сессий update_where с session_id не меняет
+def test_update_where_keeps_other_sessions(session_id):
+    synthetic.generate(files=2, marks=5, seed=2)
+
+    FileEntity.update_where({'name': 'renamed.bin'}, session_id=session_id)
+
+    sessions = column_values(FileEntity, 'session_id')
+    names = column_values(FileEntity, 'name')
+    assert sorted((sessions[file_id], name == 'renamed.bin') for file_id, name in names.items()) == \
+        [(session_id, True)] * 3 + [(session_id + 1, False)] * 2
+
+
+def test_update_where_by_plain_criteria(session_id):
+    rli_id = min(column_values(RLIEntity, 'name'))
+
+    assert RLIEntity.update_where({'name': 'Renamed'}, id=rli_id) == 1
+
+    names = column_values(RLIEntity, 'name')
+    assert names[rli_id] == 'Renamed'
+    assert sum(name == 'Renamed' for name in names.values()) == 1
+
+
+def test_update_where_by_in_list(session_id):
+    rli_ids = sorted(column_values(RLIEntity, 'name'))[:2]
+
+    assert RLIEntity.update_where({'name': 'Renamed'}, id=rli_ids) == 2
+
+    names = column_values(RLIEntity, 'name')
+    assert sorted(rli_id for rli_id, name in names.items() if name == 'Renamed') == rli_ids
+
+
+def test_update_where_by_none_criteria(session_id):
+    RLIEntity.update_where({'claimed_by': 'worker'}, id=min(column_values(RLIEntity, 'name')))
+
+    assert RLIEntity.update_where({'claimed_by': 'other'}, claimed_by=None) == 2
+
+    assert sorted(column_values(RLIEntity, 'claimed_by').values()) == ['other', 'other', 'worker']
+
+
+def test_update_where_with_expression_conditions(session_id):
+    rli_ids = sorted(column_values(RLIEntity, 'name'))
+
+    assert RLIEntity.update_where({'name': 'Renamed'}, RLIEntity.id > rli_ids[0]) == 2
+
+
+# Массовое изменение сбрасывает кэш get_by_id: строки, прочитанные до изменения, перечитываются
+def test_update_where_invalidates_identity_cache(session_id):
+    rli_ids = sorted(column_values(RLIEntity, 'name'))
+    before = [RLIEntity.get_by_id(rli_id).name for rli_id in rli_ids]
+
+    RLIEntity.update_where({'name': 'Renamed'}, id=rli_ids[1:])
+
+    assert [RLIEntity.get_by_id(rli_id).name for rli_id in rli_ids] == before[:1] + ['Renamed', 'Renamed']
+
+
+def test_update_where_requires_values(session_id):
+    with pytest.raises(ValueError):
+        RLIEntity.update_where({}, session_id=session_id)
@@ -0,0 +1,41 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+
+import main
+from main import generate_reports, RLIEntity
+import synthetic
+import work_queue
+
+
+# Пул процессов, запускаемых spawn: процессы не наследуют configure_database родителя
+def spawn_executor(*args, **kwargs):
+    return ProcessPoolExecutor(*args, mp_context=multiprocessing.get_context('spawn'), **kwargs)
+
+
+# Подмена пула процессов на spawn; база по умолчанию для процессов - пустая, а не база родителя
+def use_spawn(module, database, monkeypatch):
+    monkeypatch.setattr(module, 'ProcessPoolExecutor', spawn_executor)
+    monkeypatch.setenv('RLSDB_URL', 'sqlite:///' + str(database / 'default.db'))
+
+
+# Отчеты в процессах spawn строятся по базе родителя, а не по базе по умолчанию
+def test_generate_reports_uses_parent_database_in_spawned_workers(database, monkeypatch):
+    use_spawn(main, database, monkeypatch)
+    session_id = synthetic.generate(files=2, marks=5, seed=1)['session_ids'][0]
+
+    results = generate_reports([session_id], output_dir=str(database), processes=1)
+
+    assert [result['error'] for result in results] == [None]
+    assert os.path.dirname(results[0]['file_path']) == str(database)
+
+
+# Очередь РЛИ в процессах spawn обрабатывается в базе родителя
+def test_run_workers_uses_parent_database_in_spawned_workers(database, monkeypatch):
+    use_spawn(work_queue, database, monkeypatch)
+    RLIEntity.create_rli_many(('RLI {}'.format(i), False, None) for i in range(10))
+
+    result = work_queue.run_workers(work_queue.noop_handler, workers=1, processes=True)
+
+    assert result['completed'] == 10
+    assert RLIEntity.get_queue_stats()['pending'] == 0
@@ -0,0 +1,50 @@
+import re
+import zipfile
+
+import pytest
+
+from main import session, RawRLIEntity, FileEntity, XLSXReportGeneratorBySessionId
+import synthetic
+
+pytest.importorskip('xlsxwriter')
+
+
+# Генератор с маленьким лимитом строк: заголовок и 3 строки данных на лист
+class SmallSheetsGenerator(XLSXReportGeneratorBySessionId):
+    max_rows_per_sheet = 4
+
+
+# Функция чтения книги XLSX без сторонних библиотек: [(наименование листа, число строк с заголовком)]
+def read_sheets(file_path):
+    with zipfile.ZipFile(file_path) as workbook:
+        names = re.findall(r'<sheet name="([^"]*)"', workbook.read('xl/workbook.xml').decode('utf-8'))
+        return [(name, workbook.read('xl/worksheets/sheet{}.xml'.format(i)).decode('utf-8').count('<row '))
+                for i, name in enumerate(names, 1)]
+
+
+# Листы, не помещающиеся в лимит строк, продолжаются на листах "<наименование> (N)" длиной не более 31 символа
+def test_rows_continue_on_numbered_sheets(database):
+    session_id = synthetic.generate(files=8, marks=5, seed=1)['session_ids'][0]
+    raw_rli_count = RawRLIEntity.query_ids_by_session_id(session_id).count()
+    session.remove()
+
+    report = SmallSheetsGenerator(session_id, output_dir=str(database))
+    sheets = read_sheets(report.file_path)
+
+    raw_rli_sheets = [(name, rows) for name, rows in sheets
+                      if name.startswith(report.raw_rli_sheet_name[:27])]
+    assert [name for name, _ in raw_rli_sheets] == [report.raw_rli_sheet_name] + [
+        report.raw_rli_sheet_name[:27] + ' ({})'.format(part) for part in (2, 3)]
+    assert [rows for _, rows in raw_rli_sheets] == [4, 4, 3]
+    assert sum(rows - 1 for _, rows in raw_rli_sheets) == raw_rli_count
+    assert all(len(name) <= 31 for name, _ in sheets)
+    assert len({name for name, _ in sheets}) == len(sheets)
+
+
+# Сессия, помещающаяся в лимит, дает по одному листу на отчет с полными наименованиями
+def test_small_session_fits_on_one_sheet(session_id, database):
+    report = XLSXReportGeneratorBySessionId(session_id, output_dir=str(database))
+
+    sheets = read_sheets(report.file_path)
+    assert [name for name, _ in sheets] == [report.raw_rli_sheet_name, report.targets_sheet_name]
+    assert sheets[0][1] == FileEntity.query_ids_by_session_id(session_id).count() + 1
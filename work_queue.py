@@ -0,0 +1,107 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+import os
+import socket
+import sys
+import tempfile
+import time
+
+from main import configure_database, init_db, session, _init_worker_process, _worker_initargs, RLIEntity
+
+# Число РЛИ, захватываемых обработчиком за один запрос, и длительность захвата в секундах
+BATCH_SIZE = 100
+LEASE_SECONDS = 300
+
+
+# Функция-обработчик по умолчанию для бенчмарка: РЛИ считается обработанным сразу
+def noop_handler(rli):
+    return True
+
+
+# Функция цикла одного обработчика очереди: захватывает пачку РЛИ, вызывает handler(строка РЛИ) для каждой
+# и одним запросом отмечает обработанными те, для которых handler вернул истину. РЛИ, на которых handler
+# вернул ложь, возвращаются в очередь; РЛИ, на которых он выбросил исключение, остаются захваченными до
+# истечения захвата и затем достаются любому обработчику. Цикл завершается, когда захватить нечего.
+# Возвращает счетчики обработчика
+def run_worker(worker, handler, batch_size=BATCH_SIZE, lease_seconds=LEASE_SECONDS, session_id=None):
+    stats = {'worker': worker, 'batches': 0, 'claimed': 0, 'completed': 0, 'released': 0, 'failed': 0,
+             'claim_seconds': 0.0, 'seconds': 0.0}
+    start = time.perf_counter()
+    try:
+        while True:
+            claim_start = time.perf_counter()
+            rows = RLIEntity.claim_rli(worker, batch_size, lease_seconds, session_id)
+            stats['claim_seconds'] += time.perf_counter() - claim_start
+            if not rows:
+                break
+            done, rejected = [], []
+            for row in rows:
+                try:
+                    (done if handler(row) else rejected).append(row.id)
+                except Exception:
+                    stats['failed'] += 1
+            stats['batches'] += 1
+            stats['claimed'] += len(rows)
+            stats['completed'] += RLIEntity.complete_rli(done, worker)
+            stats['released'] += RLIEntity.release_rli(rejected, worker)
+    finally:
+        session.remove()
+        stats['seconds'] = time.perf_counter() - start
+    return stats
+
+
+# Индекс справедливости Джайна по числу обработанных РЛИ: 1 - обработчики получили поровну, 1/n - все досталось
+# одному из n обработчиков
+def fairness_index(counts):
+    total = sum(counts)
+    squares = sum(count * count for count in counts)
+    return total * total / (len(counts) * squares) if squares else 1.0
+
+
+# Функция обработки очереди РЛИ пулом из workers обработчиков: потоков или, при processes=True, процессов
+# (handler тогда должен быть функцией уровня модуля). Имена обработчиков - хост:pid:номер.
+# Возвращает счетчики каждого обработчика, общее число обработанных РЛИ, РЛИ в секунду и индекс справедливости
+def run_workers(handler, workers=4, processes=False, batch_size=BATCH_SIZE, lease_seconds=LEASE_SECONDS,
+                session_id=None):
+    names = ['{}:{}:{}'.format(socket.gethostname(), os.getpid(), number) for number in range(workers)]
+    if processes:
+        executor = ProcessPoolExecutor(workers, initializer=_init_worker_process, initargs=_worker_initargs())
+    else:
+        executor = ThreadPoolExecutor(workers, thread_name_prefix='rlsdb-queue')
+    start = time.perf_counter()
+    with executor:
+        results = list(executor.map(run_worker, names, repeat(handler), repeat(batch_size), repeat(lease_seconds),
+                                    repeat(session_id)))
+    seconds = time.perf_counter() - start
+    completed = sum(result['completed'] for result in results)
+    return {'workers': results, 'completed': completed, 'seconds': seconds,
+            'per_second': completed / seconds if seconds else 0.0,
+            'fairness': fairness_index([result['completed'] for result in results])}
+
+
+# Бенчмарк очереди на временной базе из rows РЛИ: для каждого числа обработчиков из workers очередь
+# сбрасывается и обрабатывается заново. Возвращает {число обработчиков: результат run_workers}
+def benchmark(rows=20000, workers=(1, 2, 4, 8), processes=True, batch_size=BATCH_SIZE, handler=noop_handler):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        configure_database('sqlite:///' + os.path.join(directory, 'queue.db'))
+        try:
+            init_db()
+            RLIEntity.create_rli_many(('RLI {}'.format(i), False, None) for i in range(rows))
+            for count in workers:
+                # Временная база содержит только РЛИ бенчмарка: сброс очереди - один UPDATE без условий
+                RLIEntity.update_where({'is_processing': False, 'claimed_by': None, 'lease_expires_at': None})
+                results[count] = run_workers(handler, count, processes, batch_size)
+        finally:
+            session.remove()
+            configure_database()
+    return results
+
+
+if __name__ == '__main__':
+    # python work_queue.py [rows] [batch_size] - бенчмарк очереди РЛИ пулами из 1, 2, 4 и 8 процессов
+    arguments = [int(argument) for argument in sys.argv[1:3]]
+    keywords = dict(zip(['rows', 'batch_size'], arguments))
+    for worker_count, result in benchmark(**keywords).items():
+        print('{} workers: {completed} RLI in {seconds:.2f} s, {per_second:.0f} RLI/s, fairness {fairness:.3f}, '
+              'per worker {}'.format(worker_count, [worker['completed'] for worker in result['workers']], **result))